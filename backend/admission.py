@@ -0,0 +1,293 @@
+"""
+Admission control for LLM-backed endpoints: per-client token buckets and a
+global concurrency quota with a short bounded wait queue
+"""
+
+import asyncio
+import math
+import os
+import time
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+from enum import IntEnum
+from typing import Deque, Dict, Optional, Tuple
+
+from memory_report import measure
+
+
+class AdmissionRejected(Exception):
+    """Raised when a request is refused; carries the Retry-After hint in seconds"""
+
+    def __init__(self, reason: str, retry_after: int):
+        super().__init__(reason)
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class TokenBucket:
+    """Classic token bucket refilled continuously at `rate` tokens per second"""
+
+    __slots__ = ("rate", "capacity", "tokens", "updated_at")
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated_at = time.monotonic()
+
+    def try_take(self) -> float:
+        """Take one token; returns 0 on success, otherwise seconds until one is available"""
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+
+class LLMPriority(IntEnum):
+    """LLM capacity classes, most latency-sensitive first"""
+    CHAT = 0
+    PLAN = 1
+    BATCH = 2
+
+
+DEFAULT_PRIORITY_WEIGHTS = {LLMPriority.CHAT: 8, LLMPriority.PLAN: 3, LLMPriority.BATCH: 1}
+
+
+def parse_priority_weights(spec: str) -> Dict[LLMPriority, int]:
+    """Parse 'chat:8,plan:3,batch:1' into class weights"""
+    weights = dict(DEFAULT_PRIORITY_WEIGHTS)
+    for part in spec.split(","):
+        name, _, weight = part.partition(":")
+        if name.strip().upper() in LLMPriority.__members__ and weight.strip().isdigit():
+            weights[LLMPriority[name.strip().upper()]] = max(1, int(weight))
+    return weights
+
+
+class PriorityLimiter:
+    """Caps in-flight LLM calls and hands free slots to waiting classes by weight.
+
+    Slots go to the queued classes by smooth weighted round-robin; a waiter older
+    than the starvation limit is served first; the last reserved slots are only
+    given to chat so interactive turns never queue behind plan generation.
+    Batch work waits without a deadline; chat and plan waits are bounded.
+    """
+
+    def __init__(self, max_concurrent: int, max_queue: int, max_wait: float):
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.max_wait = max_wait
+        self.weights = parse_priority_weights(os.getenv("LLM_PRIORITY_WEIGHTS", ""))
+        self.starvation_seconds = float(os.getenv("LLM_STARVATION_SECONDS", "5"))
+        self.reserved_for_chat = min(int(os.getenv("LLM_CHAT_RESERVED_SLOTS", "1")), max_concurrent - 1)
+        self.in_flight = 0
+        self._queues: Dict[LLMPriority, Deque[Tuple[asyncio.Future, float]]] = {
+            priority: deque() for priority in LLMPriority
+        }
+        self._credit = {priority: 0 for priority in LLMPriority}
+        self._class_stats = {
+            priority: {"granted": 0, "rejected": 0, "starvation_grants": 0, "waits": deque(maxlen=1024)}
+            for priority in LLMPriority
+        }
+
+    @property
+    def waiting(self) -> int:
+        return sum(self._depth(priority) for priority in LLMPriority)
+
+    def _depth(self, priority: LLMPriority) -> int:
+        return sum(1 for future, _ in self._queues[priority] if not future.done())
+
+    def _has_free_slot(self, priority: LLMPriority) -> bool:
+        limit = self.max_concurrent if priority == LLMPriority.CHAT else self.max_concurrent - self.reserved_for_chat
+        return self.in_flight < limit
+
+    def _grant(self, priority: LLMPriority, waited: float):
+        self.in_flight += 1
+        stats = self._class_stats[priority]
+        stats["granted"] += 1
+        stats["waits"].append(waited)
+
+    async def acquire(self, priority: LLMPriority = LLMPriority.CHAT):
+        # Fast path: free slot and nobody of equal or higher priority waiting
+        if self._has_free_slot(priority) and not any(self._depth(p) for p in LLMPriority if p <= priority):
+            self._grant(priority, 0.0)
+            return
+
+        if priority != LLMPriority.BATCH and self.waiting >= self.max_queue:
+            self._class_stats[priority]["rejected"] += 1
+            raise AdmissionRejected("LLM capacity queue is full", math.ceil(self.max_wait))
+
+        future = asyncio.get_running_loop().create_future()
+        self._queues[priority].append((future, time.monotonic()))
+        self._dispatch()
+        timeout = None if priority == LLMPriority.BATCH else self.max_wait
+        try:
+            await asyncio.wait_for(future, timeout=timeout)
+        except asyncio.TimeoutError:
+            self._class_stats[priority]["rejected"] += 1
+            raise AdmissionRejected("Timed out waiting for LLM capacity", math.ceil(self.max_wait))
+        except asyncio.CancelledError:
+            # Granted just before the caller went away: hand the slot back
+            if future.done() and not future.cancelled():
+                self.release()
+            raise
+
+    def release(self):
+        self.in_flight -= 1
+        self._dispatch()
+
+    def _next_class(self) -> Optional[LLMPriority]:
+        now = time.monotonic()
+        ready = []
+        for priority, queue in self._queues.items():
+            while queue and queue[0][0].done():
+                queue.popleft()
+            if queue and self._has_free_slot(priority):
+                ready.append(priority)
+        if not ready:
+            return None
+
+        # Starvation guard: the oldest over-limit waiter goes first
+        starving = [p for p in ready if now - self._queues[p][0][1] >= self.starvation_seconds]
+        if starving:
+            chosen = min(starving, key=lambda p: self._queues[p][0][1])
+            self._class_stats[chosen]["starvation_grants"] += 1
+            return chosen
+
+        # Smooth weighted round-robin between the classes that have waiters
+        total = 0
+        for priority in ready:
+            self._credit[priority] += self.weights[priority]
+            total += self.weights[priority]
+        chosen = max(ready, key=lambda p: (self._credit[p], -p))
+        self._credit[chosen] -= total
+        return chosen
+
+    def _dispatch(self):
+        while True:
+            priority = self._next_class()
+            if priority is None:
+                return
+            future, enqueued_at = self._queues[priority].popleft()
+            self._grant(priority, time.monotonic() - enqueued_at)
+            future.set_result(None)
+
+    def get_class_metrics(self) -> Dict:
+        metrics = {}
+        for priority, stats in self._class_stats.items():
+            waits = sorted(stats["waits"])
+            metrics[priority.name.lower()] = {
+                "weight": self.weights[priority],
+                "queue_depth": self._depth(priority),
+                "granted": stats["granted"],
+                "rejected": stats["rejected"],
+                "starvation_grants": stats["starvation_grants"],
+                "wait_ms_avg": round(sum(waits) / len(waits) * 1000, 2) if waits else 0.0,
+                "wait_ms_p99": round(waits[min(len(waits) - 1, int(len(waits) * 0.99))] * 1000, 2) if waits else 0.0
+            }
+        return metrics
+
+
+class AdmissionController:
+    """Per-client rate limiting plus the global LLM concurrency quota"""
+
+    def __init__(self):
+        self.enabled = os.getenv("ADMISSION_ENABLED", "True").lower() == "true"
+        self.rate = float(os.getenv("ADMISSION_RATE_PER_MINUTE", "20")) / 60
+        self.burst = float(os.getenv("ADMISSION_BURST", "5"))
+        self.max_clients = int(os.getenv("ADMISSION_MAX_CLIENTS", "10000"))
+        self.limiter = PriorityLimiter(
+            max_concurrent=int(os.getenv("LLM_MAX_CONCURRENCY", "8")),
+            max_queue=int(os.getenv("LLM_MAX_QUEUE", "16")),
+            max_wait=float(os.getenv("LLM_QUEUE_TIMEOUT_SECONDS", "2"))
+        )
+        # Least recently seen clients are evicted once max_clients is reached
+        self._buckets: "OrderedDict[str, TokenBucket]" = OrderedDict()
+        self.stats = {"admitted": 0, "rate_limited": 0, "queue_rejected": 0}
+
+    def check_rate(self, client_key: str):
+        """Take a token from the client's bucket or raise AdmissionRejected"""
+        bucket = self._buckets.get(client_key)
+        if bucket is None:
+            bucket = TokenBucket(self.rate, self.burst)
+            self._buckets[client_key] = bucket
+            if len(self._buckets) > self.max_clients:
+                self._buckets.popitem(last=False)
+        else:
+            self._buckets.move_to_end(client_key)
+
+        wait_seconds = bucket.try_take()
+        if wait_seconds:
+            self.stats["rate_limited"] += 1
+            raise AdmissionRejected("Rate limit exceeded", max(1, math.ceil(wait_seconds)))
+
+    @asynccontextmanager
+    async def admit(self, client_key: str, priority: LLMPriority = LLMPriority.CHAT):
+        """Rate limit the client, then hold a global LLM slot of the given class for the block"""
+        if self.enabled:
+            self.check_rate(client_key)
+        async with self.slot(priority):
+            yield
+
+    @asynccontextmanager
+    async def slot(self, priority: LLMPriority):
+        """Hold a global LLM slot of the given class for the duration of the block"""
+        if not self.enabled:
+            yield
+            return
+
+        try:
+            await self.limiter.acquire(priority)
+        except AdmissionRejected:
+            self.stats["queue_rejected"] += 1
+            raise
+
+        self.stats["admitted"] += 1
+        try:
+            yield
+        finally:
+            self.limiter.release()
+
+    def memory_usage(self, sample_size: int) -> Dict:
+        """Size of the per-client token buckets"""
+        return measure(self._buckets, sample_size)
+
+    def get_metrics(self) -> Dict:
+        return {
+            **self.stats,
+            "enabled": self.enabled,
+            "tracked_clients": len(self._buckets),
+            "in_flight": self.limiter.in_flight,
+            "waiting": self.limiter.waiting,
+            "max_concurrency": self.limiter.max_concurrent,
+            "classes": self.limiter.get_class_metrics()
+        }
+
+
+def _env_set(name: str) -> frozenset:
+    return frozenset(item.strip() for item in os.getenv(name, "").split(",") if item.strip())
+
+
+# API keys that get their own rate-limit bucket; unknown keys are ignored so they
+# cannot be rotated to get a fresh bucket per request
+KNOWN_API_KEYS = _env_set("ADMISSION_API_KEYS")
+# Reverse proxies whose X-Forwarded-For header is trusted for the client address
+TRUSTED_PROXIES = _env_set("ADMISSION_TRUSTED_PROXIES")
+
+
+def client_key_for(api_key: Optional[str], client_host: Optional[str], forwarded_for: Optional[str] = None) -> str:
+    """Identify a client by a known API key, otherwise by IP address (forwarded only by a trusted proxy)"""
+    if api_key and api_key in KNOWN_API_KEYS:
+        return f"key:{api_key}"
+    if forwarded_for and client_host in TRUSTED_PROXIES:
+        # The proxy appends the address it saw, so the last untrusted hop is the client
+        for hop in reversed([part.strip() for part in forwarded_for.split(",") if part.strip()]):
+            if hop not in TRUSTED_PROXIES:
+                return f"ip:{hop}"
+    return f"ip:{client_host or 'unknown'}"
+
+
+# Global controller instance
+admission_controller = AdmissionController()
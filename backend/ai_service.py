@@ -3,13 +3,70 @@ Gemini AI Integration Service for FastAPI Backend
 """
 
 import os
+import time
 import asyncio
-from typing import List, Optional
+import orjson
+from datetime import timedelta
+from typing import Dict, List, Optional, Tuple
 from models import ChatMessage, UserAnswers, AIResponse
+from llm_telemetry import OUTCOME_EMPTY, OUTCOME_EXCEPTION, OUTCOME_OK, llm_telemetry, response_usage
+from prompt_batcher import PromptBatcher
+from resilience import CircuitBreaker, ResilientCaller, RetryBudget
 from dotenv import load_dotenv
 
 load_dotenv()
 
+# Static parts of the next-question prompt; the conversation context goes between them
+QUESTION_GUIDE = """Financial advisor collecting investment profile. Required: 4 core + 4 optional fields:
+
+CORE (Priority):
+1. Monthly amount ($ number)
+2. Investment preference (conservative/moderate/aggressive)  
+3. Risk tolerance (low/medium/high)
+4. Financial goal (retirement/house/education/emergency)
+
+OPTIONAL (Better profiling):
+5. Age (years)
+6. Income level (annual salary range)
+7. Investment experience (beginner/intermediate/advanced)
+8. Time horizon (short/medium/long term)"""
+
+QUESTION_RULES = """Ask ONE direct question for missing core info first, then optional. Be concise (1-2 sentences).
+
+Examples:
+- "What monthly amount can you invest? ($500, $1000, $2000)"
+- "Risk tolerance: low/medium/high?"
+- "What's your age range? (20s, 30s, 40s, 50s+)"
+- "Investment experience: beginner/intermediate/advanced?"
+
+Response: ONE focused question only."""
+
+# Keyed answers for a micro-batch of next-question prompts
+QUESTION_BATCH_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "answers": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {
+                    "key": {"type": "string"},
+                    "question": {"type": "string"}
+                },
+                "required": ["key", "question"]
+            }
+        }
+    },
+    "required": ["answers"]
+}
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough local token estimate (~4 characters per token) for prompt size reporting"""
+    if not text:
+        return 0
+    return max(1, (len(text) + 3) // 4)
+
 
 class GeminiService:
     """Service class for Gemini AI integration"""
@@ -23,12 +80,37 @@ class GeminiService:
         try:
             import google.generativeai as genai
             genai.configure(api_key=self.api_key)
-            self.model = genai.GenerativeModel('gemini-1.5-flash')
+            self.model_name = 'gemini-1.5-flash'
+            self.model = genai.GenerativeModel(self.model_name)
             print(f"✅ Gemini AI service initialized successfully")
         except ImportError:
             raise ImportError("google-generativeai package not installed. Run: pip install google-generativeai")
         except Exception as e:
             raise Exception(f"Failed to initialize Gemini AI: {e}")
+        
+        # Models bound to a static system instruction, keyed by the instruction text.
+        # Value is (model, expiry) - expiry only applies to cached-context models.
+        self._instruction_models: Dict[str, Tuple[object, Optional[float]]] = {}
+        self.context_cache_enabled = os.getenv("GEMINI_CONTEXT_CACHE", "False").lower() == "true"
+        self.context_cache_model = os.getenv("GEMINI_CONTEXT_CACHE_MODEL", "models/gemini-1.5-flash-001")
+        self.context_cache_ttl_minutes = int(os.getenv("GEMINI_CONTEXT_CACHE_TTL_MINUTES", "60"))
+        
+        # Deadlines, retries, hedging and circuit breaker around every Gemini call
+        self.resilience = ResilientCaller(
+            timeout=float(os.getenv("GEMINI_TIMEOUT_SECONDS", "10")),
+            deadline=float(os.getenv("GEMINI_DEADLINE_SECONDS", "25")),
+            max_retries=int(os.getenv("GEMINI_MAX_RETRIES", "2")),
+            retry_budget=RetryBudget(ratio=float(os.getenv("GEMINI_RETRY_BUDGET_RATIO", "0.2"))),
+            breaker=CircuitBreaker(
+                failure_threshold=int(os.getenv("GEMINI_BREAKER_FAILURES", "5")),
+                reset_timeout=float(os.getenv("GEMINI_BREAKER_RESET_SECONDS", "30"))
+            ),
+            hedge_enabled=os.getenv("GEMINI_HEDGE", "False").lower() == "true",
+            hedge_delay=float(os.getenv("GEMINI_HEDGE_DELAY_SECONDS", "2"))
+        )
+        
+        # Optional micro-batching of concurrent next-question prompts
+        self.question_batcher = PromptBatcher(self._ask_question_batch, self._ask_question)
     
     async def chat(self, prompt: str, answers: Optional['UserAnswers'] = None) -> AIResponse:
         """Main chat method using Gemini AI"""
@@ -57,40 +139,13 @@ class GeminiService:
                     options=None
                 )
             
-            # Create concise prompt to minimize tokens
-            enhanced_prompt = f"""Financial advisor collecting investment profile. Required: 4 core + 4 optional fields:
-
-CORE (Priority):
-1. Monthly amount ($ number)
-2. Investment preference (conservative/moderate/aggressive)  
-3. Risk tolerance (low/medium/high)
-4. Financial goal (retirement/house/education/emergency)
-
-OPTIONAL (Better profiling):
-5. Age (years)
-6. Income level (annual salary range)
-7. Investment experience (beginner/intermediate/advanced)
-8. Time horizon (short/medium/long term)
-
-Context: {prompt}
-
-Ask ONE direct question for missing core info first, then optional. Be concise (1-2 sentences).
-
-Examples:
-- "What monthly amount can you invest? ($500, $1000, $2000)"
-- "Risk tolerance: low/medium/high?"
-- "What's your age range? (20s, 30s, 40s, 50s+)"
-- "Investment experience: beginner/intermediate/advanced?"
-
-Response: ONE focused question only."""
-
-            # Call Gemini API
-            import google.generativeai as genai
-            response = self.model.generate_content(enhanced_prompt)
+            # Call Gemini API (raises CircuitOpenError straight away while degraded);
+            # with micro-batching on, concurrent prompts share one request
+            text = await self.question_batcher.submit(prompt)
             
-            if response.text:
+            if text:
                 return AIResponse(
-                    message=response.text.strip(),
+                    message=text,
                     options=None  # No options - free text input
                 )
             else:
@@ -109,6 +164,141 @@ Response: ONE focused question only."""
                 options=None
             )
     
+    async def _ask_question(self, prompt: str) -> str:
+        """One next-question prompt as its own Gemini request"""
+        enhanced_prompt = f"{QUESTION_GUIDE}\n\nContext: {prompt}\n\n{QUESTION_RULES}"
+        response = await self._observed_call(
+            "question", enhanced_prompt,
+            lambda: self.model.generate_content_async(enhanced_prompt)
+        )
+        return response.text.strip() if response.text else ""
+    
+    async def _ask_question_batch(self, prompts: Dict[str, str]) -> Dict[str, str]:
+        """Several next-question prompts in one Gemini request, answered by key"""
+        conversations = "\n\n".join(f"[{key}]\nContext: {prompt}" for key, prompt in prompts.items())
+        batch_prompt = f"""{QUESTION_GUIDE}
+
+{QUESTION_RULES}
+
+Below are {len(prompts)} independent conversations, each tagged with a key. Answer every one separately.
+Return JSON: {{"answers": [{{"key": "<key>", "question": "<ONE focused question>"}}]}}
+
+{conversations}"""
+        response = await self._observed_call(
+            "question_batch", batch_prompt,
+            lambda: self.model.generate_content_async(
+                batch_prompt,
+                generation_config={
+                    "response_mime_type": "application/json",
+                    "response_schema": QUESTION_BATCH_SCHEMA
+                }
+            )
+        )
+        try:
+            items = orjson.loads(response.text or "{}").get("answers") or []
+        except (orjson.JSONDecodeError, AttributeError):
+            # Unreadable reply: every prompt falls back to its own request
+            llm_telemetry.record_parse_failure("question_batch")
+            return {}
+        return {
+            str(item.get("key")): str(item.get("question") or "")
+            for item in items if isinstance(item, dict) and item.get("key") in prompts
+        }
+    
+    async def generate(
+        self,
+        prompt: str,
+        system_instruction: Optional[str] = None,
+        response_schema: Optional[Dict] = None,
+        call_site: str = "generate"
+    ) -> AIResponse:
+        """Send a raw prompt to Gemini, with static instructions sent as the system instruction.
+        When a response schema is given, Gemini is asked for JSON constrained to it.
+        Usage is recorded under call_site."""
+        try:
+            model = self._get_model(system_instruction)
+            generation_config = None
+            if response_schema:
+                generation_config = {
+                    "response_mime_type": "application/json",
+                    "response_schema": response_schema
+                }
+            response = await self._observed_call(
+                call_site, f"{system_instruction or ''}{prompt}",
+                lambda: model.generate_content_async(prompt, generation_config=generation_config)
+            )
+            
+            return AIResponse(
+                message=response.text.strip() if response.text else "",
+                options=None
+            )
+            
+        except Exception as e:
+            print(f"Error calling Gemini: {e}")
+            return AIResponse(message="", options=None)
+    
+    async def _observed_call(self, call_site: str, prompt_text: str, make_call):
+        """Run a Gemini call through the resilience layer and record its usage for the call site"""
+        started = time.perf_counter()
+        try:
+            response = await self.resilience.call(make_call)
+        except Exception:
+            llm_telemetry.record(call_site, estimate_tokens(prompt_text), 0, time.perf_counter() - started, OUTCOME_EXCEPTION, estimated=True)
+            raise
+        latency = time.perf_counter() - started
+        
+        try:
+            text = response.text or ""
+        except ValueError:
+            # Blocked or candidate-less responses have no text
+            text = ""
+        prompt_tokens, response_tokens = response_usage(response)
+        estimated = prompt_tokens is None or response_tokens is None
+        llm_telemetry.record(
+            call_site,
+            prompt_tokens or estimate_tokens(prompt_text),
+            response_tokens or estimate_tokens(text),
+            latency,
+            OUTCOME_OK if text.strip() else OUTCOME_EMPTY,
+            estimated=estimated
+        )
+        return response
+    
+    def _get_model(self, system_instruction: Optional[str] = None):
+        """Get a model bound to the system instruction, creating it once per instruction"""
+        if not system_instruction:
+            return self.model
+        
+        cached = self._instruction_models.get(system_instruction)
+        if cached and (cached[1] is None or cached[1] > time.monotonic()):
+            return cached[0]
+        
+        model, expiry = self._create_instruction_model(system_instruction)
+        self._instruction_models[system_instruction] = (model, expiry)
+        return model
+    
+    def _create_instruction_model(self, system_instruction: str) -> Tuple[object, Optional[float]]:
+        """Create a model for a static instruction block, using Gemini context caching when enabled"""
+        import google.generativeai as genai
+        
+        if self.context_cache_enabled:
+            try:
+                from google.generativeai import caching
+                ttl = timedelta(minutes=self.context_cache_ttl_minutes)
+                cached_content = caching.CachedContent.create(
+                    model=self.context_cache_model,
+                    system_instruction=system_instruction,
+                    ttl=ttl
+                )
+                print(f"✅ Gemini context cache created for static instructions (~{estimate_tokens(system_instruction)} tokens)")
+                # Refresh a minute before the cache expires upstream
+                expiry = time.monotonic() + max(ttl.total_seconds() - 60, 0)
+                return genai.GenerativeModel.from_cached_content(cached_content=cached_content), expiry
+            except Exception as e:
+                print(f"⚠️ Gemini context cache unavailable, using system instruction: {e}")
+        
+        return genai.GenerativeModel(self.model_name, system_instruction=system_instruction), None
+    
     def _fallback_response(self) -> AIResponse:
         """Fallback response when Gemini fails"""
         return AIResponse(
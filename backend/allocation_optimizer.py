@@ -0,0 +1,200 @@
+"""
+Mean-variance allocation optimizer for investment plan options
+
+Each plan option is mapped to an asset class from a bundled table of return and
+risk assumptions. Weights are solved on a 5% grid over the simplex, fully
+vectorized with numpy: maximize expected return minus a risk-aversion penalty,
+subject to the high/medium/low band implied by risk tolerance and goal. The
+result yields percentages that sum to 100, amounts that sum to the monthly
+investment and a RiskBreakdown that matches the options.
+"""
+
+import os
+from functools import lru_cache
+from itertools import combinations
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+from models import InvestmentOption, RiskBreakdown
+from profile_record import GoalType, RiskLevel
+
+# Long-run assumptions per asset class
+# name: (expected annual return, equity factor loading, rates factor loading, idiosyncratic volatility)
+ASSET_CLASSES: Dict[str, Tuple[float, float, float, float]] = {
+    "cash": (0.025, 0.0, 0.0, 0.01),
+    "government_bonds": (0.035, -0.1, 1.0, 0.01),
+    "corporate_bonds": (0.045, 0.25, 0.9, 0.03),
+    "balanced": (0.06, 0.6, 0.4, 0.03),
+    "large_cap_equity": (0.085, 1.0, 0.0, 0.02),
+    "international_equity": (0.08, 0.9, 0.0, 0.09),
+    "small_cap_equity": (0.095, 1.1, 0.0, 0.12),
+    "growth_equity": (0.10, 1.2, 0.0, 0.10),
+    "real_estate": (0.075, 0.7, 0.3, 0.12),
+    "commodities": (0.035, 0.2, 0.0, 0.15),
+    "crypto": (0.15, 1.0, 0.0, 0.60),
+}
+EQUITY_FACTOR_VOLATILITY = 0.16
+RATES_FACTOR_VOLATILITY = 0.06
+
+# First matching keyword (in option type + name) decides the asset class
+ASSET_CLASS_KEYWORDS: List[Tuple[str, Tuple[str, ...]]] = [
+    ("crypto", ("crypto", "bitcoin", "ethereum")),
+    ("commodities", ("gold", "commodit", "precious metal")),
+    ("real_estate", ("reit", "real estate", "property")),
+    ("cash", ("savings", "deposit", "money market", "cash", "certificate")),
+    ("government_bonds", ("treasury", "government", "sovereign")),
+    ("corporate_bonds", ("bond", "fixed income", "debt", "income fund")),
+    ("international_equity", ("international", "emerging", "global", "foreign")),
+    ("balanced", ("balanced", "hybrid", "target date", "target-date", "diversified", "mutual fund")),
+    ("small_cap_equity", ("small cap", "small-cap", "mid cap", "mid-cap")),
+    ("growth_equity", ("growth", "technology", "tech ", "sector")),
+    ("large_cap_equity", ("index", "s&p", "equity", "etf", "large cap", "blue chip", "stock")),
+]
+RISK_LABEL_ASSET_CLASS = {"Low": "government_bonds", "Medium": "balanced", "High": "growth_equity"}
+
+RISK_BUCKETS = ("High", "Medium", "Low")
+
+# Percent bounds for the (high, medium, low) shares of the plan
+RISK_BANDS: Dict[RiskLevel, Tuple[Tuple[int, int], ...]] = {
+    RiskLevel.CONSERVATIVE: ((0, 10), (0, 40), (50, 100)),
+    RiskLevel.MODERATE: ((0, 35), (30, 70), (15, 50)),
+    RiskLevel.AGGRESSIVE: ((50, 90), (10, 50), (0, 20)),
+}
+RISK_AVERSION = {RiskLevel.CONSERVATIVE: 6.0, RiskLevel.MODERATE: 2.5, RiskLevel.AGGRESSIVE: 1.2}
+
+_ASSET_NAMES = list(ASSET_CLASSES)
+_ASSET_INDEX = {name: index for index, name in enumerate(_ASSET_NAMES)}
+_TABLE = np.array([ASSET_CLASSES[name] for name in _ASSET_NAMES])
+EXPECTED_RETURNS = _TABLE[:, 0]
+COVARIANCE = (
+    np.outer(_TABLE[:, 1], _TABLE[:, 1]) * EQUITY_FACTOR_VOLATILITY ** 2
+    + np.outer(_TABLE[:, 2], _TABLE[:, 2]) * RATES_FACTOR_VOLATILITY ** 2
+    + np.diag(_TABLE[:, 3] ** 2)
+)
+
+GRID_STEPS = 20  # 5% increments
+
+
+def classify_asset(option: InvestmentOption) -> str:
+    text = f"{option.type} {option.name}".lower()
+    for asset_class, keywords in ASSET_CLASS_KEYWORDS:
+        if any(keyword in text for keyword in keywords):
+            return asset_class
+    return RISK_LABEL_ASSET_CLASS.get(option.risk, "balanced")
+
+
+def risk_band(risk_level: RiskLevel, goal_type: GoalType) -> np.ndarray:
+    """(3, 2) array of percent bounds for the high/medium/low shares"""
+    if goal_type == GoalType.EMERGENCY:
+        # Emergency money must stay safe whatever the stated risk tolerance
+        return np.array(RISK_BANDS[RiskLevel.CONSERVATIVE], dtype=float)
+    band = np.array(RISK_BANDS[risk_level], dtype=float)
+    if goal_type == GoalType.HOUSE:
+        band[0, 1] = min(band[0, 1], 50)
+        band[0, 0] = min(band[0, 0], band[0, 1])
+    return band
+
+
+@lru_cache(maxsize=32)
+def simplex_grid(count: int, steps: int = GRID_STEPS) -> np.ndarray:
+    """Every split of 100% into count positive multiples of 1/steps, as a (m, count) array"""
+    cuts = np.array(list(combinations(range(1, steps), count - 1)), dtype=np.int16).reshape(-1, count - 1)
+    edges = np.hstack([
+        np.zeros((len(cuts), 1), dtype=np.int16),
+        cuts,
+        np.full((len(cuts), 1), steps, dtype=np.int16)
+    ])
+    return np.diff(edges, axis=1) / steps
+
+
+def allocate_amounts(monthly_investment: int, percentages: List[int]) -> List[int]:
+    """Split the monthly amount by percentage so the parts add up exactly (largest remainder)"""
+    raw = np.array(percentages, dtype=float) * monthly_investment / 100
+    amounts = np.floor(raw).astype(int)
+    shortfall = monthly_investment - int(amounts.sum())
+    for index in np.argsort(-(raw - amounts))[:max(shortfall, 0)]:
+        amounts[index] += 1
+    return amounts.tolist()
+
+
+def breakdown_for(options: List[InvestmentOption]) -> RiskBreakdown:
+    """RiskBreakdown implied by the options' own percentages and risk labels"""
+    shares = {"High": 0, "Medium": 0, "Low": 0}
+    for option in options:
+        shares[option.risk if option.risk in shares else "Medium"] += option.percentage
+    return RiskBreakdown(high=shares["High"], medium=shares["Medium"], low=shares["Low"])
+
+
+class AllocationOptimizer:
+    """Solves and checks plan allocations against the profile's risk band"""
+
+    def __init__(self):
+        self.enabled = os.getenv("ALLOCATION_OPTIMIZER", "True").lower() == "true"
+        self.max_weight = float(os.getenv("ALLOCATION_MAX_WEIGHT", "0.7"))
+        self.stats = {"optimized": 0, "ai_checked": 0, "ai_adjusted": 0, "infeasible_band": 0}
+
+    def _solve(self, options: List[InvestmentOption], risk_level: RiskLevel, goal_type: GoalType) -> np.ndarray:
+        count = len(options)
+        if count == 1:
+            return np.ones(1)
+
+        assets = [_ASSET_INDEX[classify_asset(option)] for option in options]
+        mu = EXPECTED_RETURNS[assets]
+        sigma = COVARIANCE[np.ix_(assets, assets)]
+        buckets = np.array([
+            [option.risk == bucket or (bucket == "Medium" and option.risk not in RISK_BUCKETS) for option in options]
+            for bucket in RISK_BUCKETS
+        ], dtype=float)
+
+        grid = simplex_grid(count)
+        utility = grid @ mu - 0.5 * RISK_AVERSION[risk_level] * np.einsum("ij,jk,ik->i", grid, sigma, grid)
+
+        shares = grid @ buckets.T * 100
+        band = risk_band(risk_level, goal_type)
+        violation = (np.maximum(band[:, 0] - shares, 0) + np.maximum(shares - band[:, 1], 0)).sum(axis=1)
+        if self.max_weight * count >= 1:
+            violation += np.maximum(grid.max(axis=1) - self.max_weight, 0) * 100
+
+        # Feasible splits first; if the options cannot meet the band, get as close as possible
+        feasible = violation <= 1e-9
+        if not feasible.any():
+            self.stats["infeasible_band"] += 1
+            feasible = violation <= violation.min() + 1e-9
+        return grid[np.argmax(np.where(feasible, utility, -np.inf))]
+
+    def _apply(self, options: List[InvestmentOption], monthly_investment: int, percentages: List[int]) -> Tuple[List[InvestmentOption], RiskBreakdown]:
+        amounts = allocate_amounts(monthly_investment, percentages)
+        updated = [
+            option.model_copy(update={"percentage": percentage, "amount": amount})
+            for option, percentage, amount in zip(options, percentages, amounts)
+        ]
+        return updated, breakdown_for(updated)
+
+    def optimize(self, options: List[InvestmentOption], monthly_investment: int, risk_level: RiskLevel, goal_type: GoalType) -> Tuple[List[InvestmentOption], RiskBreakdown]:
+        """Solve weights for the options and return consistent options and risk breakdown"""
+        if not options or len(options) > GRID_STEPS:
+            return options, breakdown_for(options)
+        weights = self._solve(options, risk_level, goal_type)
+        self.stats["optimized"] += 1
+        return self._apply(options, monthly_investment, np.rint(weights * 100).astype(int).tolist())
+
+    def check(self, options: List[InvestmentOption], monthly_investment: int, risk_level: RiskLevel, goal_type: GoalType) -> Tuple[List[InvestmentOption], RiskBreakdown]:
+        """Keep an AI allocation that adds up and sits inside the band; otherwise re-solve it"""
+        self.stats["ai_checked"] += 1
+        percentages = [option.percentage for option in options]
+        if sum(percentages) == 100 and all(percentage >= 0 for percentage in percentages):
+            breakdown = breakdown_for(options)
+            shares = np.array([breakdown.high, breakdown.medium, breakdown.low], dtype=float)
+            band = risk_band(risk_level, goal_type)
+            if np.all(shares >= band[:, 0]) and np.all(shares <= band[:, 1]):
+                return self._apply(options, monthly_investment, percentages)
+        self.stats["ai_adjusted"] += 1
+        return self.optimize(options, monthly_investment, risk_level, goal_type)
+
+    def get_metrics(self) -> Dict:
+        return {**self.stats, "enabled": self.enabled}
+
+
+# Global optimizer instance
+allocation_optimizer = AllocationOptimizer()
@@ -0,0 +1,237 @@
+"""
+Offline batch plan generation
+
+Reads profiles (SaveProfileRequest fields, plus an optional "id" column) from a
+CSV or NDJSON file and writes one NDJSON result per profile as soon as it is
+ready. Gemini-backed generation runs concurrently on one long-lived event loop;
+fallback plans, which are CPU-bound, are spread across a process pool. Rerunning
+with the same output file resumes: profiles that already have a plan are skipped
+and failed ones are retried.
+
+    python batch_plans.py profiles.csv --out plans.ndjson --concurrency 8
+    python batch_plans.py profiles.ndjson --out plans.ndjson --mode fallback --workers 4
+"""
+
+import argparse
+import asyncio
+import csv
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+from typing import Dict, Iterator, List, Optional, Set, Tuple
+
+import orjson
+from pydantic import ValidationError
+
+from models import SaveProfileRequest
+from profile_record import ProfileRecord
+
+KEY_FIELDS = ("id", "profileId")
+
+# (key, validated SaveProfileRequest fields)
+Row = Tuple[str, Dict]
+
+
+def read_rows(path: str) -> Iterator[Tuple[str, Dict]]:
+    """Raw records keyed by their id column, or by row number when there is none"""
+    if path.endswith(".csv"):
+        with open(path, newline="", encoding="utf-8") as f:
+            for number, record in enumerate(csv.DictReader(f), start=1):
+                cleaned = {field: value for field, value in record.items() if field and value not in (None, "")}
+                yield _row_key(cleaned, number), cleaned
+        return
+
+    with open(path, "rb") as f:
+        for number, line in enumerate(f, start=1):
+            if not line.strip():
+                continue
+            try:
+                record = orjson.loads(line)
+            except orjson.JSONDecodeError:
+                record = {"__error__": "invalid JSON"}
+            if not isinstance(record, dict):
+                record = {"__error__": "record is not an object"}
+            yield _row_key(record, number), record
+
+
+def _row_key(record: Dict, number: int) -> str:
+    for field in KEY_FIELDS:
+        if record.get(field):
+            return str(record.pop(field))
+    return f"row-{number}"
+
+
+def validate_row(record: Dict) -> Tuple[Optional[Dict], Optional[str]]:
+    """SaveProfileRequest fields for a record, or the reason it was rejected"""
+    if "__error__" in record:
+        return None, record["__error__"]
+    try:
+        return SaveProfileRequest.model_validate(record).model_dump(), None
+    except ValidationError as e:
+        return None, "; ".join(f"{'.'.join(str(part) for part in item['loc'])}: {item['msg']}" for item in e.errors())
+
+
+def profile_from_request(key: str, request: Dict) -> ProfileRecord:
+    return ProfileRecord(
+        id=key,
+        monthly_investment=request["monthlyInvestment"],
+        preference=request["investmentPreference"],
+        risk_tolerance=request["riskTolerance"],
+        goal=request["goal"],
+        age=request.get("age"),
+        income=request.get("income"),
+        experience=request.get("experience"),
+        time_horizon=request.get("timeHorizon")
+    )
+
+
+def build_fallback_plans(rows: List[Row]) -> List[Dict]:
+    """Process-pool task: deterministic plans for a chunk of validated rows"""
+    from investment_plan_service import investment_plan_service
+
+    results = []
+    for key, request in rows:
+        plan = investment_plan_service.generate_fallback_plan(profile_from_request(key, request))
+        results.append({"key": key, "source": "fallback", "plan": plan.model_dump()})
+    return results
+
+
+def completed_keys(path: str) -> Set[str]:
+    """Keys that already have a plan in the output; a torn last line is cut off"""
+    done = set()
+    if not os.path.exists(path):
+        return done
+
+    valid_end = 0
+    with open(path, "rb") as f:
+        for line in f:
+            if not line.endswith(b"\n"):
+                break
+            try:
+                result = orjson.loads(line)
+            except orjson.JSONDecodeError:
+                break
+            if result.get("plan"):
+                done.add(result["key"])
+            valid_end += len(line)
+    if valid_end < os.path.getsize(path):
+        print(f"⚠️ Truncating partial result at byte {valid_end} of {path}")
+        os.truncate(path, valid_end)
+    return done
+
+
+class BatchPlanRunner:
+    """Generates plans for a profile file, writing each result as soon as it is ready"""
+
+    def __init__(self, mode: str, concurrency: int, workers: int, chunk_size: int):
+        self.mode = mode
+        self.concurrency = concurrency
+        self.workers = workers
+        self.chunk_size = chunk_size
+        self.stats = {"ai": 0, "fallback": 0, "failed": 0, "skipped": 0}
+        self._out = None
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._started = 0.0
+
+    def _write(self, result: Dict):
+        self._out.write(orjson.dumps(result) + b"\n")
+        self._out.flush()
+        if "error" in result:
+            self.stats["failed"] += 1
+        else:
+            self.stats[result["source"]] += 1
+        written = self.stats["ai"] + self.stats["fallback"] + self.stats["failed"]
+        if written % 100 == 0:
+            rate = written / max(time.perf_counter() - self._started, 1e-9)
+            print(f"📦 {written} plans written ({rate:.1f}/s)")
+
+    def _pending_rows(self, path: str, done: Set[str]) -> Iterator[Row]:
+        for key, record in read_rows(path):
+            if key in done:
+                self.stats["skipped"] += 1
+                continue
+            request, error = validate_row(record)
+            if error:
+                self._write({"key": key, "error": error})
+                continue
+            yield key, request
+
+    async def _run_fallback_chunks(self, rows: Iterator[Row]):
+        loop = asyncio.get_running_loop()
+        while True:
+            chunk = list(islice(rows, self.chunk_size))
+            if not chunk:
+                return
+            try:
+                results = await loop.run_in_executor(self._pool, build_fallback_plans, chunk)
+            except Exception as e:
+                results = [{"key": key, "error": f"fallback failed: {e}"} for key, _ in chunk]
+            for result in results:
+                self._write(result)
+
+    async def _run_ai(self, rows: Iterator[Row]):
+        from ai_service import ai_service
+        from investment_plan_service import investment_plan_service
+
+        loop = asyncio.get_running_loop()
+        for key, request in rows:
+            if ai_service.resilience.breaker.state == "open":
+                # Gemini is unavailable; do the deterministic work off the event loop
+                for result in await loop.run_in_executor(self._pool, build_fallback_plans, [(key, request)]):
+                    self._write(result)
+                continue
+            try:
+                plan = await investment_plan_service.generate_ai_plan(profile_from_request(key, request))
+            except Exception as e:
+                self._write({"key": key, "error": str(e)})
+                continue
+            source = "fallback" if plan.planId.startswith("fallback_plan") else "ai"
+            self._write({"key": key, "source": source, "plan": plan.model_dump()})
+
+    async def run(self, input_path: str, output_path: str) -> Dict:
+        done = completed_keys(output_path)
+        if done:
+            print(f"🔁 Resuming: {len(done)} profiles already have plans in {output_path}")
+
+        self._started = time.perf_counter()
+        rows = self._pending_rows(input_path, done)
+        with open(output_path, "ab") as out, ProcessPoolExecutor(max_workers=self.workers) as pool:
+            self._out, self._pool = out, pool
+            # Every runner pulls from the same row iterator, so the input is read lazily once
+            runner = self._run_fallback_chunks if self.mode == "fallback" else self._run_ai
+            count = self.workers * 2 if self.mode == "fallback" else self.concurrency
+            await asyncio.gather(*(runner(rows) for _ in range(count)))
+
+        self.stats["seconds"] = round(time.perf_counter() - self._started, 2)
+        return self.stats
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate FinPilot investment plans for a file of profiles")
+    parser.add_argument("input", help="Profiles as .csv or .ndjson")
+    parser.add_argument("--out", default="plans.ndjson", help="NDJSON results file (appended to and resumed)")
+    parser.add_argument("--mode", choices=("ai", "fallback"), default="ai",
+                        help="ai: Gemini plans, with fallback plans when it fails; fallback: deterministic plans only")
+    parser.add_argument("--concurrency", type=int, default=8, help="Gemini requests in flight")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="Processes for fallback plans")
+    parser.add_argument("--chunk-size", type=int, default=200, help="Profiles per process-pool task")
+    args = parser.parse_args(argv)
+
+    if not os.path.exists(args.input):
+        print(f"❌ Input file not found: {args.input}")
+        return 1
+
+    runner = BatchPlanRunner(args.mode, args.concurrency, args.workers, args.chunk_size)
+    stats = asyncio.run(runner.run(args.input, args.out))
+    print(f"✅ Batch complete: {stats}")
+
+    if args.mode == "ai":
+        from llm_telemetry import llm_telemetry
+        llm_telemetry.log_summary()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
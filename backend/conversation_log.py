@@ -0,0 +1,209 @@
+"""
+Deduplicated conversation storage for advisor chat sessions
+
+Every next-question request carries the whole chat history. Storing that copy
+per turn costs O(N^2) messages for an N-turn conversation. Instead, each
+conversation keeps one append-only message log. A turn appends only the messages
+its history adds and records the answers that changed since the previous turn,
+with the full answers checkpointed every few turns.
+
+A turn joins a conversation only through the conversation ID the client got
+back from the previous turn, and only if its history extends that
+conversation's log (checked with a chained hash of the messages). Requests
+without one start a new conversation.
+
+Session records are rebuilt on read, so sessions_storage keeps serving the
+original full records (chat_history, current_answers, ...).
+"""
+
+import hashlib
+import os
+from collections.abc import MutableMapping
+from typing import Dict, Iterator, List, Optional
+
+import orjson
+
+from storage import create_store, new_id
+
+_EMPTY_HASH = hashlib.blake2b(b"", digest_size=16).hexdigest()
+_MISSING = object()
+MAX_CONVERSATION_ID_LENGTH = 128
+
+
+def history_hash(messages: List[Dict]) -> str:
+    """Chained hash of a message sequence; equal only for identical histories"""
+    current = _EMPTY_HASH
+    for message in messages:
+        current = hashlib.blake2b(
+            current.encode() + orjson.dumps(message, option=orjson.OPT_SORT_KEYS),
+            digest_size=16
+        ).hexdigest()
+    return current
+
+
+class ConversationSessionStore(MutableMapping):
+    """sessions_storage replacement: per-turn deltas over a shared message log per conversation"""
+
+    def __init__(self):
+        self.checkpoint_interval = max(int(os.getenv("SESSION_ANSWERS_CHECKPOINT", "8")), 1)
+        self.turns: MutableMapping = create_store("sessions")
+        self.conversations: MutableMapping = create_store("conversations")
+        self.messages: MutableMapping = create_store("conversation_messages")
+        self.stats = {"turns": 0, "messages_appended": 0, "messages_deduplicated": 0, "conversations_started": 0}
+
+    # Mapping interface
+
+    def __getitem__(self, session_id: str) -> Dict:
+        turn = self.turns[session_id]
+        if "chat_history" in turn:
+            # Full record saved before conversations were deduplicated
+            return turn
+        record = self.summary(session_id)
+        record["chat_history"] = self.read_messages(turn["conversation_id"], turn["message_count"])
+        return record
+
+    def __setitem__(self, session_id: str, record: Dict):
+        self.append_turn(session_id, record)
+
+    def __delitem__(self, session_id: str):
+        raise TypeError("Conversation turns are append-only")
+
+    def __contains__(self, session_id) -> bool:
+        return session_id in self.turns
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(list(self.turns))
+
+    def __len__(self) -> int:
+        return len(self.turns)
+
+    # Conversations
+
+    def _message_key(self, conversation_id: str, index: int) -> str:
+        return f"{conversation_id}:{index:06d}"
+
+    def _continued_header(self, conversation_id: Optional[str], history: List[Dict]) -> Optional[Dict]:
+        """Header of the client's conversation if this history extends its log, else None"""
+        if not conversation_id:
+            return None
+        header = self.conversations.get(conversation_id)
+        if header is None or header["message_count"] > len(history):
+            return None
+        if history_hash(history[:header["message_count"]]) != header["head_hash"]:
+            return None
+        return dict(header)
+
+    def append_turn(self, session_id: str, record: Dict) -> str:
+        """Store one next-question turn; returns the conversation it was appended to"""
+        history = record.get("chat_history") or []
+        answers = record.get("current_answers") or {}
+        requested_id = record.get("conversation_id")
+        if not isinstance(requested_id, str) or len(requested_id) > MAX_CONVERSATION_ID_LENGTH:
+            requested_id = None
+
+        header = self._continued_header(requested_id, history)
+        if header is not None:
+            conversation_id = requested_id
+        else:
+            # New conversation, unknown ID, or a history that rewrote earlier messages
+            conversation_id = new_id("conversation")
+            header = {
+                "message_count": 0,
+                "head_hash": _EMPTY_HASH,
+                "answers": {},
+                "turn_count": 0,
+                "last_session": None,
+                "created_at": record.get("created_at")
+            }
+            self.stats["conversations_started"] += 1
+
+        stored = header["message_count"]
+        new_messages = history[stored:]
+        self.messages.update({
+            self._message_key(conversation_id, stored + offset): message
+            for offset, message in enumerate(new_messages)
+        })
+        self.stats["messages_appended"] += len(new_messages)
+        self.stats["messages_deduplicated"] += stored
+
+        previous_answers = header["answers"]
+        answers_delta = {
+            field: value for field, value in answers.items() if previous_answers.get(field, _MISSING) != value
+        }
+        merged_answers = {**previous_answers, **answers_delta}
+        turn = {
+            "request_id": record.get("request_id"),
+            "conversation_id": conversation_id,
+            "message_count": len(history),
+            "previous_session": header["last_session"],
+            "is_complete": record.get("is_complete"),
+            "created_at": record.get("created_at")
+        }
+        if header["turn_count"] % self.checkpoint_interval == 0:
+            # Checkpoint: bounds how many turns a read replays
+            turn["answers"] = merged_answers
+        else:
+            turn["answers_delta"] = answers_delta
+        self.turns[session_id] = turn
+        self.stats["turns"] += 1
+
+        if new_messages:
+            header["head_hash"] = history_hash(history)
+            header["message_count"] = len(history)
+        header["answers"] = merged_answers
+        header["turn_count"] += 1
+        header["last_session"] = session_id
+        header["updated_at"] = record.get("created_at")
+        self.conversations[conversation_id] = header
+        return conversation_id
+
+    def read_messages(self, conversation_id: str, count: int) -> List[Dict]:
+        return [self.messages[self._message_key(conversation_id, index)] for index in range(count)]
+
+    def summary(self, session_id: str) -> Dict:
+        """Session record without chat_history: answers are rebuilt from the nearest checkpoint"""
+        turn = self.turns[session_id]
+        if "chat_history" in turn:
+            return {key: value for key, value in turn.items() if key != "chat_history"} | {
+                "message_count": len(turn["chat_history"])
+            }
+
+        deltas = []
+        step = turn
+        while "answers" not in step:
+            deltas.append(step["answers_delta"])
+            step = self.turns[step["previous_session"]]
+        answers = dict(step["answers"])
+        for delta in reversed(deltas):
+            answers.update(delta)
+
+        return {
+            "request_id": turn["request_id"],
+            "conversation_id": turn["conversation_id"],
+            "message_count": turn["message_count"],
+            "current_answers": answers,
+            "is_complete": turn["is_complete"],
+            "created_at": turn["created_at"]
+        }
+
+    def get_metrics(self) -> Dict:
+        return {
+            **self.stats,
+            "conversations": len(self.conversations),
+            "stored_messages": len(self.messages)
+        }
+
+
+def create_session_store() -> MutableMapping:
+    """Deduplicated conversation store, or one full record per turn when SESSION_DEDUP is off"""
+    if os.getenv("SESSION_DEDUP", "True").lower() == "true":
+        return ConversationSessionStore()
+    return create_store("sessions")
+
+
+def save_session_turn(store: MutableMapping, session_id: str, record: Dict) -> Optional[str]:
+    """Store a turn in either kind of session store; returns its conversation ID"""
+    if isinstance(store, ConversationSessionStore):
+        return store.append_turn(session_id, record)
+    store[session_id] = record
+    return record.get("conversation_id")
@@ -0,0 +1,298 @@
+"""
+Streaming columnar export of profiles, sessions and plans for analytics
+
+Each table is produced in fixed-size record batches straight from the stores,
+so memory stays bounded by the batch size. Formats: CSV (always available),
+Arrow IPC stream and Parquet (require pyarrow).
+
+Usable from the API (/api/export/{table}) or offline against the configured
+storage backend:
+
+    STORAGE_BACKEND=sqlite STORAGE_PATH=finpilot_state.db python export.py --format parquet --out exports/
+"""
+
+import argparse
+import csv
+import io
+import os
+import sys
+from typing import Callable, Dict, Iterator, List, MutableMapping, Tuple
+
+import orjson
+
+from conversation_log import ConversationSessionStore
+from plan_versions import VersionedPlanStore
+from profile_record import ProfileRecord
+from models import UserAnswers
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+    pq = None
+
+EXPORT_BATCH_ROWS = int(os.getenv("EXPORT_BATCH_ROWS", "10000"))
+
+FORMATS = {
+    "csv": ("text/csv", "csv"),
+    "arrow": ("application/vnd.apache.arrow.stream", "arrows"),
+    "parquet": ("application/vnd.apache.parquet", "parquet"),
+}
+
+ANSWER_FIELDS = list(UserAnswers.model_fields)
+
+# Column name -> type ("string", "int64", "bool") per exported table
+TABLE_SCHEMAS: Dict[str, List[Tuple[str, str]]] = {
+    "profiles": [
+        ("profile_id", "string"), ("created_at", "string"),
+        *[(field, "string") for field in ProfileRecord.TEXT_FIELDS],
+        ("amount", "int64"), ("age_years", "int64"), ("risk_level", "string"),
+        ("risk_comfort", "string"), ("goal_type", "string"), ("preference_type", "string"),
+        ("experience_level", "string"), ("horizon", "string"),
+    ],
+    "sessions": [
+        ("session_id", "string"), ("request_id", "string"), ("conversation_id", "string"), ("created_at", "string"),
+        ("is_complete", "bool"), ("message_count", "int64"),
+        *[(f"answer_{field}", "string") for field in ANSWER_FIELDS],
+    ],
+    "plan_options": [
+        ("plan_id", "string"), ("profile_id", "string"), ("plan_created_at", "string"),
+        ("option_index", "int64"), ("type", "string"), ("name", "string"), ("amount", "int64"),
+        ("percentage", "int64"), ("risk", "string"), ("holding_period", "string"), ("reason", "string"),
+    ],
+    "risk_breakdowns": [
+        ("plan_id", "string"), ("profile_id", "string"), ("plan_created_at", "string"),
+        ("saved_at", "string"), ("total_amount", "int64"), ("timeline", "string"),
+        ("expected_return", "string"), ("option_count", "int64"),
+        ("high", "int64"), ("medium", "int64"), ("low", "int64"),
+    ],
+}
+
+
+def _snapshot_items(store: MutableMapping) -> Iterator[Tuple[str, object]]:
+    """Iterate a store one record at a time over a snapshot of its keys"""
+    for key in list(store.keys()):
+        value = store.get(key)
+        if value is not None:
+            yield key, value
+
+
+def _plan_records(plans: MutableMapping) -> Iterator[Tuple[str, Dict]]:
+    for plan_id in list(plans.keys()):
+        if isinstance(plans, VersionedPlanStore):
+            # Rebuild directly so a full export does not churn the read cache
+            record = plans.reconstruct(plan_id)
+        else:
+            encoded = plans.get(plan_id)
+            if encoded is None:
+                continue
+            record = orjson.loads(encoded)
+        yield plan_id, record
+
+
+def profile_rows(stores: Dict[str, MutableMapping]) -> Iterator[Dict]:
+    for profile_id, record in _snapshot_items(stores["profiles"]):
+        row = {"profile_id": profile_id, "created_at": record.created_at}
+        for field in ProfileRecord.TEXT_FIELDS:
+            row[field] = getattr(record, field)
+        row.update(
+            amount=record.amount,
+            age_years=record.age_years,
+            risk_level=record.risk_level.name,
+            risk_comfort=record.risk_comfort.name,
+            goal_type=record.goal_type.name,
+            preference_type=record.preference_type.name,
+            experience_level=record.experience_level.name,
+            horizon=record.horizon.name
+        )
+        yield row
+
+
+def _session_records(sessions: MutableMapping) -> Iterator[Tuple[str, Dict]]:
+    if not isinstance(sessions, ConversationSessionStore):
+        for session_id, session in _snapshot_items(sessions):
+            yield session_id, {**session, "message_count": len(session.get("chat_history") or [])}
+        return
+    for session_id in list(sessions.keys()):
+        # Only the message count is exported, so skip rebuilding the chat history
+        yield session_id, sessions.summary(session_id)
+
+
+def session_rows(stores: Dict[str, MutableMapping]) -> Iterator[Dict]:
+    for session_id, session in _session_records(stores["sessions"]):
+        answers = session.get("current_answers") or {}
+        row = {
+            "session_id": session_id,
+            "request_id": session.get("request_id"),
+            "conversation_id": session.get("conversation_id"),
+            "created_at": session.get("created_at"),
+            "is_complete": bool(session.get("is_complete")),
+            "message_count": session["message_count"]
+        }
+        for field in ANSWER_FIELDS:
+            row[f"answer_{field}"] = answers.get(field)
+        yield row
+
+
+def plan_option_rows(stores: Dict[str, MutableMapping]) -> Iterator[Dict]:
+    for plan_id, record in _plan_records(stores["plans"]):
+        plan = record["plan"]
+        for index, option in enumerate(plan["options"]):
+            yield {
+                "plan_id": plan_id,
+                "profile_id": record.get("profile_id"),
+                "plan_created_at": plan.get("createdAt"),
+                "option_index": index,
+                "type": option.get("type"),
+                "name": option.get("name"),
+                "amount": option.get("amount"),
+                "percentage": option.get("percentage"),
+                "risk": option.get("risk"),
+                "holding_period": option.get("holdingPeriod"),
+                "reason": option.get("reason")
+            }
+
+
+def risk_breakdown_rows(stores: Dict[str, MutableMapping]) -> Iterator[Dict]:
+    for plan_id, record in _plan_records(stores["plans"]):
+        plan = record["plan"]
+        breakdown = plan["riskBreakdown"]
+        yield {
+            "plan_id": plan_id,
+            "profile_id": record.get("profile_id"),
+            "plan_created_at": plan.get("createdAt"),
+            "saved_at": record.get("saved_at"),
+            "total_amount": plan.get("totalAmount"),
+            "timeline": plan.get("timeline"),
+            "expected_return": plan.get("expectedReturn"),
+            "option_count": len(plan["options"]),
+            "high": breakdown.get("high"),
+            "medium": breakdown.get("medium"),
+            "low": breakdown.get("low")
+        }
+
+
+TABLE_ROWS: Dict[str, Callable[[Dict[str, MutableMapping]], Iterator[Dict]]] = {
+    "profiles": profile_rows,
+    "sessions": session_rows,
+    "plan_options": plan_option_rows,
+    "risk_breakdowns": risk_breakdown_rows,
+}
+
+
+def _batches(rows: Iterator[Dict], batch_rows: int) -> Iterator[List[Dict]]:
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= batch_rows:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def _arrow_schema(table: str):
+    types = {"string": pa.string(), "int64": pa.int64(), "bool": pa.bool_()}
+    return pa.schema([(name, types[kind]) for name, kind in TABLE_SCHEMAS[table]])
+
+
+class _ChunkSink(io.RawIOBase):
+    """Write-only file object that hands out what was written since the last drain"""
+
+    def __init__(self):
+        self._chunks: List[bytes] = []
+        self._position = 0
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        chunk = bytes(data)
+        self._chunks.append(chunk)
+        self._position += len(chunk)
+        return len(chunk)
+
+    def tell(self) -> int:
+        return self._position
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def _csv_chunks(table: str, rows: Iterator[Dict], batch_rows: int) -> Iterator[bytes]:
+    columns = [name for name, _ in TABLE_SCHEMAS[table]]
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=columns)
+    writer.writeheader()
+    for batch in _batches(rows, batch_rows):
+        writer.writerows(batch)
+        yield buffer.getvalue().encode()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode()
+
+
+def _arrow_chunks(table: str, rows: Iterator[Dict], batch_rows: int, parquet: bool) -> Iterator[bytes]:
+    schema = _arrow_schema(table)
+    sink = _ChunkSink()
+    writer = pq.ParquetWriter(sink, schema) if parquet else pa.ipc.new_stream(sink, schema)
+    try:
+        for batch in _batches(rows, batch_rows):
+            writer.write_batch(pa.RecordBatch.from_pylist(batch, schema=schema))
+            chunk = sink.drain()
+            if chunk:
+                yield chunk
+    finally:
+        writer.close()
+    yield sink.drain()
+
+
+def export_chunks(stores: Dict[str, MutableMapping], table: str, fmt: str, batch_rows: int = EXPORT_BATCH_ROWS) -> Iterator[bytes]:
+    """Encoded chunks of one table in the given format, one record batch at a time"""
+    if table not in TABLE_ROWS:
+        raise ValueError(f"Unknown export table: {table}")
+    if fmt not in FORMATS:
+        raise ValueError(f"Unknown export format: {fmt}")
+    if fmt != "csv" and pa is None:
+        raise ValueError(f"The {fmt} format requires pyarrow (pip install pyarrow)")
+
+    rows = TABLE_ROWS[table](stores)
+    if fmt == "csv":
+        return _csv_chunks(table, rows, batch_rows)
+    return _arrow_chunks(table, rows, batch_rows, parquet=fmt == "parquet")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Export FinPilot data for analytics")
+    parser.add_argument("--format", choices=sorted(FORMATS), default="parquet")
+    parser.add_argument("--out", default="exports", help="Output directory")
+    parser.add_argument("--tables", nargs="+", choices=sorted(TABLE_ROWS), default=list(TABLE_ROWS))
+    parser.add_argument("--batch-rows", type=int, default=EXPORT_BATCH_ROWS)
+    args = parser.parse_args(argv)
+
+    # Read the stores without writing next to a running server
+    os.environ["STORAGE_READ_ONLY"] = "True"
+    from stores import plans_storage, profiles_storage, sessions_storage
+    stores = {"profiles": profiles_storage, "sessions": sessions_storage, "plans": plans_storage}
+
+    os.makedirs(args.out, exist_ok=True)
+    extension = FORMATS[args.format][1]
+    for table in args.tables:
+        path = os.path.join(args.out, f"{table}.{extension}")
+        try:
+            with open(path, "wb") as f:
+                for chunk in export_chunks(stores, table, args.format, args.batch_rows):
+                    f.write(chunk)
+        except ValueError as e:
+            print(f"❌ {e}")
+            return 1
+        print(f"✅ Exported {table} to {path}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,225 @@
+"""
+Similarity cache for plan feedback
+
+Feedback is repetitive ("make it safer", "less risky please", "more
+conservative"), so plans produced for feedback are cached per profile bucket.
+Feedback text is normalized into canonical tokens, indexed with MinHash/LSH, and
+a lookup whose Jaccard similarity reaches the threshold reuses the earlier plan
+instead of calling Gemini. Refinements are also keyed by the allocation of the
+plan being refined, so they are only reused for the same base plan.
+"""
+
+import hashlib
+import math
+import os
+import re
+from collections import OrderedDict
+from datetime import datetime
+from typing import Dict, FrozenSet, List, Optional, Set, Tuple
+
+import numpy as np
+import orjson
+
+from allocation_optimizer import allocate_amounts
+from memory_report import measure
+from models import InvestmentPlan
+from profile_record import ProfileRecord
+from storage import new_id
+
+_TOKEN_PATTERN = re.compile(r"[a-z0-9%]+")
+
+STOPWORDS = {
+    "a", "an", "the", "it", "its", "my", "me", "i", "im", "to", "be", "is", "am", "are", "of",
+    "for", "and", "or", "please", "pls", "can", "could", "would", "you", "make", "want", "like",
+    "id", "just", "bit", "little", "much", "lot", "some", "plan", "portfolio", "this", "that",
+    "so", "really", "very", "way", "in", "on", "with", "overall", "thanks", "thank",
+    "d", "ll", "ve", "re", "s"
+}
+
+# Words with the same meaning for plan feedback collapse to one token
+CANONICAL_TOKENS = {
+    **dict.fromkeys(("safe", "safer", "safest", "safety", "conservative", "stable", "stability",
+                     "secure", "cautious", "careful", "defensive"), "SAFE"),
+    **dict.fromkeys(("aggressive", "riskier", "bold", "bolder", "growth"), "GROWTH"),
+    **dict.fromkeys(("risk", "risks", "risky", "volatile", "volatility"), "RISK"),
+    **dict.fromkeys(("less", "lower", "reduce", "decrease", "fewer", "cut", "minus", "drop", "lessen"), "LESS"),
+    **dict.fromkeys(("more", "higher", "increase", "add", "extra", "raise", "boost"), "MORE"),
+    **dict.fromkeys(("stock", "stocks", "equity", "equities", "shares"), "STOCKS"),
+    **dict.fromkeys(("bond", "bonds", "treasury", "treasuries", "fixed"), "BONDS"),
+    **dict.fromkeys(("return", "returns", "yield", "gains", "profit"), "RETURNS"),
+}
+
+# Direction + subject pairs that mean the same as a single concept
+CANONICAL_PAIRS = {
+    ("LESS", "RISK"): "SAFE",
+    ("MORE", "SAFE"): "SAFE",
+    ("MORE", "RISK"): "GROWTH",
+    ("LESS", "SAFE"): "GROWTH",
+    ("MORE", "GROWTH"): "GROWTH",
+}
+
+_MERSENNE_PRIME = (1 << 31) - 1
+
+
+def normalize_feedback(feedback: str) -> List[str]:
+    """Lowercase, drop filler words and map synonyms and direction phrases to canonical tokens"""
+    tokens = [
+        CANONICAL_TOKENS.get(token, token)
+        for token in _TOKEN_PATTERN.findall(feedback.lower())
+        if token not in STOPWORDS
+    ]
+    merged = []
+    for token in tokens:
+        if merged and (merged[-1], token) in CANONICAL_PAIRS:
+            merged[-1] = CANONICAL_PAIRS[(merged[-1], token)]
+        elif not merged or merged[-1] != token:
+            merged.append(token)
+    return merged
+
+
+def shingles(tokens: List[str]) -> FrozenSet[str]:
+    """Unigrams plus bigrams, so word order still distinguishes 'less bonds more stocks'"""
+    return frozenset(tokens) | frozenset(f"{first} {second}" for first, second in zip(tokens, tokens[1:]))
+
+
+def profile_bucket(profile: ProfileRecord) -> Tuple:
+    """Profiles in the same bucket get interchangeable plans for the same feedback"""
+    amount_band = int(math.log2(max(profile.amount, 100) / 100))
+    return (
+        int(profile.risk_level), int(profile.risk_comfort), int(profile.goal_type),
+        int(profile.preference_type), int(profile.experience_level), int(profile.horizon),
+        profile.age_years // 10, amount_band
+    )
+
+
+def plan_content_key(plan: InvestmentPlan) -> str:
+    """Hash of a plan's allocation (amount-independent), identifying it as a refinement base"""
+    allocation = {
+        "options": [[option.type, option.name, option.percentage, option.risk] for option in plan.options],
+        "riskBreakdown": plan.riskBreakdown.model_dump()
+    }
+    return hashlib.blake2b(orjson.dumps(allocation, option=orjson.OPT_SORT_KEYS), digest_size=16).hexdigest()
+
+
+def cache_bucket(profile: ProfileRecord, base_plan: Optional[InvestmentPlan]) -> Tuple:
+    """Profile bucket, narrowed to one base plan for refinements"""
+    return profile_bucket(profile), plan_content_key(base_plan) if base_plan is not None else None
+
+
+class FeedbackPlanCache:
+    """Bounded LRU of feedback plans with a MinHash/LSH index for near-duplicate lookups"""
+
+    def __init__(self):
+        self.enabled = os.getenv("FEEDBACK_CACHE_ENABLED", "True").lower() == "true"
+        self.threshold = float(os.getenv("FEEDBACK_CACHE_THRESHOLD", "0.8"))
+        self.max_entries = int(os.getenv("FEEDBACK_CACHE_SIZE", "1000"))
+        self.bands = int(os.getenv("FEEDBACK_CACHE_LSH_BANDS", "16"))
+        self.rows = int(os.getenv("FEEDBACK_CACHE_LSH_ROWS", "4"))
+
+        permutations = self.bands * self.rows
+        rng = np.random.default_rng(1729)
+        self._a = rng.integers(1, _MERSENNE_PRIME, size=permutations, dtype=np.int64)
+        self._b = rng.integers(0, _MERSENNE_PRIME, size=permutations, dtype=np.int64)
+
+        # entry id -> (bucket, shingles, band keys, plan dict)
+        self._entries: "OrderedDict[int, Tuple[Tuple, FrozenSet[str], List[Tuple], Dict]]" = OrderedDict()
+        self._index: Dict[Tuple, Set[int]] = {}
+        self._next_id = 0
+        self.stats = {"hits": 0, "misses": 0, "stored": 0, "evicted": 0}
+
+    def _signature(self, features: FrozenSet[str]) -> np.ndarray:
+        hashes = np.array(
+            [int.from_bytes(hashlib.blake2b(feature.encode(), digest_size=4).digest(), "little") for feature in features],
+            dtype=np.int64
+        )
+        permuted = (np.outer(hashes, self._a) + self._b) % _MERSENNE_PRIME
+        return permuted.min(axis=0)
+
+    def _band_keys(self, bucket: Tuple, features: FrozenSet[str]) -> List[Tuple]:
+        signature = self._signature(features).reshape(self.bands, self.rows)
+        return [(bucket, band, row.tobytes()) for band, row in enumerate(signature)]
+
+    def lookup(self, profile: ProfileRecord, feedback: str, base_plan: Optional[InvestmentPlan] = None) -> Optional[InvestmentPlan]:
+        """Earlier plan for near-identical feedback in the profile's bucket (and on the same base plan), rescaled to this profile"""
+        if not self.enabled:
+            return None
+        features = shingles(normalize_feedback(feedback))
+        if not features:
+            return None
+
+        bucket = cache_bucket(profile, base_plan)
+        candidates = set()
+        for key in self._band_keys(bucket, features):
+            candidates |= self._index.get(key, set())
+
+        best_id, best_similarity = None, 0.0
+        for entry_id in candidates:
+            cached_features = self._entries[entry_id][1]
+            similarity = len(features & cached_features) / len(features | cached_features)
+            if similarity > best_similarity:
+                best_id, best_similarity = entry_id, similarity
+
+        if best_id is None or best_similarity < self.threshold:
+            self.stats["misses"] += 1
+            return None
+
+        self.stats["hits"] += 1
+        self._entries.move_to_end(best_id)
+        print(f"♻️ Feedback cache hit ({best_similarity:.2f}) for '{feedback}'")
+        return self._rescale(self._entries[best_id][3], profile.amount)
+
+    def store_generated(self, profile: ProfileRecord, feedback: str, plan: InvestmentPlan, base_plan: Optional[InvestmentPlan] = None):
+        """Cache a plan produced for feedback (refinements under their base plan); fallback plans are never reused"""
+        if not self.enabled or (plan.planId or "").startswith("fallback_plan"):
+            return
+        features = shingles(normalize_feedback(feedback))
+        if not features:
+            return
+
+        bucket = cache_bucket(profile, base_plan)
+        band_keys = self._band_keys(bucket, features)
+        entry_id = self._next_id
+        self._next_id += 1
+        self._entries[entry_id] = (bucket, features, band_keys, plan.model_dump())
+        for key in band_keys:
+            self._index.setdefault(key, set()).add(entry_id)
+        self.stats["stored"] += 1
+
+        while len(self._entries) > self.max_entries:
+            old_id, (_, _, old_keys, _) = self._entries.popitem(last=False)
+            for key in old_keys:
+                ids = self._index[key]
+                ids.discard(old_id)
+                if not ids:
+                    del self._index[key]
+            self.stats["evicted"] += 1
+
+    def _rescale(self, plan_dict: Dict, monthly_investment: int) -> InvestmentPlan:
+        """Reuse the cached allocation for this profile's amount, as a new plan"""
+        options = plan_dict["options"]
+        amounts = allocate_amounts(monthly_investment, [option["percentage"] for option in options])
+        return InvestmentPlan.model_validate({
+            **plan_dict,
+            "totalAmount": monthly_investment,
+            "monthlyInvestment": monthly_investment,
+            "options": [{**option, "amount": amount} for option, amount in zip(options, amounts)],
+            "planId": new_id("ai_plan"),
+            "createdAt": datetime.now().isoformat()
+        })
+
+    def memory_usage(self, sample_size: int) -> Dict:
+        return measure(self._entries, sample_size)
+
+    def get_metrics(self) -> Dict:
+        lookups = self.stats["hits"] + self.stats["misses"]
+        return {
+            **self.stats,
+            "enabled": self.enabled,
+            "entries": len(self._entries),
+            "threshold": self.threshold,
+            "hit_rate": round(self.stats["hits"] / lookups, 4) if lookups else 0.0
+        }
+
+
+# Global cache instance
+feedback_plan_cache = FeedbackPlanCache()
@@ -0,0 +1,202 @@
+"""
+Goal solver: required monthly investment and time to goal
+
+Answers "how much per month to reach X by year Y?" and "how long at this
+amount?" for a plan's risk mix without calling the LLM. Future values use the
+closed-form SIP formula (contributions at the start of each month, with an
+optional yearly step-up). The time to goal is found with a vectorized bisection
+over whole months. Every answer is computed for a full grid of return
+assumptions at once with numpy.
+"""
+
+import os
+import time
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from allocation_optimizer import ASSET_CLASSES, COVARIANCE, EXPECTED_RETURNS, RISK_LABEL_ASSET_CLASS, classify_asset
+from models import GoalSolveRequest, InvestmentPlan, RiskBreakdown
+
+SOLVE_MONTHLY = "monthly"
+SOLVE_TIME = "time"
+
+# Default return assumptions: the mix's expected return -3% to +3% in 0.5% steps
+DEFAULT_RETURN_OFFSETS = np.arange(-6, 7) * 0.005
+
+# Same order as the optimizer's EXPECTED_RETURNS and COVARIANCE
+_ASSET_INDEX = {name: index for index, name in enumerate(ASSET_CLASSES)}
+
+
+def asset_weights(plan: Optional[InvestmentPlan], breakdown: Optional[RiskBreakdown]) -> np.ndarray:
+    """Weights over the asset classes, from a plan's options or a bare risk breakdown"""
+    weights = np.zeros(len(EXPECTED_RETURNS))
+    if plan is not None and plan.options:
+        for option in plan.options:
+            weights[_ASSET_INDEX[classify_asset(option)]] += max(option.percentage, 0)
+    elif breakdown is not None:
+        for label, share in (("High", breakdown.high), ("Medium", breakdown.medium), ("Low", breakdown.low)):
+            weights[_ASSET_INDEX[RISK_LABEL_ASSET_CLASS[label]]] += max(share, 0)
+    total = weights.sum()
+    if total <= 0:
+        raise ValueError("A plan or a risk breakdown with a positive allocation is required")
+    return weights / total
+
+
+def _annuity(growth: np.ndarray, months) -> np.ndarray:
+    """Value after `months` of 1-per-month contributions made at the start of each month"""
+    near_zero = np.isclose(growth, 1.0)
+    safe = np.where(near_zero, 2.0, growth)
+    return np.where(near_zero, months, safe * (safe ** months - 1) / (safe - 1))
+
+
+def _geometric(ratio: np.ndarray, count) -> np.ndarray:
+    """1 + ratio + ... + ratio ** (count - 1)"""
+    near_one = np.isclose(ratio, 1.0)
+    safe = np.where(near_one, 2.0, ratio)
+    return np.where(near_one, count, (1 - safe ** count) / (1 - safe))
+
+
+def contribution_factor(growth: np.ndarray, months: np.ndarray, step_up: float) -> np.ndarray:
+    """Future value of 1/month for `months` months, raised by step_up every 12 months"""
+    years, remainder = np.divmod(months, 12)
+    year_growth = growth ** 12
+    raise_factor = 1 + step_up
+    full_years = (
+        _annuity(growth, 12) * growth ** remainder * year_growth ** (years - 1)
+        * _geometric(raise_factor / year_growth, years)
+    )
+    return full_years + raise_factor ** years * _annuity(growth, remainder)
+
+
+def future_value(growth, months, monthly, current, step_up: float) -> np.ndarray:
+    return current * growth ** months + monthly * contribution_factor(growth, months, step_up)
+
+
+def _as_table(values: np.ndarray, decimals: Optional[int]) -> List[List]:
+    """Nested lists for JSON; unreachable (NaN) cells become null"""
+    rounded = np.round(values, decimals) if decimals is not None else values
+    return [
+        [None if np.isnan(cell) else (float(cell) if decimals else int(cell)) for cell in row]
+        for row in rounded
+    ]
+
+
+class GoalSolver:
+    """Solves contribution and time-to-goal grids over return assumptions"""
+
+    def __init__(self):
+        self.max_years = int(os.getenv("GOAL_SOLVER_MAX_YEARS", "50"))
+        self.max_cells = int(os.getenv("GOAL_SOLVER_MAX_GRID", "10000"))
+        self.stats = {"solves": 0, "cells": 0, "total_ms": 0.0}
+
+    def _return_grid(self, request: GoalSolveRequest, expected: float) -> np.ndarray:
+        if request.annualReturns:
+            returns = np.array(request.annualReturns, dtype=float) / 100
+        else:
+            returns = np.round(expected + DEFAULT_RETURN_OFFSETS, 4)
+        if np.any(returns <= -1):
+            raise ValueError("Annual returns must be above -100%")
+        return returns
+
+    def required_monthly(self, growth: np.ndarray, months: np.ndarray, target: float, current: float, step_up: float) -> np.ndarray:
+        """Closed form: contribution whose future value closes the gap left by current savings"""
+        gap = np.maximum(target - current * growth ** months, 0)
+        return gap / contribution_factor(growth, months, step_up)
+
+    def months_to_goal(self, growth: np.ndarray, monthly: np.ndarray, target: float, current: float, step_up: float) -> np.ndarray:
+        """Bisection on whole months, run for every grid cell at once; NaN when out of reach"""
+        growth, monthly = np.broadcast_arrays(growth, monthly)
+        max_months = self.max_years * 12
+        low = np.zeros(growth.shape, dtype=np.int64)
+        high = np.full(growth.shape, max_months, dtype=np.int64)
+        if current >= target:
+            return np.zeros(growth.shape)
+        reachable = future_value(growth, high, monthly, current, step_up) >= target
+
+        while np.any(high - low > 1):
+            middle = (low + high) // 2
+            reached = future_value(growth, middle, monthly, current, step_up) >= target
+            high = np.where(reached, middle, high)
+            low = np.where(reached, low, middle)
+
+        result = high.astype(float)
+        result[~reachable] = np.nan
+        return result
+
+    def solve(self, request: GoalSolveRequest, plan: Optional[InvestmentPlan] = None) -> Dict:
+        """Grid of required monthly amounts (per horizon) or months to goal (per monthly amount)"""
+        started = time.perf_counter()
+        if request.targetAmount <= 0:
+            raise ValueError("targetAmount must be positive")
+        if request.solveFor not in (SOLVE_MONTHLY, SOLVE_TIME):
+            raise ValueError(f"solveFor must be '{SOLVE_MONTHLY}' or '{SOLVE_TIME}'")
+
+        weights = asset_weights(plan, request.riskBreakdown or (plan.riskBreakdown if plan else None))
+        expected = float(weights @ EXPECTED_RETURNS)
+        volatility = float(np.sqrt(weights @ COVARIANCE @ weights))
+        returns = self._return_grid(request, expected)
+        growth = (1 + returns) ** (1 / 12)
+        step_up = request.annualStepUp / 100
+        current = float(max(request.currentSavings, 0))
+
+        if request.solveFor == SOLVE_MONTHLY:
+            horizons = np.array(request.years or [], dtype=float)
+            if not len(horizons) or np.any(horizons <= 0) or np.any(horizons > self.max_years):
+                raise ValueError(f"years must list horizons between 0 and {self.max_years}")
+            columns = np.maximum(np.rint(horizons * 12), 1).astype(np.int64)
+        else:
+            amounts = request.monthlyAmounts or ([plan.monthlyInvestment] if plan else [])
+            columns = np.array(amounts, dtype=float)
+            if not len(columns) or np.any(columns < 0):
+                raise ValueError("monthlyAmounts must list non-negative amounts (or pass a planId)")
+
+        if len(returns) * len(columns) > self.max_cells:
+            raise ValueError(f"Grid is limited to {self.max_cells} cells")
+
+        grid_growth = growth[:, None]
+        if request.solveFor == SOLVE_MONTHLY:
+            # Round up to the cent so the amount always reaches the target
+            monthly = np.ceil(self.required_monthly(grid_growth, columns[None, :], request.targetAmount, current, step_up) * 100) / 100
+            contributed = monthly * contribution_factor(np.ones(1), columns[None, :], step_up)
+            result = {
+                "years": horizons.tolist(),
+                "requiredMonthly": _as_table(monthly, 2),
+                "totalContributed": _as_table(contributed, 2)
+            }
+        else:
+            months = self.months_to_goal(grid_growth, columns[None, :], request.targetAmount, current, step_up)
+            result = {
+                "monthlyAmounts": columns.tolist(),
+                "monthsToGoal": _as_table(months, None)
+            }
+
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        self.stats["solves"] += 1
+        self.stats["cells"] += len(returns) * len(columns)
+        self.stats["total_ms"] += elapsed_ms
+        return {
+            "solveFor": request.solveFor,
+            "targetAmount": request.targetAmount,
+            "currentSavings": current,
+            "annualStepUp": request.annualStepUp,
+            "portfolio": {
+                "expectedReturn": round(expected * 100, 2),
+                "volatility": round(volatility * 100, 2),
+            },
+            "annualReturns": np.round(returns * 100, 2).tolist(),
+            **result,
+            "elapsedMs": round(elapsed_ms, 3)
+        }
+
+    def get_metrics(self) -> Dict:
+        solves = self.stats["solves"]
+        return {
+            "solves": solves,
+            "cells": self.stats["cells"],
+            "avg_ms": round(self.stats["total_ms"] / solves, 3) if solves else 0.0
+        }
+
+
+# Global solver instance
+goal_solver = GoalSolver()
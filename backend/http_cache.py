@@ -0,0 +1,119 @@
+"""
+HTTP caching helpers: content-derived strong ETags, If-None-Match handling and
+gzip/brotli negotiation for JSON responses
+"""
+
+import gzip
+import hashlib
+import os
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+from fastapi import Request
+from fastapi.responses import Response
+
+from memory_report import measure
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Plans can be re-saved under the same ID and listings change, so clients must
+# revalidate every time but can reuse the body on 304
+REVALIDATE_CACHE_CONTROL = "no-cache"
+
+COMPRESSION_MIN_BYTES = int(os.getenv("COMPRESSION_MIN_BYTES", "1024"))
+_COMPRESSED_CACHE_SIZE = int(os.getenv("COMPRESSED_CACHE_SIZE", "1024"))
+_ENCODING_SUFFIX = {"br": "-br", "gzip": "-gz"}
+
+# Compressed bodies keyed by (etag, encoding); bodies are immutable for a given ETag
+_compressed_cache: "OrderedDict[Tuple[str, str], bytes]" = OrderedDict()
+
+
+def etag_for(content: bytes) -> str:
+    """Strong ETag derived from the response body"""
+    return f'"{hashlib.blake2b(content, digest_size=16).hexdigest()}"'
+
+
+def _matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Weak comparison as required for If-None-Match, ignoring encoding suffixes"""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    opaque = etag.strip('"')
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate.startswith("W/"):
+            candidate = candidate[2:]
+        candidate = candidate.strip('"')
+        for suffix in _ENCODING_SUFFIX.values():
+            if candidate.endswith(suffix):
+                candidate = candidate[:-len(suffix)]
+        if candidate == opaque:
+            return True
+    return False
+
+
+def _negotiate_encoding(accept_encoding: Optional[str]) -> Optional[str]:
+    """Pick brotli when the client and server support it, otherwise gzip"""
+    if not accept_encoding:
+        return None
+    accepted = {
+        part.split(";")[0].strip().lower()
+        for part in accept_encoding.split(",")
+        if not part.strip().endswith("q=0")
+    }
+    if "br" in accepted and brotli is not None:
+        return "br"
+    if "gzip" in accepted:
+        return "gzip"
+    return None
+
+
+def _compress(content: bytes, encoding: str, etag: str) -> bytes:
+    key = (etag, encoding)
+    cached = _compressed_cache.get(key)
+    if cached is not None:
+        _compressed_cache.move_to_end(key)
+        return cached
+
+    if encoding == "br":
+        body = brotli.compress(content, quality=5)
+    else:
+        body = gzip.compress(content, compresslevel=6)
+
+    _compressed_cache[key] = body
+    if len(_compressed_cache) > _COMPRESSED_CACHE_SIZE:
+        _compressed_cache.popitem(last=False)
+    return body
+
+
+def compressed_cache_memory_usage(sample_size: int) -> Dict:
+    """Size of the compressed-body LRU"""
+    return measure(_compressed_cache, sample_size)
+
+
+def cached_json_response(request: Request, content: bytes, cache_control: str) -> Response:
+    """Serve encoded JSON with an ETag, answering 304 when the client already has it"""
+    etag = etag_for(content)
+    encoding = None
+    if len(content) >= COMPRESSION_MIN_BYTES:
+        encoding = _negotiate_encoding(request.headers.get("accept-encoding"))
+
+    headers = {
+        # Each encoding is a distinct representation, so it gets its own ETag
+        "ETag": f'"{etag[1:-1]}{_ENCODING_SUFFIX[encoding]}"' if encoding else etag,
+        "Cache-Control": cache_control,
+        "Vary": "Accept-Encoding"
+    }
+
+    if _matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+
+    if encoding:
+        content = _compress(content, encoding, etag)
+        headers["Content-Encoding"] = encoding
+
+    return Response(content=content, media_type="application/json", headers=headers)
@@ -2,119 +2,30 @@
 AI-Powered Investment Plan Generation Service
 Generates personalized investment plans using AI analysis
 """
-import json
+import os
 import asyncio
+import threading
+import orjson
 from datetime import datetime
-from typing import Dict, List, Optional
-from models import InvestmentPlan, InvestmentOption, RiskBreakdown
-from ai_service import ai_service
+from typing import Dict, List, Optional, Union
+from pydantic import ValidationError
+from models import InvestmentPlan, InvestmentOption, RiskBreakdown, AIPlanResponse, AIPlanPatch
+from ai_service import ai_service, estimate_tokens
+from storage import new_id
+from profile_record import ProfileRecord, RiskLevel, RiskComfort, GoalType, ExperienceLevel
+from allocation_optimizer import allocate_amounts, allocation_optimizer, breakdown_for
+from llm_telemetry import llm_telemetry
 
-class InvestmentPlanService:
-    def __init__(self):
-        self.color_palette = {
-            "primary": "#336699",      # Lapis Lazuli
-            "secondary": "#86BBD8",    # Carolina Blue  
-            "success": "#9EE493",      # Light Green
-            "charcoal": "#2F4858",     # Charcoal
-            "nyanza": "#DAF7DC",       # Nyanza
-            "mid_blue": "#6B8CAE"      # Mid-tone blue
-        }
-
-    def generate_plan(self, profile_data: Dict, feedback: Optional[str] = None) -> InvestmentPlan:
-        """Generate an AI-powered investment plan based on user profile"""
-        
-        # Use asyncio to call async AI function
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
-        try:
-            plan = loop.run_until_complete(self.generate_ai_plan(profile_data, feedback))
-            return plan
-        finally:
-            loop.close()
-    
-    async def generate_ai_plan(self, profile_data: Dict, feedback: Optional[str] = None) -> InvestmentPlan:
-        """Generate investment plan using AI analysis"""
-        
-        # Extract profile data
-        monthly_investment = self._parse_amount(profile_data.get("monthly_investment", "5000"))
-        risk_tolerance = profile_data.get("risk_tolerance", "")
-        preference = profile_data.get("preference", "")
-        goal = profile_data.get("goal", "")
-        age = profile_data.get("age", "30")
-        income = profile_data.get("income", "")
-        experience = profile_data.get("experience", "")
-        
-        # Create AI prompt for investment analysis
-        ai_prompt = self._create_investment_prompt(
-            monthly_investment, risk_tolerance, preference, goal, 
-            age, income, experience, feedback
-        )
-        
-        # Get AI-generated investment plan
-        ai_response = await ai_service.chat(ai_prompt)
-        
-        # Parse AI response to create structured investment plan
-        plan = self._parse_ai_response(ai_response.message, monthly_investment, risk_tolerance, goal)
-        
-        return plan
-
-    def _parse_amount(self, amount_str: str) -> int:
-        """Parse amount string to integer with proper logic"""
-        if not amount_str or amount_str == "undefined":
-            return 5000
-            
-        amount_str = amount_str.lower().strip()
-        
-        # Handle range selections properly
-        if "$100-500" in amount_str:
-            return 300  # Average of range
-        elif "$500-1000" in amount_str or "$500-1,000" in amount_str:
-            return 750  # Average of range
-        elif "$1000-2000" in amount_str or "$1,000-2,000" in amount_str:
-            return 1500  # Average of range
-        elif "more than $2000" in amount_str or "more than $2,000" in amount_str:
-            return 3000  # Conservative estimate
-        
-        # Extract first number found if direct amount
-        import re
-        numbers = re.findall(r'\d+', amount_str.replace(',', ''))
-        if numbers:
-            return int(numbers[0])
-            
-        return 5000  # Default fallback
-
-    def _create_investment_prompt(
-        self, 
-        monthly_investment: int, 
-        risk_tolerance: str, 
-        preference: str, 
-        goal: str,
-        age: str,
-        income: str,
-        experience: str,
-        feedback: Optional[str] = None
-    ) -> str:
-        """Create AI prompt for personalized investment analysis"""
-        
-        # Create risk-specific guidance for AI
-        risk_guidance = self._get_risk_specific_guidance(risk_tolerance, age, goal)
-        
-        prompt = f"""
-You are an expert financial advisor AI. Create a HIGHLY PERSONALIZED investment plan that PRIMARILY considers the client's FINANCIAL GOAL, then balances with risk tolerance.
+# Static plan instructions. Identical for every request, so they are sent once as the
+# model's system instruction (or cached context) instead of being rebuilt per prompt.
+PLAN_SYSTEM_INSTRUCTION = """You are an expert financial advisor AI. Create a HIGHLY PERSONALIZED investment plan that PRIMARILY considers the client's FINANCIAL GOAL, then balances with risk tolerance.
 
 CRITICAL: Investment strategy must FIRST match the GOAL, then adjust for risk comfort. Different goals require completely different approaches regardless of risk tolerance.
 
-Client Profile:
-- Monthly Investment Amount: ${monthly_investment:,} USD
-- Age: {age} years
-- PRIMARY FINANCIAL GOAL: {goal} ⭐ (THIS DRIVES THE STRATEGY)
-- Risk Tolerance: {risk_tolerance} (secondary consideration)
-- Investment Preference: {preference}
-- Income Level: {income}
-- Investment Experience: {experience}
-{f"- Additional Feedback: {feedback}" if feedback else ""}
-
-{risk_guidance}
+RISK PROFILES:
+- AGGRESSIVE: wants HIGH RETURNS, handles HIGH VOLATILITY. 60-80% high-risk; growth stocks, small-cap funds, sector ETFs, crypto; max 20% in bonds/FDs
+- CONSERVATIVE: prioritizes CAPITAL SAFETY. 60-80% low-risk; government bonds, FDs, debt funds, blue-chip dividend stocks; max 20% in stocks
+- MODERATE: BALANCED growth. 40-50% medium-risk; diversified mutual funds, index funds, large-cap stocks
 
 GOAL-BASED STRATEGY RULES:
 1. EMERGENCY FUND: Always conservative (80% low risk) - liquidity is key, not growth
@@ -123,7 +34,7 @@ GOAL-BASED STRATEGY RULES:
    - Long-term (5+ years): Can be more aggressive
 3. RETIREMENT: Age-based allocation
    - Under 35: Can be aggressive (60% high risk) even if moderate risk tolerance
-   - 35-50: Balanced approach 
+   - 35-50: Balanced approach
    - Over 50: Conservative regardless of stated risk tolerance
 4. WEALTH BUILDING: Risk tolerance becomes primary factor
 
@@ -135,20 +46,11 @@ INVESTMENT SELECTION RULES:
 - RETIREMENT (older): Large-cap, balanced funds, debt funds
 - WEALTH BUILDING: Based on risk tolerance
 
-PERSONALIZATION FACTORS:
-- Age: {self._get_age_guidance(age)}
-- Goal Timeline: {self._get_goal_guidance(goal)}
-- Risk Mapping: {self._get_risk_mapping(risk_tolerance)}
-
 Respond in this exact JSON format:
-{{
-  "riskAllocation": {{
-    "high": <percentage_based_on_goal_first_then_risk>,
-    "medium": <percentage_based_on_goal_first_then_risk>, 
-    "low": <percentage_based_on_goal_first_then_risk>
-  }},
+{
+  "riskAllocation": {"high": <percentage_based_on_goal_first_then_risk>, "medium": <percentage>, "low": <percentage>},
   "investments": [
-    {{
+    {
       "type": "<investment_type_matching_goal>",
       "name": "<specific_Indian_fund_or_instrument>",
       "amount": <amount_in_rupees>,
@@ -156,167 +58,514 @@ Respond in this exact JSON format:
       "risk": "<High/Medium/Low>",
       "holdingPeriod": "<duration_matching_goal>",
       "reason": "<explanation_why_this_fits_GOAL_and_risk_profile>"
-    }}
+    }
   ]
-}}
+}
 
-REMEMBER: The same person with different goals should get COMPLETELY different plans. Goal drives strategy first, risk tolerance adjusts within that framework!
-"""
-        return prompt
+REMEMBER: The same person with different goals should get COMPLETELY different plans. Goal drives strategy first, risk tolerance adjusts within that framework!"""
+
+# JSON schema for structured-output mode, mirroring AIPlanResponse
+_INVESTMENT_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "type": {"type": "string"},
+        "name": {"type": "string"},
+        "amount": {"type": "integer"},
+        "percentage": {"type": "integer"},
+        "risk": {"type": "string", "enum": ["High", "Medium", "Low"]},
+        "holdingPeriod": {"type": "string"},
+        "reason": {"type": "string"}
+    },
+    "required": ["type", "name", "amount", "percentage", "risk", "holdingPeriod", "reason"]
+}
+
+PLAN_RESPONSE_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "riskAllocation": {
+            "type": "object",
+            "properties": {
+                "high": {"type": "integer"},
+                "medium": {"type": "integer"},
+                "low": {"type": "integer"}
+            },
+            "required": ["high", "medium", "low"]
+        },
+        "investments": {"type": "array", "items": _INVESTMENT_SCHEMA},
+        "timeline": {"type": "string"},
+        "expectedReturn": {"type": "string"},
+        "recommendations": {"type": "array", "items": {"type": "string"}}
+    },
+    "required": ["riskAllocation", "investments"]
+}
 
-    def _get_risk_specific_guidance(self, risk_tolerance: str, age: str, goal: str) -> str:
-        """Get specific guidance based on risk tolerance"""
-        risk_lower = risk_tolerance.lower()
+# Per-profile section of the plan prompt, defined once and filled per request
+PLAN_PROFILE_TEMPLATE = """Client Profile:
+- Monthly: ${monthly_investment:,} USD
+- Age: {age}
+- GOAL (drives strategy): {goal}
+- Risk Tolerance: {risk_tolerance}
+- Preference: {preference}
+- Income: {income}
+- Experience: {experience}{feedback_line}
+Risk Profile: {risk_profile}
+Age Guidance: {age_guidance}
+Goal Timeline: {goal_guidance}
+Risk Mapping: {risk_mapping}"""
+
+# Static instructions for refining an existing plan from feedback
+REFINE_SYSTEM_INSTRUCTION = """You are an expert financial advisor AI adjusting an existing investment plan to client feedback.
+You receive the current allocation as numbered rows and the feedback. Return ONLY the changes as JSON:
+{
+  "update": [{"index": <row>, "<changed field>": <new value>}],
+  "remove": [<row>],
+  "add": [{"type": "...", "name": "...", "amount": <amount>, "percentage": <percentage>, "risk": "<High/Medium/Low>", "holdingPeriod": "...", "reason": "..."}],
+  "riskAllocation": {"high": <percentage>, "medium": <percentage>, "low": <percentage>}
+}
+Leave rows the feedback does not concern untouched. Percentages of the resulting plan must total 100."""
+
+PLAN_PATCH_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "update": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {
+                    "index": {"type": "integer"},
+                    "type": {"type": "string"},
+                    "name": {"type": "string"},
+                    "amount": {"type": "integer"},
+                    "percentage": {"type": "integer"},
+                    "reason": {"type": "string"},
+                    "holdingPeriod": {"type": "string"},
+                    "risk": {"type": "string", "enum": ["High", "Medium", "Low"]}
+                },
+                "required": ["index"]
+            }
+        },
+        "remove": {"type": "array", "items": {"type": "integer"}},
+        "add": {"type": "array", "items": _INVESTMENT_SCHEMA},
+        "riskAllocation": PLAN_RESPONSE_SCHEMA["properties"]["riskAllocation"]
+    }
+}
+
+REFINE_PROMPT_TEMPLATE = """Client: ${monthly_investment:,} monthly, goal {goal}, risk {risk_tolerance}
+Current allocation (row | risk | type | name | % | amount | holding):
+{rows}
+Risk split: high {high} / medium {medium} / low {low}
+Feedback: {feedback}"""
+
+GOAL_GUIDANCE = {
+    GoalType.RETIREMENT: "Long-term goal - can handle market volatility for better returns",
+    GoalType.HOUSE: "Medium-term goal - balanced approach with some safety",
+    GoalType.EMERGENCY: "Safety-first approach - prioritize liquidity and capital preservation",
+    GoalType.WEALTH: "Growth-focused - can take higher risks for wealth building"
+}
+
+RISK_COMFORT_MAPPING = {
+    RiskComfort.VERY_CONCERNED: "Conservative investor - prioritize capital safety",
+    RiskComfort.SOMEWHAT_WORRIED: "Moderate-conservative investor - limited risk acceptable",
+    RiskComfort.NOT_TOO_BOTHERED: "Moderate investor - balanced approach to risk/reward",
+    RiskComfort.COMPLETELY_FINE: "Moderate-aggressive investor - comfortable with volatility for growth",
+    RiskComfort.AGGRESSIVE: "Aggressive investor - maximum growth focus",
+    RiskComfort.UNSPECIFIED: "Moderate investor - balanced risk approach"
+}
+
+class InvestmentPlanService:
+    def __init__(self):
+        self.color_palette = {
+            "primary": "#336699",      # Lapis Lazuli
+            "secondary": "#86BBD8",    # Carolina Blue  
+            "success": "#9EE493",      # Light Green
+            "charcoal": "#2F4858",     # Charcoal
+            "nyanza": "#DAF7DC",       # Nyanza
+            "mid_blue": "#6B8CAE"      # Mid-tone blue
+        }
         
-        if "aggressive" in risk_lower or "high" in risk_lower:
-            return """
-RISK PROFILE: AGGRESSIVE INVESTOR
-- This client wants HIGH RETURNS and can handle HIGH VOLATILITY
-- Allocate 60-80% to high-risk investments
-- Focus on growth stocks, small-cap funds, sector ETFs, crypto
-- Minimize safe investments (max 20% in bonds/FDs)
-"""
-        elif "conservative" in risk_lower or "low" in risk_lower:
-            return """
-RISK PROFILE: CONSERVATIVE INVESTOR  
-- This client prioritizes CAPITAL SAFETY over high returns
-- Allocate 60-80% to low-risk investments
-- Focus on government bonds, FDs, debt funds, blue-chip dividend stocks
-- Minimize high-risk investments (max 20% in stocks)
-"""
+        # Ask Gemini for JSON constrained to PLAN_RESPONSE_SCHEMA
+        self.structured_output = os.getenv("GEMINI_STRUCTURED_OUTPUT", "True").lower() == "true"
+        self.parse_stats = {
+            "total": 0,
+            "valid": 0,
+            "repaired": 0,
+            "failed": 0,
+            "empty": 0,
+            "repaired_fields": 0
+        }
+        self.refine_stats = {"patched": 0, "regenerated": 0}
+        self._sync_loops = threading.local()
+
+    def generate_plan(self, profile_data: Union[ProfileRecord, Dict], feedback: Optional[str] = None) -> InvestmentPlan:
+        """Generate an AI-powered investment plan based on user profile (synchronous callers only)"""
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            pass
         else:
-            return """
-RISK PROFILE: MODERATE INVESTOR
-- This client wants BALANCED growth with moderate risk
-- Allocate 40-50% to medium-risk investments
-- Focus on diversified mutual funds, index funds, large-cap stocks
-- Balance between safety and growth
-"""
+            raise RuntimeError("generate_plan cannot be called from a running event loop; await generate_ai_plan instead")
+        
+        # One long-lived loop per thread instead of a new loop for every call
+        loop = getattr(self._sync_loops, "loop", None)
+        if loop is None or loop.is_closed():
+            loop = asyncio.new_event_loop()
+            self._sync_loops.loop = loop
+        return loop.run_until_complete(self.generate_ai_plan(profile_data, feedback))
+    
+    def generate_fallback_plan(self, profile_data: Union[ProfileRecord, Dict]) -> InvestmentPlan:
+        """Deterministic plan from the profile alone, without calling Gemini"""
+        profile = profile_data if isinstance(profile_data, ProfileRecord) else ProfileRecord.from_dict(profile_data)
+        return self._create_fallback_plan(profile.amount, profile.risk_level, profile.goal_type)
+    
+    async def generate_ai_plan(self, profile_data: Union[ProfileRecord, Dict], feedback: Optional[str] = None) -> InvestmentPlan:
+        """Generate investment plan using AI analysis"""
+        
+        # Profiles are normalized when saved; plain dicts are normalized here
+        profile = profile_data if isinstance(profile_data, ProfileRecord) else ProfileRecord.from_dict(profile_data)
+        
+        # Create AI prompt for investment analysis
+        ai_prompt = self._create_investment_prompt(profile, feedback)
+        
+        print(
+            f"🧮 Plan prompt: ~{estimate_tokens(ai_prompt)} tokens per request "
+            f"(~{estimate_tokens(PLAN_SYSTEM_INSTRUCTION)} static tokens sent as system instruction)"
+        )
+        
+        # Get AI-generated investment plan; feedback regenerations are tracked separately
+        call_site = "plan_feedback" if feedback else "plan"
+        ai_response = await ai_service.generate(
+            ai_prompt,
+            system_instruction=PLAN_SYSTEM_INSTRUCTION,
+            response_schema=PLAN_RESPONSE_SCHEMA if self.structured_output else None,
+            call_site=call_site
+        )
+        
+        # Parse AI response to create structured investment plan
+        plan = self._parse_ai_response(ai_response.message, profile.amount, profile.risk_level, profile.goal_type, call_site)
+        
+        return plan
 
-    def _get_allocation_guidance(self, risk_tolerance: str) -> str:
-        """Get allocation guidance based on risk tolerance"""
-        risk_lower = risk_tolerance.lower()
+    async def refine_ai_plan(self, base_plan: InvestmentPlan, profile_data: Union[ProfileRecord, Dict], feedback: str) -> InvestmentPlan:
+        """Refine an existing plan from feedback by asking only for the changes"""
+
+        profile = profile_data if isinstance(profile_data, ProfileRecord) else ProfileRecord.from_dict(profile_data)
+        ai_prompt = self._create_refine_prompt(base_plan, profile, feedback)
+
+        print(f"🧮 Refine prompt: ~{estimate_tokens(ai_prompt)} tokens per request")
+
+        ai_response = await ai_service.generate(
+            ai_prompt,
+            system_instruction=REFINE_SYSTEM_INSTRUCTION,
+            response_schema=PLAN_PATCH_SCHEMA if self.structured_output else None,
+            call_site="plan_refine"
+        )
+
+        patch = self._parse_plan_patch(ai_response.message)
+        if patch is None and ai_response.message:
+            llm_telemetry.record_parse_failure("plan_refine")
+        plan = self._apply_plan_patch(base_plan, patch) if patch else None
+        if plan is None:
+            # Patch unusable; fall back to a full regeneration with the feedback
+            self.refine_stats["regenerated"] += 1
+            print("⚠️ Plan refinement could not be applied, regenerating full plan")
+            return await self.generate_ai_plan(profile, feedback)
+
+        self.refine_stats["patched"] += 1
+        return plan
+
+    def _create_refine_prompt(self, base_plan: InvestmentPlan, profile: ProfileRecord, feedback: str) -> str:
+        """Compact allocation of the base plan plus the requested change"""
+        rows = "\n".join(
+            f"{index} | {option.risk} | {option.type} | {option.name} | {option.percentage}% | {option.amount} | {option.holdingPeriod}"
+            for index, option in enumerate(base_plan.options)
+        )
+
+        return REFINE_PROMPT_TEMPLATE.format(
+            monthly_investment=base_plan.monthlyInvestment,
+            goal=profile.goal,
+            risk_tolerance=profile.risk_tolerance,
+            rows=rows,
+            high=base_plan.riskBreakdown.high,
+            medium=base_plan.riskBreakdown.medium,
+            low=base_plan.riskBreakdown.low,
+            feedback=feedback
+        )
+
+    def _parse_plan_patch(self, ai_content: str) -> Optional[AIPlanPatch]:
+        """Parse the AI's change set, strictly first and then leniently"""
+        if not ai_content or not ai_content.strip():
+            return None
+
+        try:
+            return AIPlanPatch.model_validate_json(ai_content, strict=True)
+        except ValidationError:
+            pass
+
+        patch_data = self._extract_json(ai_content)
+        if patch_data is None:
+            return None
+        try:
+            return AIPlanPatch.model_validate(patch_data)
+        except ValidationError as e:
+            print(f"Error parsing plan refinement: {e.error_count()} invalid fields")
+            return None
+
+    def _apply_plan_patch(self, base_plan: InvestmentPlan, patch: AIPlanPatch) -> Optional[InvestmentPlan]:
+        """Apply a change set to a plan; rows the patch does not touch are reused as-is"""
+        options = list(base_plan.options)
+
+        for change in patch.update:
+            if not 0 <= change.index < len(options):
+                continue
+            updates = change.model_dump(exclude={"index"}, exclude_none=True)
+            if "risk" in updates:
+                updates["color"] = self._get_risk_color(updates["risk"])
+            options[change.index] = options[change.index].model_copy(update=updates)
+
+        removed = set(patch.remove)
+        options = [option for index, option in enumerate(options) if index not in removed]
+        options.extend(
+            option.model_copy(update={"color": self._get_risk_color(option.risk)})
+            for option in patch.add
+        )
+        options = self._renormalize_options(options, base_plan.monthlyInvestment)
+        if not options:
+            return None
+
+        # The breakdown always follows the patched options, whatever riskAllocation the patch claimed
+        return base_plan.model_copy(update={
+            "options": options,
+            "riskBreakdown": breakdown_for(options),
+            "planId": new_id("ai_plan"),
+            "createdAt": datetime.now().isoformat()
+        })
+
+    def _renormalize_options(self, options: List[InvestmentOption], monthly_investment: int) -> List[InvestmentOption]:
+        """Scale percentages to sum to 100 and re-split the monthly amount; empty if nothing is allocated"""
+        total = sum(max(option.percentage, 0) for option in options)
+        if total <= 0:
+            return []
+        percentages = allocate_amounts(100, [max(option.percentage, 0) * 100 / total for option in options])
+        amounts = allocate_amounts(monthly_investment, percentages)
+        return [
+            option.model_copy(update={"percentage": percentage, "amount": amount})
+            for option, percentage, amount in zip(options, percentages, amounts)
+            if percentage > 0
+        ]
+
+    def _create_investment_prompt(self, profile: ProfileRecord, feedback: Optional[str] = None) -> str:
+        """Create the compact per-profile section of the plan prompt"""
         
-        if "aggressive" in risk_lower or "high" in risk_lower:
+        return PLAN_PROFILE_TEMPLATE.format(
+            monthly_investment=profile.amount,
+            age=profile.age,
+            goal=profile.goal,
+            risk_tolerance=profile.risk_tolerance,
+            preference=profile.preference,
+            income=profile.income,
+            experience=profile.experience,
+            feedback_line=f"\n- Feedback: {feedback}" if feedback else "",
+            risk_profile=self._get_risk_specific_guidance(profile.risk_level),
+            age_guidance=self._get_age_guidance(profile.age_years),
+            goal_guidance=self._get_goal_guidance(profile.goal_type),
+            risk_mapping=self._get_risk_mapping(profile.risk_comfort)
+        )
+
+    def _get_risk_specific_guidance(self, risk_level: RiskLevel) -> str:
+        """Get the risk profile name; the guidance for each profile lives in the system instruction"""
+        return risk_level.name
+
+    def _get_allocation_guidance(self, risk_level: RiskLevel) -> str:
+        """Get allocation guidance based on risk tolerance"""
+        if risk_level == RiskLevel.AGGRESSIVE:
             return "High Risk: 60-80%, Medium Risk: 15-25%, Low Risk: 5-20%"
-        elif "conservative" in risk_lower or "low" in risk_lower:
+        elif risk_level == RiskLevel.CONSERVATIVE:
             return "High Risk: 5-20%, Medium Risk: 15-25%, Low Risk: 60-80%"
         else:
             return "High Risk: 25-35%, Medium Risk: 40-50%, Low Risk: 20-30%"
 
-    def _get_age_guidance(self, age: str) -> str:
+    def _get_age_guidance(self, age_years: int) -> str:
         """Get age-specific guidance"""
-        try:
-            age_num = int(age)
-            if age_num < 30:
-                return "Young investor - can take more risks for long-term growth"
-            elif age_num < 50:
-                return "Mid-career - balance growth and stability" 
-            else:
-                return "Approaching retirement - focus on capital preservation"
-        except:
+        if not age_years:
             return "Consider age-appropriate risk allocation"
+        elif age_years < 30:
+            return "Young investor - can take more risks for long-term growth"
+        elif age_years < 50:
+            return "Mid-career - balance growth and stability" 
+        else:
+            return "Approaching retirement - focus on capital preservation"
 
-    def _get_goal_guidance(self, goal: str) -> str:
+    def _get_goal_guidance(self, goal_type: GoalType) -> str:
         """Get goal-specific guidance"""
-        goal_lower = goal.lower()
-        if "retirement" in goal_lower:
-            return "Long-term goal - can handle market volatility for better returns"
-        elif "house" in goal_lower or "home" in goal_lower:
-            return "Medium-term goal - balanced approach with some safety"
-        elif "emergency" in goal_lower:
-            return "Safety-first approach - prioritize liquidity and capital preservation"
-        elif "wealth" in goal_lower or "growth" in goal_lower:
-            return "Growth-focused - can take higher risks for wealth building"
-        else:
-            return "Align investment risk with goal timeline"
+        return GOAL_GUIDANCE.get(goal_type, "Align investment risk with goal timeline")
 
-    def _get_experience_guidance(self, experience: str) -> str:
+    def _get_experience_guidance(self, experience_level: ExperienceLevel) -> str:
         """Get experience-specific guidance"""
-        exp_lower = experience.lower()
-        if "beginner" in exp_lower or "new" in exp_lower:
+        if experience_level == ExperienceLevel.BEGINNER:
             return "New investor - start with diversified, low-cost options"
-        elif "experienced" in exp_lower or "advanced" in exp_lower:
+        elif experience_level == ExperienceLevel.ADVANCED:
             return "Experienced investor - can handle complex instruments and sector bets"
         else:
             return "Intermediate investor - balanced approach with some focused bets"
 
-    def _get_risk_mapping(self, risk_tolerance: str) -> str:
+    def _get_risk_mapping(self, risk_comfort: RiskComfort) -> str:
         """Map risk tolerance responses to actual risk levels"""
-        risk_lower = risk_tolerance.lower()
-        if "very concerned" in risk_lower:
-            return "Conservative investor - prioritize capital safety"
-        elif "somewhat worried" in risk_lower:
-            return "Moderate-conservative investor - limited risk acceptable"
-        elif "not too bothered" in risk_lower:
-            return "Moderate investor - balanced approach to risk/reward"
-        elif "completely fine" in risk_lower:
-            return "Moderate-aggressive investor - comfortable with volatility for growth"
-        elif "aggressive" in risk_lower:
-            return "Aggressive investor - maximum growth focus"
-        else:
-            return "Moderate investor - balanced risk approach"
+        return RISK_COMFORT_MAPPING[risk_comfort]
 
-    def _parse_ai_response(self, ai_content: str, monthly_investment: int, risk_tolerance: str = "moderate", goal: str = "wealth building") -> InvestmentPlan:
+    def _parse_ai_response(self, ai_content: str, monthly_investment: int, risk_level: RiskLevel = RiskLevel.MODERATE, goal_type: GoalType = GoalType.WEALTH, call_site: Optional[str] = None) -> InvestmentPlan:
         """Parse AI response and create structured investment plan"""
         
+        # Every response counts, including empty or blocked ones
+        self.parse_stats["total"] += 1
+        if not ai_content or not ai_content.strip():
+            self.parse_stats["empty"] += 1
+            return self._create_fallback_plan(monthly_investment, risk_level, goal_type)
+        
+        # Fast path: strict validation of schema-constrained output
         try:
-            # Try to extract JSON from AI response
+            ai_plan = AIPlanResponse.model_validate_json(ai_content, strict=True)
+            self.parse_stats["valid"] += 1
+            return self._build_plan(ai_plan, monthly_investment, risk_level, goal_type)
+        except ValidationError:
+            pass
+        
+        # Repair path: keep every field that validates and only patch the failing ones
+        ai_data = self._extract_json(ai_content)
+        if ai_data is not None:
+            ai_plan = self._repair_ai_plan(ai_data, monthly_investment)
+            if ai_plan is not None:
+                self.parse_stats["repaired"] += 1
+                return self._build_plan(ai_plan, monthly_investment, risk_level, goal_type)
+        
+        self.parse_stats["failed"] += 1
+        if call_site:
+            llm_telemetry.record_parse_failure(call_site)
+        print(f"Error parsing AI response: no usable plan in {len(ai_content)} chars")
+        
+        # Fallback: Create a basic plan if AI parsing fails
+        return self._create_fallback_plan(monthly_investment, risk_level, goal_type)
+
+    def _extract_json(self, ai_content: str) -> Optional[Dict]:
+        """Load the JSON object from an AI response, tolerating surrounding prose"""
+        try:
+            ai_data = orjson.loads(ai_content)
+        except orjson.JSONDecodeError:
             json_start = ai_content.find('{')
             json_end = ai_content.rfind('}') + 1
-            
-            if json_start != -1 and json_end != -1:
-                json_str = ai_content[json_start:json_end]
-                ai_data = json.loads(json_str)
-                
-                # Extract risk allocation
-                risk_allocation = ai_data.get("riskAllocation", {"high": 30, "medium": 40, "low": 30})
-                
-                # Create investment options from AI data
-                options = []
-                for inv in ai_data.get("investments", []):
-                    # Assign colors based on risk level
-                    color = self._get_risk_color(inv.get("risk", "Medium"))
-                    
-                    options.append(InvestmentOption(
-                        type=inv.get("type", "Mixed Investment"),
-                        name=inv.get("name", "AI Selected Investment"),
-                        amount=inv.get("amount", monthly_investment // len(ai_data.get("investments", [1]))),
-                        percentage=inv.get("percentage", 100 // len(ai_data.get("investments", [1]))),
-                        reason=inv.get("reason", "AI-generated personalized investment recommendation"),
-                        holdingPeriod=inv.get("holdingPeriod", "1-3 years"),
-                        risk=inv.get("risk", "Medium"),
-                        color=color
-                    ))
-                
-                # Create plan ID
-                plan_id = f"ai_plan_{int(datetime.now().timestamp())}"
-                
-                return InvestmentPlan(
-                    totalAmount=monthly_investment,
-                    monthlyInvestment=monthly_investment,
-                    options=options,
-                    riskBreakdown=RiskBreakdown(
-                        high=risk_allocation.get("high", 30),
-                        medium=risk_allocation.get("medium", 40),
-                        low=risk_allocation.get("low", 30)
-                    ),
-                    timeline=ai_data.get("timeline", "3-5 years"),
-                    expectedReturn=ai_data.get("expectedReturn", "8-12%"),
-                    recommendations=ai_data.get("recommendations", [
-                        "Review and rebalance portfolio quarterly",
-                        "Consider increasing investment amount annually",
-                        "Monitor performance and adjust strategy as needed"
-                    ]),
-                    planId=plan_id,
-                    createdAt=datetime.now().isoformat()
-                )
-                
-        except (json.JSONDecodeError, KeyError, ValueError) as e:
-            print(f"Error parsing AI response: {e}")
-            
-        # Fallback: Create a basic plan if AI parsing fails
-        return self._create_fallback_plan(monthly_investment, risk_tolerance, goal)
+            if json_start == -1 or json_end <= json_start:
+                return None
+            try:
+                ai_data = orjson.loads(ai_content[json_start:json_end])
+            except orjson.JSONDecodeError:
+                return None
+        
+        return ai_data if isinstance(ai_data, dict) else None
+
+    def _repair_ai_plan(self, ai_data: Dict, monthly_investment: int) -> Optional[AIPlanResponse]:
+        """Rebuild an AI plan from partially valid data, replacing only the invalid fields"""
+        raw_investments = ai_data.get("investments")
+        if not isinstance(raw_investments, list) or not raw_investments:
+            return None
+        
+        count = len(raw_investments)
+        investment_defaults = {
+            "type": "Mixed Investment",
+            "name": "AI Selected Investment",
+            "amount": monthly_investment // count,
+            "percentage": 100 // count,
+            "reason": "AI-generated personalized investment recommendation",
+            "holdingPeriod": "1-3 years",
+            "risk": "Medium"
+        }
+        investments = []
+        for item in raw_investments:
+            if isinstance(item, dict):
+                option = self._repair_fields(InvestmentOption, item, investment_defaults)
+                if option is not None:
+                    investments.append(option)
+        if not investments:
+            return None
+        
+        risk_allocation = ai_data.get("riskAllocation")
+        risk_breakdown = self._repair_fields(
+            RiskBreakdown,
+            risk_allocation if isinstance(risk_allocation, dict) else {},
+            {"high": 30, "medium": 40, "low": 30}
+        )
+        
+        return self._repair_fields(
+            AIPlanResponse,
+            {
+                **ai_data,
+                "riskAllocation": risk_breakdown.model_dump(),
+                "investments": [option.model_dump() for option in investments]
+            },
+            {"timeline": None, "expectedReturn": None, "recommendations": None}
+        )
+
+    def _repair_fields(self, model_cls, data: Dict, defaults: Dict):
+        """Validate data against a model, swapping each failing field for its default"""
+        try:
+            return model_cls.model_validate(data)
+        except ValidationError as e:
+            repaired = dict(data)
+            for error in e.errors():
+                field = error["loc"][0] if error["loc"] else None
+                if field in defaults:
+                    repaired[field] = defaults[field]
+                else:
+                    repaired.pop(field, None)
+                self.parse_stats["repaired_fields"] += 1
+            try:
+                return model_cls.model_validate(repaired)
+            except ValidationError:
+                return None
+
+    def _build_plan(self, ai_plan: AIPlanResponse, monthly_investment: int, risk_level: RiskLevel = RiskLevel.MODERATE, goal_type: GoalType = GoalType.WEALTH) -> InvestmentPlan:
+        """Create an investment plan from validated AI output"""
+        # Assign colors based on risk level
+        options = [
+            option.model_copy(update={"color": self._get_risk_color(option.risk)})
+            for option in ai_plan.investments
+        ]
+        risk_breakdown = ai_plan.riskAllocation
+        
+        # Check the AI allocation adds up and fits the profile's risk band
+        if allocation_optimizer.enabled:
+            options, risk_breakdown = allocation_optimizer.check(options, monthly_investment, risk_level, goal_type)
+        
+        # Create plan ID
+        plan_id = new_id("ai_plan")
+        
+        return InvestmentPlan(
+            totalAmount=monthly_investment,
+            monthlyInvestment=monthly_investment,
+            options=options,
+            riskBreakdown=risk_breakdown,
+            timeline=ai_plan.timeline or "3-5 years",
+            expectedReturn=ai_plan.expectedReturn or "8-12%",
+            recommendations=ai_plan.recommendations or [
+                "Review and rebalance portfolio quarterly",
+                "Consider increasing investment amount annually",
+                "Monitor performance and adjust strategy as needed"
+            ],
+            planId=plan_id,
+            createdAt=datetime.now().isoformat()
+        )
+
+    def get_parse_metrics(self) -> Dict:
+        """Parse outcome counters and rates over every AI plan response (empty or blocked ones included)"""
+        total = self.parse_stats["total"]
+        return {
+            **self.parse_stats,
+            "structured_output": self.structured_output,
+            "failure_rate": round(self.parse_stats["failed"] / total, 4) if total else 0.0,
+            "empty_rate": round(self.parse_stats["empty"] / total, 4) if total else 0.0,
+            "unusable_rate": round((self.parse_stats["failed"] + self.parse_stats["empty"]) / total, 4) if total else 0.0,
+            "repair_rate": round(self.parse_stats["repaired"] / total, 4) if total else 0.0,
+            "refinement": self.refine_stats,
+            "allocation": allocation_optimizer.get_metrics()
+        }
 
     def _get_risk_color(self, risk_level: str) -> str:
         """Get color based on risk level"""
@@ -327,14 +576,13 @@ RISK PROFILE: MODERATE INVESTOR
         }
         return risk_colors.get(risk_level, self.color_palette["secondary"])
 
-    def _create_fallback_plan(self, monthly_investment: int, risk_tolerance: str = "moderate", goal: str = "wealth building") -> InvestmentPlan:
+    def _create_fallback_plan(self, monthly_investment: int, risk_level: RiskLevel = RiskLevel.MODERATE, goal_type: GoalType = GoalType.WEALTH) -> InvestmentPlan:
         """Create a proper fallback plan based on user preferences"""
         
-        plan_id = f"fallback_plan_{int(datetime.now().timestamp())}"
-        risk_lower = risk_tolerance.lower()
+        plan_id = new_id("fallback_plan")
         
         # Create appropriate allocations based on ACTUAL user preferences
-        if "aggressive" in risk_lower or "high" in risk_lower:
+        if risk_level == RiskLevel.AGGRESSIVE:
             # AGGRESSIVE: High growth stocks and equity
             options = [
                 InvestmentOption(
@@ -360,7 +608,7 @@ RISK PROFILE: MODERATE INVESTOR
             ]
             risk_breakdown = RiskBreakdown(high=70, medium=30, low=0)
             
-        elif "conservative" in risk_lower or "low" in risk_lower:
+        elif risk_level == RiskLevel.CONSERVATIVE:
             # CONSERVATIVE: Safety first
             options = [
                 InvestmentOption(
@@ -422,14 +670,18 @@ RISK PROFILE: MODERATE INVESTOR
             ]
             risk_breakdown = RiskBreakdown(high=20, medium=50, low=30)
         
+        # Replace the template splits with weights solved inside the risk band
+        if allocation_optimizer.enabled:
+            options, risk_breakdown = allocation_optimizer.optimize(options, monthly_investment, risk_level, goal_type)
+        
         # Determine timeline and expected return based on goal and risk
-        if "emergency" in goal.lower():
+        if goal_type == GoalType.EMERGENCY:
             timeline = "1-2 years"
             expected_return = "4-6%"
-        elif "retirement" in goal.lower():
+        elif goal_type == GoalType.RETIREMENT:
             timeline = "10+ years"
-            expected_return = "8-12%" if "high" in risk_lower else "6-10%"
-        elif "house" in goal.lower():
+            expected_return = "8-12%" if risk_level == RiskLevel.AGGRESSIVE else "6-10%"
+        elif goal_type == GoalType.HOUSE:
             timeline = "3-7 years"
             expected_return = "6-9%"
         else:
@@ -443,11 +695,11 @@ RISK PROFILE: MODERATE INVESTOR
             "Monitor performance and adjust strategy as needed"
         ]
         
-        if "emergency" in goal.lower():
+        if goal_type == GoalType.EMERGENCY:
             recommendations.append("Maintain easy access to funds for emergencies")
-        elif "retirement" in goal.lower():
+        elif goal_type == GoalType.RETIREMENT:
             recommendations.append("Start retirement planning early for compound growth")
-        elif "house" in goal.lower():
+        elif goal_type == GoalType.HOUSE:
             recommendations.append("Consider separate savings for down payment")
         
         return InvestmentPlan(
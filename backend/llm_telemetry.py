@@ -0,0 +1,162 @@
+"""
+LLM usage telemetry per call site
+
+Every Gemini call records its call site, prompt and response token counts
+(provider usage metadata, or the local estimate when it is missing), latency
+and outcome. Rolling per-site statistics over the most recent calls are served
+at /api/metrics/llm and logged periodically.
+"""
+
+import asyncio
+import os
+import threading
+import time
+from collections import deque
+from typing import Dict, List, Optional, Tuple
+
+OUTCOME_OK = "ok"
+OUTCOME_EMPTY = "empty"
+OUTCOME_PARSE_FAILURE = "parse_failure"
+OUTCOME_EXCEPTION = "exception"
+OUTCOMES = (OUTCOME_OK, OUTCOME_EMPTY, OUTCOME_PARSE_FAILURE, OUTCOME_EXCEPTION)
+
+
+def response_usage(response) -> Tuple[Optional[int], Optional[int]]:
+    """(prompt, response) token counts from Gemini usage metadata, None where not reported"""
+    usage = getattr(response, "usage_metadata", None)
+    if usage is None:
+        return None, None
+    prompt_tokens = getattr(usage, "prompt_token_count", None)
+    response_tokens = getattr(usage, "candidates_token_count", None)
+    return prompt_tokens or None, response_tokens or None
+
+
+def _percentile(ordered: List[float], fraction: float) -> float:
+    if not ordered:
+        return 0.0
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+class LLMTelemetry:
+    """Rolling window of LLM calls per call site plus lifetime totals"""
+
+    def __init__(self):
+        self.window = int(os.getenv("LLM_TELEMETRY_WINDOW", "500"))
+        self.log_interval = float(os.getenv("LLM_TELEMETRY_LOG_SECONDS", "300"))
+        # USD per million tokens; defaults are gemini-1.5-flash list prices
+        self.input_price = float(os.getenv("LLM_PRICE_INPUT_PER_MTOK", "0.075"))
+        self.output_price = float(os.getenv("LLM_PRICE_OUTPUT_PER_MTOK", "0.30"))
+
+        # site -> deque of [prompt tokens, response tokens, latency ms, outcome, estimated]
+        self._calls: Dict[str, deque] = {}
+        self._totals: Dict[str, Dict] = {}
+        self._lock = threading.Lock()
+        self._logged_calls: Dict[str, int] = {}
+        self._log_task: Optional[asyncio.Task] = None
+
+    def record(self, site: str, prompt_tokens: int, response_tokens: int, latency: float, outcome: str, estimated: bool = False):
+        """Record one finished call; latency is in seconds"""
+        with self._lock:
+            if site not in self._calls:
+                self._calls[site] = deque(maxlen=self.window)
+                self._totals[site] = {
+                    "calls": 0, "prompt_tokens": 0, "response_tokens": 0, "estimated_calls": 0,
+                    **{outcome_name: 0 for outcome_name in OUTCOMES}
+                }
+            self._calls[site].append([prompt_tokens, response_tokens, latency * 1000, outcome, estimated])
+            totals = self._totals[site]
+            totals["calls"] += 1
+            totals["prompt_tokens"] += prompt_tokens
+            totals["response_tokens"] += response_tokens
+            totals["estimated_calls"] += int(estimated)
+            totals[outcome] += 1
+
+    def record_parse_failure(self, site: str):
+        """Reclassify the site's latest successful call once its reply turns out unparseable"""
+        with self._lock:
+            for call in reversed(self._calls.get(site, ())):
+                if call[3] == OUTCOME_OK:
+                    call[3] = OUTCOME_PARSE_FAILURE
+                    self._totals[site][OUTCOME_OK] -= 1
+                    self._totals[site][OUTCOME_PARSE_FAILURE] += 1
+                    return
+
+    def _cost(self, prompt_tokens: int, response_tokens: int) -> float:
+        return (prompt_tokens * self.input_price + response_tokens * self.output_price) / 1_000_000
+
+    def site_stats(self, site: str) -> Dict:
+        with self._lock:
+            calls = list(self._calls[site])
+            totals = dict(self._totals[site])
+
+        count = len(calls)
+        prompt_tokens = sum(call[0] for call in calls)
+        response_tokens = sum(call[1] for call in calls)
+        latencies = sorted(call[2] for call in calls)
+        outcomes = {outcome: 0 for outcome in OUTCOMES}
+        for call in calls:
+            outcomes[call[3]] += 1
+        return {
+            "recent": {
+                "calls": count,
+                "outcomes": outcomes,
+                "success_rate": round(outcomes[OUTCOME_OK] / count, 4) if count else 0.0,
+                "prompt_tokens_avg": round(prompt_tokens / count, 1) if count else 0.0,
+                "response_tokens_avg": round(response_tokens / count, 1) if count else 0.0,
+                "latency_ms_p50": round(_percentile(latencies, 0.5), 1),
+                "latency_ms_p95": round(_percentile(latencies, 0.95), 1),
+                "latency_ms_p99": round(_percentile(latencies, 0.99), 1),
+                "estimated_cost_usd": round(self._cost(prompt_tokens, response_tokens), 6)
+            },
+            "total": {
+                **totals,
+                "estimated_cost_usd": round(self._cost(totals["prompt_tokens"], totals["response_tokens"]), 6)
+            }
+        }
+
+    def get_metrics(self) -> Dict:
+        with self._lock:
+            sites = sorted(self._calls)
+        return {
+            "window": self.window,
+            "price_per_mtok": {"input": self.input_price, "output": self.output_price},
+            "sites": {site: self.site_stats(site) for site in sites}
+        }
+
+    def log_summary(self):
+        """One line per call site that had calls since the last summary"""
+        for site, stats in self.get_metrics()["sites"].items():
+            total_calls = stats["total"]["calls"]
+            if self._logged_calls.get(site) == total_calls:
+                continue
+            self._logged_calls[site] = total_calls
+            recent = stats["recent"]
+            print(
+                f"📈 LLM {site}: {recent['calls']} recent calls, ok {recent['success_rate']:.0%}, "
+                f"p50 {recent['latency_ms_p50']}ms p95 {recent['latency_ms_p95']}ms, "
+                f"~{recent['prompt_tokens_avg']:.0f} in / {recent['response_tokens_avg']:.0f} out tokens, "
+                f"${stats['total']['estimated_cost_usd']:.4f} total"
+            )
+
+    async def _log_loop(self):
+        while True:
+            await asyncio.sleep(self.log_interval)
+            try:
+                self.log_summary()
+            except Exception as e:
+                print(f"❌ LLM telemetry summary failed: {e}")
+
+    def start(self):
+        """Start the periodic log summary on the running event loop"""
+        if self.log_interval > 0 and self._log_task is None:
+            self._log_task = asyncio.create_task(self._log_loop())
+
+    async def stop(self):
+        if self._log_task is not None:
+            self._log_task.cancel()
+            await asyncio.gather(self._log_task, return_exceptions=True)
+            self._log_task = None
+
+
+# Global telemetry instance
+llm_telemetry = LLMTelemetry()
@@ -0,0 +1,133 @@
+"""
+Event-loop lag monitor and blocking-call detector
+
+A background task sleeps for a fixed interval and measures how late it wakes up.
+That scheduling delay is the time the loop spent running other callbacks, and it
+is exported as a metric. In debug mode a watchdog thread also watches the task's
+heartbeat. When the loop stops ticking for longer than the threshold, the thread
+logs the loop thread's current stack, so the blocking call shows up while it is
+still blocking.
+"""
+
+import asyncio
+import os
+import sys
+import threading
+import time
+import traceback
+from collections import deque
+from datetime import datetime
+from typing import Dict, List, Optional
+
+
+def _percentile(ordered: List[float], fraction: float) -> float:
+    if not ordered:
+        return 0.0
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+class LoopLagMonitor:
+    """Samples event-loop scheduling delay and, in debug mode, reports blocking stacks"""
+
+    def __init__(self):
+        self.enabled = os.getenv("LOOP_MONITOR_ENABLED", "True").lower() == "true"
+        self.interval = float(os.getenv("LOOP_MONITOR_INTERVAL_MS", "100")) / 1000
+        self.debug = os.getenv("LOOP_BLOCKING_DEBUG", "False").lower() == "true"
+        self.threshold = float(os.getenv("LOOP_BLOCKING_THRESHOLD_MS", "100")) / 1000
+        self.stack_depth = int(os.getenv("LOOP_BLOCKING_STACK_DEPTH", "12"))
+
+        self.lags = deque(maxlen=int(os.getenv("LOOP_MONITOR_WINDOW", "600")))
+        self.stats = {"samples": 0, "max_lag_ms": 0.0, "slow_ticks": 0, "blocking_reports": 0}
+        self.recent_blocks = deque(maxlen=10)
+
+        self._task: Optional[asyncio.Task] = None
+        self._watchdog: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self._loop_thread_id: Optional[int] = None
+        self._last_tick = 0.0
+        self._reported_tick = 0.0
+
+    def start(self):
+        """Start sampling on the running event loop (and the watchdog in debug mode)"""
+        if not self.enabled or self._task is not None:
+            return
+        self._loop_thread_id = threading.get_ident()
+        self._last_tick = time.monotonic()
+        self._stop.clear()
+        self._task = asyncio.create_task(self._sample_loop())
+        if self.debug:
+            self._watchdog = threading.Thread(target=self._watch, name="loop-watchdog", daemon=True)
+            self._watchdog.start()
+        print(f"✅ Event-loop monitor started (every {self.interval * 1000:.0f}ms, debug={self.debug})")
+
+    async def stop(self):
+        self._stop.set()
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        if self._watchdog is not None:
+            self._watchdog.join(timeout=1)
+            self._watchdog = None
+
+    async def _sample_loop(self):
+        while True:
+            expected = time.monotonic() + self.interval
+            await asyncio.sleep(self.interval)
+            now = time.monotonic()
+            lag = max(now - expected, 0.0)
+            self._last_tick = now
+            self._record(lag)
+
+    def _record(self, lag: float):
+        lag_ms = lag * 1000
+        self.lags.append(lag_ms)
+        self.stats["samples"] += 1
+        self.stats["max_lag_ms"] = max(self.stats["max_lag_ms"], round(lag_ms, 1))
+        if lag >= self.threshold:
+            self.stats["slow_ticks"] += 1
+            if self.recent_blocks and self.recent_blocks[-1]["resolved_ms"] is None:
+                # Close the watchdog report with how long the loop was actually stuck
+                self.recent_blocks[-1]["resolved_ms"] = round(lag_ms, 1)
+            elif not self.debug:
+                print(f"⚠️ Event loop lagged {lag_ms:.0f}ms (enable LOOP_BLOCKING_DEBUG to capture the blocking stack)")
+
+    def _watch(self):
+        """Watchdog thread: dump the loop thread's stack once per stall"""
+        poll = max(self.threshold / 4, 0.005)
+        while not self._stop.wait(poll):
+            last_tick = self._last_tick
+            stalled = time.monotonic() - last_tick - self.interval
+            if stalled < self.threshold or last_tick == self._reported_tick:
+                continue
+            self._reported_tick = last_tick
+            frame = sys._current_frames().get(self._loop_thread_id)
+            if frame is None:
+                continue
+            stack = traceback.format_stack(frame, limit=self.stack_depth)
+            self.stats["blocking_reports"] += 1
+            self.recent_blocks.append({
+                "detected_at": datetime.now().isoformat(),
+                "blocked_ms_at_detection": round(stalled * 1000, 1),
+                "resolved_ms": None,
+                "stack": [line.strip() for line in stack]
+            })
+            print(f"🐢 Event loop blocked for {stalled * 1000:.0f}ms so far; loop thread stack:\n{''.join(stack)}")
+
+    def get_metrics(self) -> Dict:
+        ordered = sorted(self.lags)
+        return {
+            **self.stats,
+            "enabled": self.enabled,
+            "debug": self.debug,
+            "interval_ms": round(self.interval * 1000, 1),
+            "threshold_ms": round(self.threshold * 1000, 1),
+            "lag_ms_avg": round(sum(ordered) / len(ordered), 2) if ordered else 0.0,
+            "lag_ms_p50": round(_percentile(ordered, 0.5), 2),
+            "lag_ms_p99": round(_percentile(ordered, 0.99), 2),
+            "recent_blocks": list(self.recent_blocks)
+        }
+
+
+# Global monitor instance
+loop_monitor = LoopLagMonitor()
@@ -4,20 +4,41 @@ Without database operations initially
 """
 
 import os
-from fastapi import FastAPI, HTTPException
+import secrets
+import orjson
+from fastapi import Depends, FastAPI, HTTPException, Query, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import ORJSONResponse, Response, StreamingResponse
 from datetime import datetime
-from typing import Dict, List, Optional
+from typing import Callable, Dict, List, Optional, Tuple
 
 # Import the Pydantic models (not SQLAlchemy)
 from models import (
     NextQuestionRequest, NextQuestionResponse, 
     SaveProfileRequest, SaveProfileResponse,
     GeneratePlanRequest, GeneratePlanResponse,
-    SavePlanRequest, SavePlanResponse
+    SavePlanRequest, SavePlanResponse,
+    InvestmentPlan, GoalSolveRequest
 )
 from ai_service import ai_service
 from investment_plan_service import investment_plan_service
+from admission import AdmissionRejected, LLMPriority, admission_controller, client_key_for
+from storage import new_id
+from stores import plans_storage, profiles_storage, sessions_storage
+from profile_record import ProfileRecord
+from question_engine import question_engine
+from plan_jobs import JobQueueFull, plan_job_queue
+from http_cache import REVALIDATE_CACHE_CONTROL, cached_json_response, compressed_cache_memory_usage
+from plan_versions import VersionedPlanStore
+from conversation_log import ConversationSessionStore, save_session_turn
+from snapshot_log import get_log_metrics
+from feedback_cache import feedback_plan_cache
+from export import FORMATS, export_chunks
+from profile_ingest import IngestStreamingResponse, profile_ingestor
+from llm_telemetry import llm_telemetry
+from goal_solver import goal_solver
+from loop_monitor import loop_monitor
+from memory_report import memory_accountant
 from dotenv import load_dotenv
 
 # Load environment variables
@@ -29,7 +50,8 @@ app = FastAPI(
     description="AI-powered investment advisory backend with Gemini AI integration",
     version="1.0.0",
     docs_url="/docs",
-    redoc_url="/redoc"
+    redoc_url="/redoc",
+    default_response_class=ORJSONResponse
 )
 
 # Configure CORS
@@ -41,10 +63,75 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# In-memory storage for testing
-profiles_storage: Dict[str, Dict] = {}
-sessions_storage: Dict[str, Dict] = {}
-plans_storage: Dict[str, Dict] = {}  # Storage for investment plans
+def encode_plan_record(plan_dict: Dict, profile_id: str, timestamp_field: str, parent_plan_id: Optional[str] = None) -> bytes:
+    """Serialize a plan record once at write time"""
+    record = {
+        "plan": plan_dict,
+        "profile_id": profile_id,
+        timestamp_field: datetime.now().isoformat()
+    }
+    if parent_plan_id:
+        record["parent_plan_id"] = parent_plan_id
+    return orjson.dumps(record)
+
+def json_bytes_response(content: bytes) -> Response:
+    """Serve already-encoded JSON without re-validation or re-encoding"""
+    return Response(content=content, media_type="application/json")
+
+# Admission control for LLM-backed endpoints
+def request_client_key(request: Request) -> str:
+    return client_key_for(
+        request.headers.get("x-api-key"),
+        request.client.host if request.client else None,
+        request.headers.get("x-forwarded-for")
+    )
+
+def admission_rejected(error: AdmissionRejected) -> HTTPException:
+    return HTTPException(
+        status_code=429,
+        detail=error.reason,
+        headers={"Retry-After": str(error.retry_after)}
+    )
+
+def llm_admission(priority: LLMPriority):
+    """Dependency that rate limits each client and holds an LLM slot of the given class while the request runs"""
+    async def admit_request(request: Request):
+        try:
+            async with admission_controller.admit(request_client_key(request), priority):
+                yield
+        except AdmissionRejected as e:
+            raise admission_rejected(e)
+    return admit_request
+
+async def llm_rate_limit(request: Request):
+    """Rate limit each client without holding an LLM slot (queued work is capped by its workers)"""
+    if not admission_controller.enabled:
+        return
+    try:
+        admission_controller.check_rate(request_client_key(request))
+    except AdmissionRejected as e:
+        raise admission_rejected(e)
+
+async def require_admin(request: Request):
+    """Admin endpoints are disabled unless ADMIN_TOKEN is set, and then need it in X-Admin-Token"""
+    admin_token = os.getenv("ADMIN_TOKEN")
+    if not admin_token:
+        raise HTTPException(status_code=404, detail="Not found")
+    if not secrets.compare_digest(request.headers.get("x-admin-token", "").encode(), admin_token.encode()):
+        raise HTTPException(status_code=403, detail="Admin token required")
+
+# Background plan job workers
+@app.on_event("startup")
+async def start_plan_job_workers():
+    plan_job_queue.start(run_plan_job)
+    llm_telemetry.start()
+    loop_monitor.start()
+
+@app.on_event("shutdown")
+async def stop_plan_job_workers():
+    await plan_job_queue.stop()
+    await llm_telemetry.stop()
+    await loop_monitor.stop()
 
 # Helper function to check profile completion
 def is_profile_complete(answers) -> bool:
@@ -89,12 +176,93 @@ async def health_check():
         "status": "healthy",
         "timestamp": datetime.now(),
         "version": "1.0.0",
-        "ai_provider": "gemini"
+        "ai_provider": "gemini",
+        "ai_circuit": ai_service.resilience.snapshot()
+    }
+
+# Metrics endpoint
+@app.get("/api/metrics")
+async def get_metrics():
+    """Service metrics for monitoring"""
+    return {
+        "plan_parsing": investment_plan_service.get_parse_metrics(),
+        "admission": admission_controller.get_metrics(),
+        "question_engine": question_engine.get_metrics(),
+        "question_batching": ai_service.question_batcher.get_metrics(),
+        "plan_jobs": plan_job_queue.get_metrics(),
+        "plan_versions": plans_storage.get_metrics() if isinstance(plans_storage, VersionedPlanStore) else None,
+        "conversations": sessions_storage.get_metrics() if isinstance(sessions_storage, ConversationSessionStore) else None,
+        "storage_log": get_log_metrics(),
+        "feedback_cache": feedback_plan_cache.get_metrics(),
+        "profile_ingest": profile_ingestor.get_metrics(),
+        "goal_solver": goal_solver.get_metrics(),
+        "event_loop": loop_monitor.get_metrics()
     }
 
+# LLM usage per call site
+@app.get("/api/metrics/llm")
+async def get_llm_metrics():
+    """Rolling token, latency, outcome and cost statistics per LLM call site"""
+    return llm_telemetry.get_metrics()
+
+# Memory accounting (admin)
+def memory_sources() -> Tuple[Dict[str, object], Dict[str, Callable[[int], Dict]]]:
+    """Stores to measure, and each cache's memory_usage(sample_size) accessor"""
+    stores = {"profiles": profiles_storage}
+    caches = {
+        "http_compressed": compressed_cache_memory_usage,
+        "feedback_plans": feedback_plan_cache.memory_usage,
+        "plan_jobs": plan_job_queue.memory_usage,
+        "admission_buckets": admission_controller.memory_usage
+    }
+    if isinstance(plans_storage, VersionedPlanStore):
+        stores.update({
+            "plan_pieces": plans_storage.pieces,
+            "plan_versions": plans_storage.versions,
+            "plan_revisions": plans_storage.revisions,
+            "plan_current_revision": plans_storage.current_revision,
+            "plan_latest": plans_storage.latest
+        })
+        caches["encoded_plans"] = plans_storage.memory_usage
+    else:
+        stores["plans"] = plans_storage
+    if isinstance(sessions_storage, ConversationSessionStore):
+        stores.update({
+            "sessions": sessions_storage.turns,
+            "conversations": sessions_storage.conversations,
+            "conversation_messages": sessions_storage.messages
+        })
+    else:
+        stores["sessions"] = sessions_storage
+    return stores, caches
+
+@app.get("/api/admin/memory", dependencies=[Depends(require_admin)])
+async def get_memory_report(sample_size: Optional[int] = Query(None, ge=1, le=10000)):
+    """Entry counts and sampled deep sizes per store and cache"""
+    stores, caches = memory_sources()
+    return memory_accountant.report(stores, caches, sample_size)
+
+@app.post("/api/admin/memory/baseline", dependencies=[Depends(require_admin)])
+async def take_memory_baseline():
+    """Start tracemalloc (if needed) and take the baseline snapshot"""
+    return await memory_accountant.take_baseline()
+
+@app.get("/api/admin/memory/diff", dependencies=[Depends(require_admin)])
+async def get_memory_diff(top: int = Query(20, ge=1, le=500), group_by: str = "lineno"):
+    """Top allocation sites by growth since the baseline"""
+    try:
+        return await memory_accountant.diff(top, group_by)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@app.delete("/api/admin/memory/baseline", dependencies=[Depends(require_admin)])
+async def stop_memory_tracing():
+    """Drop the baseline and stop tracemalloc"""
+    return memory_accountant.stop_tracing()
+
 # Next question endpoint
 @app.post("/api/next-question", response_model=NextQuestionResponse)
-async def get_next_question(request: NextQuestionRequest):
+async def get_next_question(request: NextQuestionRequest, http_request: Request):
     """Generate next question using Gemini AI"""
     try:
         # Log request ID for debugging
@@ -115,36 +283,46 @@ async def get_next_question(request: NextQuestionRequest):
         if is_complete:
             # Don't call AI for completion message
             ai_response_message = "Perfect! I have all the information needed. Your investment profile is complete and ready for plan generation."
+        elif not question_engine.needs_llm(request.chatHistory, request.answers, updated_answers):
+            # Deterministic turn: the next question follows from the first missing field
+            ai_response_message = question_engine.next_question(request.chatHistory, updated_answers)
+            question_engine.record_turn(used_llm=False)
         else:
-            # Build minimal prompt and call AI only when needed
+            # Ambiguous input: build minimal prompt and call AI; only this branch is rate limited and holds an LLM slot
             prompt = ai_service.build_prompt(request.chatHistory, updated_answers)
-            ai_response = await ai_service.chat(prompt, updated_answers)
+            async with admission_controller.admit(request_client_key(http_request), LLMPriority.CHAT):
+                ai_response = await ai_service.chat(prompt, updated_answers)
             ai_response_message = ai_response.message
+            question_engine.record_turn(used_llm=True)
         
         print(f"📊 Profile completion check: {updated_answers.model_dump()}")
         print(f"🎯 Is complete: {is_complete}")
         
         # Generate session ID for tracking
-        session_id = f"session_{len(sessions_storage) + 1}"
+        session_id = new_id("session")
         
-        # Store session in memory
-        sessions_storage[session_id] = {
+        # Store the turn; only messages new to the conversation are appended
+        conversation_id = save_session_turn(sessions_storage, session_id, {
             "request_id": request_id,
+            "conversation_id": request.conversationId,
             "chat_history": [msg.model_dump() for msg in request.chatHistory],
             "current_answers": updated_answers.model_dump(),
             "is_complete": is_complete,
             "created_at": datetime.now().isoformat()
-        }
+        })
         
-        print(f"💾 Chat session stored: {session_id} (request: {request_id})")
+        print(f"💾 Chat session stored: {session_id} (request: {request_id}, conversation: {conversation_id})")
         
         return NextQuestionResponse(
             message=ai_response_message,
             options=None,
             isComplete=is_complete,
-            updatedAnswers=updated_answers
+            updatedAnswers=updated_answers,
+            conversationId=conversation_id
         )
         
+    except AdmissionRejected as e:
+        raise admission_rejected(e)
     except Exception as e:
         print(f"❌ Error generating next question: {e}")
         raise HTTPException(status_code=500, detail="Internal server error")
@@ -155,24 +333,24 @@ async def save_profile(request: SaveProfileRequest):
     """Save user investment profile"""
     try:
         # Generate profile ID
-        profile_id = f"profile_{len(profiles_storage) + 1}"
+        profile_id = new_id("profile")
         
-        # Create user profile
-        profile_data = {
-            "id": profile_id,
-            "monthly_investment": request.monthlyInvestment,
-            "preference": request.investmentPreference,
-            "risk_tolerance": request.riskTolerance,
-            "goal": request.goal,
-            "age": request.age,
-            "income": request.income,
-            "experience": request.experience,
-            "time_horizon": request.timeHorizon,
-            "created_at": datetime.now().isoformat()
-        }
+        # Create user profile (normalized once here, reused by every plan request)
+        profile_record = ProfileRecord(
+            id=profile_id,
+            monthly_investment=request.monthlyInvestment,
+            preference=request.investmentPreference,
+            risk_tolerance=request.riskTolerance,
+            goal=request.goal,
+            age=request.age,
+            income=request.income,
+            experience=request.experience,
+            time_horizon=request.timeHorizon,
+            created_at=datetime.now().isoformat()
+        )
         
         # Store in memory
-        profiles_storage[profile_id] = profile_data
+        profiles_storage[profile_id] = profile_record
         
         print(f"✅ Profile saved successfully: {profile_id}")
         
@@ -186,56 +364,100 @@ async def save_profile(request: SaveProfileRequest):
         print(f"❌ Error saving profile: {e}")
         raise HTTPException(status_code=500, detail="Failed to save profile")
 
+# Bulk profile ingestion endpoint
+@app.post("/api/profiles/bulk")
+async def bulk_ingest_profiles(request: Request):
+    """Ingest NDJSON SaveProfileRequest records; streams one NDJSON result (profileId or error) per line"""
+    return IngestStreamingResponse(
+        profile_ingestor.ingest(request.stream(), profiles_storage),
+        media_type="application/x-ndjson"
+    )
+
 # Get stored profiles (for testing)
 @app.get("/api/profiles")
-async def get_profiles():
+async def get_profiles(request: Request):
     """Get all stored profiles (testing only)"""
-    return {
-        "profiles": profiles_storage,
-        "sessions": sessions_storage,
-        "plans": plans_storage,
+    content = orjson.dumps({
+        "profiles": {profile_id: record.to_dict() for profile_id, record in profiles_storage.items()},
+        "sessions": dict(sessions_storage.items()),
+        "plans": {plan_id: orjson.Fragment(record) for plan_id, record in plans_storage.items()},
         "total_profiles": len(profiles_storage),
         "total_sessions": len(sessions_storage),
         "total_plans": len(plans_storage)
-    }
+    })
+    return cached_json_response(request, content, REVALIDATE_CACHE_CONTROL)
 
-# Generate investment plan endpoint
-@app.post("/api/generate-plan", response_model=GeneratePlanResponse)
-async def generate_investment_plan(request: GeneratePlanRequest):
-    """Generate personalized investment plan based on user profile"""
-    try:
-        # Get profile data
-        profile_data = profiles_storage.get(request.profileId)
-        if not profile_data:
-            raise HTTPException(status_code=404, detail="Profile not found")
-        
-        print(f"🔄 Generating investment plan for profile: {request.profileId}")
-        
+# Plan generation shared by the synchronous endpoint and the job workers
+async def build_and_store_plan(request: GeneratePlanRequest) -> Tuple[Dict, str]:
+    """Generate (or refine) a plan for a profile and store it; returns the plan dict and message"""
+    # Get profile data
+    profile_record = profiles_storage.get(request.profileId)
+    if not profile_record:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    
+    print(f"🔄 Generating investment plan for profile: {request.profileId}")
+    
+    refine = bool(request.basePlanId and request.feedback)
+    base_record = orjson.loads(plans_storage.get(request.basePlanId) or b"null") if refine else None
+    # Only the profile's own plans can be refined
+    if refine and (not base_record or base_record.get("profile_id") != request.profileId):
+        raise HTTPException(status_code=404, detail="Base plan not found")
+    
+    base_plan = InvestmentPlan.model_validate(base_record["plan"]) if refine else None
+    
+    # Near-duplicate feedback from a similar profile (on the same base plan) reuses the earlier plan without calling Gemini
+    investment_plan = feedback_plan_cache.lookup(profile_record, request.feedback, base_plan) if request.feedback else None
+    
+    if investment_plan is None and refine:
+        # Refinement mode: send only the base plan's allocation and the requested change
+        investment_plan = await investment_plan_service.refine_ai_plan(
+            base_plan,
+            profile_record,
+            request.feedback
+        )
+        feedback_plan_cache.store_generated(profile_record, request.feedback, investment_plan, base_plan)
+    elif investment_plan is None:
         # Generate investment plan
         investment_plan = await investment_plan_service.generate_ai_plan(
-            profile_data, 
+            profile_record, 
             request.feedback
         )
-        
-        # Store the plan
-        plan_id = investment_plan.planId or f"plan_{int(datetime.now().timestamp())}"
-        plans_storage[plan_id] = {
-            "plan": investment_plan.model_dump(),
-            "profile_id": request.profileId,
-            "created_at": datetime.now().isoformat()
-        }
-        
-        message = "📊 I've created your personalized investment plan based on your profile."
         if request.feedback:
-            message = f"I've adjusted your investment plan based on your feedback: '{request.feedback}'"
-        
-        print(f"✅ Investment plan generated: {investment_plan.planId} for profile: {request.profileId}")
+            feedback_plan_cache.store_generated(profile_record, request.feedback, investment_plan)
+    
+    # Store the plan (dumped once, reused for the stored record and the response)
+    plan_id = investment_plan.planId or new_id("plan")
+    plan_dict = investment_plan.model_dump()
+    parent_plan_id = request.basePlanId if request.feedback else None
+    plans_storage[plan_id] = encode_plan_record(plan_dict, request.profileId, "created_at", parent_plan_id)
+    
+    message = "📊 I've created your personalized investment plan based on your profile."
+    if request.feedback:
+        message = f"I've adjusted your investment plan based on your feedback: '{request.feedback}'"
+    
+    print(f"✅ Investment plan generated: {investment_plan.planId} for profile: {request.profileId}")
+    
+    return plan_dict, message
+
+# Background job handler
+async def run_plan_job(request: GeneratePlanRequest) -> Tuple[Dict, str]:
+    """Background plan jobs take LLM capacity in the lowest-priority class"""
+    async with admission_controller.slot(LLMPriority.BATCH):
+        return await build_and_store_plan(request)
+
+# Generate investment plan endpoint
+@app.post("/api/generate-plan", response_model=GeneratePlanResponse, dependencies=[Depends(llm_admission(LLMPriority.PLAN))])
+async def generate_investment_plan(request: GeneratePlanRequest):
+    """Generate personalized investment plan based on user profile"""
+    try:
+        plan_dict, message = await build_and_store_plan(request)
         
-        return GeneratePlanResponse(
-            success=True,
-            plan=investment_plan,
-            message=message
-        )
+        # Plan was already validated when built; skip response-model revalidation
+        return json_bytes_response(orjson.dumps({
+            "success": True,
+            "plan": plan_dict,
+            "message": message
+        }))
         
     except HTTPException:
         raise
@@ -243,27 +465,69 @@ async def generate_investment_plan(request: GeneratePlanRequest):
         print(f"❌ Error generating investment plan: {e}")
         raise HTTPException(status_code=500, detail="Failed to generate investment plan")
 
+# Queue plan generation as a background job
+@app.post("/api/generate-plan/jobs", status_code=202, dependencies=[Depends(llm_rate_limit)])
+async def submit_plan_job(request: GeneratePlanRequest):
+    """Queue plan generation and return a job ID immediately"""
+    if request.profileId not in profiles_storage:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    
+    try:
+        job = plan_job_queue.submit(request)
+    except JobQueueFull as e:
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": "5"})
+    
+    print(f"📥 Plan job queued: {job['jobId']} for profile: {request.profileId}")
+    
+    return {
+        **job,
+        "statusUrl": f"/api/jobs/{job['jobId']}",
+        "eventsUrl": f"/api/jobs/{job['jobId']}/events"
+    }
+
+# Plan job status endpoint
+@app.get("/api/jobs/{job_id}")
+async def get_plan_job(job_id: str):
+    """Poll a plan job; completed jobs carry the stored planId"""
+    job = plan_job_queue.get(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+# Plan job completion stream
+@app.get("/api/jobs/{job_id}/events")
+async def stream_plan_job(job_id: str):
+    """Server-sent events: current status now, then the final status on completion"""
+    job = plan_job_queue.get(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    
+    async def events():
+        yield f"event: status\ndata: {orjson.dumps(job).decode()}\n\n"
+        while not await plan_job_queue.wait(job_id, timeout=15):
+            yield ": keep-alive\n\n"
+        final = plan_job_queue.get(job_id) or job
+        yield f"event: {final['status']}\ndata: {orjson.dumps(final).decode()}\n\n"
+    
+    return StreamingResponse(events(), media_type="text/event-stream")
+
 # Save investment plan endpoint
 @app.post("/api/save-plan", response_model=SavePlanResponse)
 async def save_investment_plan(request: SavePlanRequest):
     """Save investment plan to persistent storage"""
     try:
         # Store the plan with timestamp
-        plan_id = request.plan.planId or f"plan_{int(datetime.now().timestamp())}"
+        plan_id = request.plan.planId or new_id("plan")
         
-        plans_storage[plan_id] = {
-            "plan": request.plan.model_dump(),
-            "profile_id": request.profileId,
-            "saved_at": datetime.now().isoformat()
-        }
+        plans_storage[plan_id] = encode_plan_record(request.plan.model_dump(), request.profileId, "saved_at")
         
         print(f"✅ Investment plan saved: {plan_id}")
         
-        return SavePlanResponse(
-            success=True,
-            message="🎉 Your investment plan has been successfully saved! You can access it anytime from your dashboard.",
-            planId=plan_id
-        )
+        return json_bytes_response(orjson.dumps({
+            "success": True,
+            "message": "🎉 Your investment plan has been successfully saved! You can access it anytime from your dashboard.",
+            "planId": plan_id
+        }))
         
     except Exception as e:
         print(f"❌ Error saving investment plan: {e}")
@@ -271,13 +535,61 @@ async def save_investment_plan(request: SavePlanRequest):
 
 # Get investment plan endpoint
 @app.get("/api/plan/{plan_id}")
-async def get_investment_plan(plan_id: str):
-    """Get investment plan by ID"""
-    plan_data = plans_storage.get(plan_id)
-    if not plan_data:
+async def get_investment_plan(plan_id: str, request: Request):
+    """Get investment plan by ID (ETag + conditional GET; save-plan may replace it)"""
+    plan_record = plans_storage.get(plan_id)
+    if not plan_record:
         raise HTTPException(status_code=404, detail="Investment plan not found")
     
-    return plan_data
+    return cached_json_response(request, plan_record, REVALIDATE_CACHE_CONTROL)
+
+# Goal solver endpoint
+@app.post("/api/goal-solver")
+async def solve_goal(request: GoalSolveRequest):
+    """Required monthly amount or time to goal for a plan's risk mix, over a grid of return assumptions"""
+    plan = None
+    if request.planId:
+        plan_record = plans_storage.get(request.planId)
+        if not plan_record:
+            raise HTTPException(status_code=404, detail="Investment plan not found")
+        plan = InvestmentPlan.model_validate(orjson.loads(plan_record)["plan"])
+    
+    try:
+        return goal_solver.solve(request, plan)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+# Analytics export endpoint
+@app.get("/api/export/{table}")
+async def export_table(table: str, format: str = "csv"):
+    """Stream profiles, sessions, plan_options or risk_breakdowns as CSV, Arrow IPC or Parquet"""
+    stores = {"profiles": profiles_storage, "sessions": sessions_storage, "plans": plans_storage}
+    try:
+        chunks = export_chunks(stores, table, format)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    media_type, extension = FORMATS[format]
+    return StreamingResponse(
+        chunks,
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="{table}.{extension}"'}
+    )
+
+# Plan version history endpoint
+@app.get("/api/profiles/{profile_id}/plan-history")
+async def get_plan_history(profile_id: str, request: Request):
+    """List every plan version generated or saved for a profile, oldest first"""
+    if not isinstance(plans_storage, VersionedPlanStore):
+        raise HTTPException(status_code=404, detail="Plan versioning is disabled")
+    if profile_id not in profiles_storage:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    
+    content = orjson.dumps({
+        "profileId": profile_id,
+        "versions": plans_storage.history(profile_id)
+    })
+    return cached_json_response(request, content, REVALIDATE_CACHE_CONTROL)
 
 if __name__ == "__main__":
     import uvicorn
@@ -0,0 +1,192 @@
+"""
+Memory accounting for in-memory stores and caches
+
+Entry counts and approximate deep sizes per store, estimated from a sample of
+entries so the report stays cheap on large stores. On demand, tracemalloc
+snapshots are diffed against a baseline to show the top allocation sites.
+"""
+
+import asyncio
+import enum
+import os
+import sys
+import tracemalloc
+import types
+from collections.abc import Mapping
+from datetime import datetime
+from itertools import islice
+from typing import Callable, Dict, Iterator, Optional, Tuple
+
+from storage import SQLiteStore
+
+# Objects shared process-wide, not owned by any one entry
+_SHARED_TYPES = (type, types.ModuleType, types.FunctionType, types.BuiltinFunctionType, enum.Enum)
+
+_TRACE_FILTERS = (
+    tracemalloc.Filter(False, tracemalloc.__file__),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap_external>"),
+    tracemalloc.Filter(False, "<unknown>"),
+)
+
+
+def deep_size(obj, seen: Optional[set] = None) -> int:
+    """Bytes reachable from obj (containers, __dict__ and __slots__), counting each object once"""
+    seen = set() if seen is None else seen
+    pending = [obj]
+    total = 0
+    while pending:
+        current = pending.pop()
+        if id(current) in seen or current is None or isinstance(current, _SHARED_TYPES):
+            continue
+        seen.add(id(current))
+        total += sys.getsizeof(current)
+
+        if isinstance(current, (str, bytes, bytearray, int, float, bool)):
+            continue
+        if isinstance(current, Mapping):
+            pending.extend(current.keys())
+            pending.extend(current.values())
+        elif isinstance(current, (list, tuple, set, frozenset)):
+            pending.extend(current)
+        if hasattr(current, "__dict__"):
+            pending.append(vars(current))
+        for name in getattr(type(current), "__slots__", ()):
+            value = getattr(current, name, None)
+            if value is not None:
+                pending.append(value)
+    return total
+
+
+def _resident_mapping(store) -> Tuple[Optional[Mapping], str]:
+    """The in-process dict behind a store and the backend name; None when the data lives on disk"""
+    if isinstance(store, dict):
+        return store, "memory"
+    data = getattr(store, "_data", None)
+    if isinstance(data, dict):
+        return data, "log"
+    return None, "sqlite" if isinstance(store, SQLiteStore) else type(store).__name__
+
+
+def _sample(data: Mapping, sample_size: int) -> Iterator:
+    """Evenly spaced keys across the mapping"""
+    step = max(len(data) // max(sample_size, 1), 1)
+    return islice(iter(data), 0, None, step)
+
+
+def measure(container, sample_size: int) -> Dict:
+    """Entry count and approximate deep size of one store or cache, from at most sample_size entries"""
+    sample_size = max(sample_size, 1)
+    data, backend = _resident_mapping(container)
+    if data is None:
+        count = len(container) if hasattr(container, "__len__") else None
+        return {"backend": backend, "entries": count, "in_memory": False}
+
+    count = len(data)
+    sampled = 0
+    sampled_bytes = 0
+    for key in islice(_sample(data, sample_size), sample_size):
+        value = data.get(key)
+        # A fresh seen-set per entry: objects shared between entries count for each of them
+        sampled_bytes += deep_size(key) + deep_size(value)
+        sampled += 1
+    average = sampled_bytes / sampled if sampled else 0
+    return {
+        "backend": backend,
+        "entries": count,
+        "in_memory": True,
+        "sampled": sampled,
+        "avg_entry_bytes": round(average),
+        "approx_bytes": round(average * count) + sys.getsizeof(data)
+    }
+
+
+class MemoryAccountant:
+    """Sampled store sizes plus tracemalloc baselines and diffs"""
+
+    def __init__(self):
+        self.sample_size = max(int(os.getenv("MEMORY_SAMPLE_SIZE", "200")), 1)
+        self.trace_frames = int(os.getenv("MEMORY_TRACE_FRAMES", "1"))
+        self._baseline: Optional[tracemalloc.Snapshot] = None
+        self._baseline_at: Optional[str] = None
+        self._started_tracing = False
+
+    def report(self, stores: Dict[str, object], caches: Dict[str, Callable[[int], Dict]], sample_size: Optional[int] = None) -> Dict:
+        """Stores are measured directly; caches report through their owner's memory_usage(sample_size)"""
+        sample_size = sample_size or self.sample_size
+        measured_stores = {name: measure(store, sample_size) for name, store in stores.items()}
+        measured_caches = {name: memory_usage(sample_size) for name, memory_usage in caches.items()}
+        total = sum(
+            entry.get("approx_bytes", 0)
+            for entry in (*measured_stores.values(), *measured_caches.values())
+        )
+        return {
+            "stores": measured_stores,
+            "caches": measured_caches,
+            "sample_size": sample_size,
+            "approx_total_bytes": total,
+            "tracemalloc": self.tracing_status()
+        }
+
+    # tracemalloc
+
+    def tracing_status(self) -> Dict:
+        tracing = tracemalloc.is_tracing()
+        current, peak = tracemalloc.get_traced_memory() if tracing else (0, 0)
+        return {
+            "tracing": tracing,
+            "baseline_at": self._baseline_at,
+            "traced_bytes": current,
+            "peak_traced_bytes": peak
+        }
+
+    def _snapshot(self) -> tracemalloc.Snapshot:
+        return tracemalloc.take_snapshot().filter_traces(_TRACE_FILTERS)
+
+    async def take_baseline(self) -> Dict:
+        """Start tracing if needed and record the baseline later diffs compare against"""
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(self.trace_frames)
+            self._started_tracing = True
+            print(f"🧠 tracemalloc started ({self.trace_frames} frame(s) per allocation)")
+        self._baseline = await asyncio.to_thread(self._snapshot)
+        self._baseline_at = datetime.now().isoformat()
+        return self.tracing_status()
+
+    async def diff(self, top: int = 20, group_by: str = "lineno") -> Dict:
+        """Top allocation sites by growth since the baseline"""
+        if self._baseline is None or not tracemalloc.is_tracing():
+            raise ValueError("No baseline: POST /api/admin/memory/baseline first")
+        if group_by not in ("lineno", "filename", "traceback"):
+            raise ValueError("group_by must be lineno, filename or traceback")
+
+        snapshot = await asyncio.to_thread(self._snapshot)
+        differences = await asyncio.to_thread(snapshot.compare_to, self._baseline, group_by)
+        return {
+            **self.tracing_status(),
+            "group_by": group_by,
+            "top": [
+                {
+                    "site": [f"{frame.filename}:{frame.lineno}" for frame in stat.traceback],
+                    "size_diff_bytes": stat.size_diff,
+                    "count_diff": stat.count_diff,
+                    "size_bytes": stat.size,
+                    "count": stat.count
+                }
+                for stat in differences[:top]
+            ]
+        }
+
+    def stop_tracing(self) -> Dict:
+        """Drop the baseline and stop tracing if this accountant started it"""
+        self._baseline = None
+        self._baseline_at = None
+        if self._started_tracing and tracemalloc.is_tracing():
+            tracemalloc.stop()
+            print("🧠 tracemalloc stopped")
+        self._started_tracing = False
+        return self.tracing_status()
+
+
+# Global accountant instance
+memory_accountant = MemoryAccountant()
@@ -24,12 +24,14 @@ class NextQuestionRequest(BaseModel):
     chatHistory: List[ChatMessage]
     answers: UserAnswers
     requestId: Optional[str] = None
+    conversationId: Optional[str] = None
 
 class NextQuestionResponse(BaseModel):
     message: str
     options: Optional[List[str]] = None
     isComplete: bool
     updatedAnswers: Optional[UserAnswers] = None
+    conversationId: Optional[str] = None
 
 class SaveProfileRequest(BaseModel):
     monthlyInvestment: str
@@ -66,6 +68,31 @@ class RiskBreakdown(BaseModel):
     medium: int
     low: int
 
+# Plan JSON requested from the AI in structured-output mode
+class AIPlanResponse(BaseModel):
+    riskAllocation: RiskBreakdown
+    investments: List[InvestmentOption]
+    timeline: Optional[str] = None
+    expectedReturn: Optional[str] = None
+    recommendations: Optional[List[str]] = None
+
+# Changes requested from the AI when refining an existing plan
+class AIOptionChange(BaseModel):
+    index: int
+    type: Optional[str] = None
+    name: Optional[str] = None
+    amount: Optional[int] = None
+    percentage: Optional[int] = None
+    reason: Optional[str] = None
+    holdingPeriod: Optional[str] = None
+    risk: Optional[str] = None
+
+class AIPlanPatch(BaseModel):
+    update: List[AIOptionChange] = []
+    remove: List[int] = []
+    add: List[InvestmentOption] = []
+    riskAllocation: Optional[RiskBreakdown] = None
+
 class InvestmentPlan(BaseModel):
     totalAmount: int
     monthlyInvestment: int
@@ -80,12 +107,24 @@ class InvestmentPlan(BaseModel):
 class GeneratePlanRequest(BaseModel):
     profileId: str
     feedback: Optional[str] = None
+    basePlanId: Optional[str] = None  # Refine this plan with the feedback instead of regenerating
 
 class GeneratePlanResponse(BaseModel):
     success: bool
     plan: InvestmentPlan
     message: str
 
+class GoalSolveRequest(BaseModel):
+    targetAmount: float
+    solveFor: str = "monthly"  # "monthly" (required amount per horizon) | "time" (months to goal per amount)
+    years: Optional[List[float]] = None  # Horizons for solveFor=monthly
+    monthlyAmounts: Optional[List[float]] = None  # Contributions for solveFor=time (default: the plan's amount)
+    currentSavings: float = 0
+    annualStepUp: float = 0  # Percent the monthly amount rises each year
+    annualReturns: Optional[List[float]] = None  # Percent; default is a spread around the mix's expected return
+    planId: Optional[str] = None
+    riskBreakdown: Optional[RiskBreakdown] = None  # Risk mix when there is no saved plan
+
 class SavePlanRequest(BaseModel):
     profileId: str
     plan: InvestmentPlan
@@ -0,0 +1,220 @@
+"""
+Background job queue for investment plan generation
+
+POST returns a job ID immediately; a pool of worker tasks inside the app runs
+the plan generation and clients poll the job or subscribe to its completion
+event. Jobs run in the process that accepted them, but their state is kept in
+the configured storage backend, so with STORAGE_BACKEND=sqlite any worker can
+answer status polls and completion waits. When a worker starts, unfinished jobs
+left by a process that is no longer running are marked failed, and the oldest
+finished jobs beyond the retention limit are removed from the store.
+"""
+
+import asyncio
+import os
+import socket
+from collections import OrderedDict
+from datetime import datetime
+from typing import Awaitable, Callable, Dict, Optional, Tuple
+
+from memory_report import measure
+from models import GeneratePlanRequest
+from storage import create_store, new_id
+
+PlanHandler = Callable[[GeneratePlanRequest], Awaitable[Tuple[Dict, str]]]
+
+
+class JobQueueFull(Exception):
+    """Raised when no more plan jobs can be queued"""
+
+
+class PlanJobQueue:
+    """Bounded queue of plan jobs processed by a fixed number of worker tasks"""
+
+    QUEUED = "queued"
+    RUNNING = "running"
+    COMPLETED = "completed"
+    FAILED = "failed"
+
+    def __init__(self):
+        self.concurrency = int(os.getenv("PLAN_JOB_WORKERS", "4"))
+        self.max_queued = int(os.getenv("PLAN_JOB_QUEUE_SIZE", "100"))
+        self.max_retained = int(os.getenv("PLAN_JOB_RETAINED", "1000"))
+        self.poll_interval = float(os.getenv("PLAN_JOB_POLL_SECONDS", "0.5"))
+        # Shared job records, readable by every worker
+        self.jobs = create_store("plan_jobs")
+        # Status of the jobs this process accepted, oldest first (retention and metrics)
+        self._owned: "OrderedDict[str, str]" = OrderedDict()
+        self._events: Dict[str, asyncio.Event] = {}
+        self._queue: Optional[asyncio.Queue] = None
+        self._workers = []
+        self._handler: Optional[PlanHandler] = None
+        self._host = socket.gethostname()
+
+    def start(self, handler: PlanHandler):
+        """Start the worker pool on the running event loop"""
+        self._recover_persisted()
+        self._handler = handler
+        self._queue = asyncio.Queue(maxsize=self.max_queued)
+        self._workers = [
+            asyncio.create_task(self._worker(index)) for index in range(self.concurrency)
+        ]
+        print(f"✅ Plan job workers started: {self.concurrency}")
+
+    async def stop(self):
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+
+    def _owner_alive(self, owner: Optional[Dict]) -> bool:
+        """Whether the process that accepted a job is still running (only checkable on this host)"""
+        if not owner or owner.get("host") != self._host:
+            return owner is not None
+        if owner.get("pid") == os.getpid():
+            return False
+        try:
+            os.kill(owner["pid"], 0)
+        except ProcessLookupError:
+            return False
+        except PermissionError:
+            pass
+        return True
+
+    def _recover_persisted(self):
+        """Fail jobs orphaned by a restart and trim finished jobs beyond the retention limit"""
+        finished = []
+        interrupted = 0
+        for job_id, job in sorted(self.jobs.items()):
+            if job["status"] in (self.QUEUED, self.RUNNING) and not self._owner_alive(job.get("owner")):
+                job["status"] = self.FAILED
+                job["error"] = "Interrupted by restart"
+                job["finishedAt"] = datetime.now().isoformat()
+                self.jobs[job_id] = job
+                interrupted += 1
+            if job["status"] in (self.COMPLETED, self.FAILED):
+                finished.append(job_id)
+
+        excess = len(finished) - self.max_retained
+        for job_id in finished[:max(excess, 0)]:
+            self.jobs.pop(job_id, None)
+        if interrupted or excess > 0:
+            print(f"♻️ Plan jobs recovered: {interrupted} interrupted, {max(excess, 0)} old jobs removed")
+
+    def submit(self, request: GeneratePlanRequest) -> Dict:
+        """Queue a plan job and return its record"""
+        if self._queue is None:
+            raise RuntimeError("Plan job workers are not running")
+
+        job_id = new_id("job")
+        job = {
+            "jobId": job_id,
+            "status": self.QUEUED,
+            "profileId": request.profileId,
+            "planId": None,
+            "message": None,
+            "error": None,
+            "createdAt": datetime.now().isoformat(),
+            "finishedAt": None,
+            "owner": {"host": self._host, "pid": os.getpid()}
+        }
+        try:
+            self._queue.put_nowait((job_id, request))
+        except asyncio.QueueFull:
+            raise JobQueueFull("Plan job queue is full")
+
+        self._owned[job_id] = job["status"]
+        self._save(job)
+        self._events[job_id] = asyncio.Event()
+        self._evict_finished()
+        return self._public(job)
+
+    def _save(self, job: Dict):
+        self.jobs[job["jobId"]] = job
+        if job["jobId"] in self._owned:
+            self._owned[job["jobId"]] = job["status"]
+
+    def get(self, job_id: str) -> Optional[Dict]:
+        job = self.jobs.get(job_id)
+        return self._public(job) if job is not None else None
+
+    def _public(self, job: Dict) -> Dict:
+        """Job record without the internal owner field"""
+        return {key: value for key, value in job.items() if key != "owner"}
+
+    async def wait(self, job_id: str, timeout: float) -> bool:
+        """Wait for a job to finish; returns False if the timeout passed first"""
+        event = self._events.get(job_id)
+        if event is not None:
+            try:
+                await asyncio.wait_for(event.wait(), timeout=timeout)
+                return True
+            except asyncio.TimeoutError:
+                return False
+
+        # Accepted by another worker: poll the shared record
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        while True:
+            job = self.jobs.get(job_id)
+            if job is None or job["status"] in (self.COMPLETED, self.FAILED):
+                return True
+            if loop.time() >= deadline:
+                return False
+            await asyncio.sleep(min(self.poll_interval, deadline - loop.time()))
+
+    async def _worker(self, index: int):
+        while True:
+            job_id, request = await self._queue.get()
+            job = self.jobs.get(job_id)
+            try:
+                if job is None:
+                    continue
+                job["status"] = self.RUNNING
+                self._save(job)
+                plan_dict, message = await self._handler(request)
+                job["planId"] = plan_dict.get("planId")
+                job["message"] = message
+                job["status"] = self.COMPLETED
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"❌ Plan job {job_id} failed: {e}")
+                job["status"] = self.FAILED
+                job["error"] = getattr(e, "detail", None) or str(e)
+            finally:
+                if job is not None and job["status"] in (self.COMPLETED, self.FAILED):
+                    job["finishedAt"] = datetime.now().isoformat()
+                    self._save(job)
+                    self._events.pop(job_id, asyncio.Event()).set()
+                self._queue.task_done()
+
+    def _evict_finished(self):
+        """Drop this process's oldest finished jobs beyond the retention limit"""
+        excess = len(self._owned) - self.max_retained
+        if excess <= 0:
+            return
+        for job_id, status in list(self._owned.items()):
+            if excess <= 0:
+                break
+            if status in (self.COMPLETED, self.FAILED):
+                del self._owned[job_id]
+                self.jobs.pop(job_id, None)
+                excess -= 1
+
+    def memory_usage(self, sample_size: int) -> Dict:
+        return measure(self.jobs, sample_size)
+
+    def get_metrics(self) -> Dict:
+        counts = {self.QUEUED: 0, self.RUNNING: 0, self.COMPLETED: 0, self.FAILED: 0}
+        for status in self._owned.values():
+            counts[status] += 1
+        return {
+            "workers": len(self._workers),
+            "queue_depth": self._queue.qsize() if self._queue else 0,
+            **counts
+        }
+
+
+# Global job queue instance
+plan_job_queue = PlanJobQueue()
@@ -0,0 +1,263 @@
+"""
+Versioned plan storage with structural sharing
+
+Every stored plan becomes a version in its profile's history. A version keeps
+only what changed relative to its parent - option slots, risk breakdown and
+recommendations - as references into a content-addressed pool, so identical
+pieces are stored once and shared by every version that uses them. Versions
+link to their parent and to the profile's previous version, so a save writes
+one small record. Any version is rebuilt on read, in the key order it was saved
+with, so it always encodes to the same bytes; recently used plans stay cached
+as encoded bytes, tagged with the revision they encode so a re-save by another
+worker is never served stale. With STORAGE_BACKEND=sqlite each save runs in one
+transaction, so concurrent saves from several workers keep the history intact.
+
+VersionedPlanStore is a drop-in for the plans_storage mapping: keys are plan
+IDs, values are the pre-encoded plan records.
+"""
+
+import hashlib
+import os
+from collections import OrderedDict
+from contextlib import nullcontext
+from collections.abc import MutableMapping
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import orjson
+
+from memory_report import measure
+from storage import SQLiteStore, create_store, new_id
+
+# Plan fields stored as shared pieces; the remaining (small, scalar) fields are kept with every version
+_PIECE_FIELDS = ("options", "riskBreakdown", "recommendations")
+
+
+def piece_ref(piece) -> str:
+    """Content address of an option, risk breakdown or recommendation list"""
+    return hashlib.blake2b(orjson.dumps(piece, option=orjson.OPT_SORT_KEYS), digest_size=12).hexdigest()
+
+
+class VersionedPlanStore(MutableMapping):
+    """plans_storage replacement that stores plan versions as deltas over shared pieces"""
+
+    def __init__(self):
+        self.checkpoint_interval = int(os.getenv("PLAN_VERSION_CHECKPOINT", "16"))
+        self.cache_size = int(os.getenv("PLAN_CACHE_SIZE", "512"))
+        self.pieces: MutableMapping = create_store("plan_pieces")
+        # First save of each plan, keyed by plan ID
+        self.versions: MutableMapping = create_store("plan_versions")
+        # Later saves of a plan under the same ID; earlier versions stay as they were for their children
+        self.revisions: MutableMapping = create_store("plan_revisions")
+        # Plan ID -> key of its current revision (only for plans saved more than once)
+        self.current_revision: MutableMapping = create_store("plan_current_revision")
+        # Profile ID -> its most recently added plan ID
+        self.latest: MutableMapping = create_store("plan_latest")
+        # Plan ID -> (version key, encoded record); the key is checked against current_revision on read
+        self._encoded: "OrderedDict[str, Tuple[str, bytes]]" = OrderedDict()
+
+    # Mapping interface
+
+    def __getitem__(self, plan_id: str) -> bytes:
+        key = self._current_key(plan_id)
+        cached = self._encoded.get(plan_id)
+        if cached is not None and cached[0] == key:
+            self._encoded.move_to_end(plan_id)
+            return cached[1]
+
+        encoded = orjson.dumps(self._reconstruct_version(key))
+        self._cache(plan_id, key, encoded)
+        return encoded
+
+    def __setitem__(self, plan_id: str, encoded: bytes):
+        record = orjson.loads(encoded)
+        with self._transaction():
+            self._add_version(plan_id, record)
+        # Cache the rebuilt encoding so every read (and ETag) matches what a restart would serve
+        key = self._current_key(plan_id)
+        self._cache(plan_id, key, orjson.dumps(self._reconstruct_version(key)))
+
+    def __delitem__(self, plan_id: str):
+        raise TypeError("Plan versions are immutable")
+
+    def __contains__(self, plan_id) -> bool:
+        return plan_id in self._encoded or plan_id in self.versions
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(list(self.versions))
+
+    def __len__(self) -> int:
+        return len(self.versions)
+
+    # Versioning
+
+    def _transaction(self):
+        """One write transaction per save when the stores share a SQLite database"""
+        if isinstance(self.latest, SQLiteStore):
+            return self.latest.transaction()
+        return nullcontext()
+
+    def _current_key(self, plan_id: str) -> str:
+        """Version key of a plan's current content"""
+        return self.current_revision.get(plan_id, plan_id)
+
+    def _version(self, key: str) -> Dict:
+        version = self.versions.get(key)
+        return version if version is not None else self.revisions[key]
+
+    def _add_version(self, plan_id: str, record: Dict):
+        plan = record["plan"]
+        profile_id = record.get("profile_id")
+
+        # Re-saving an existing plan keeps its parent and its place in the history
+        existing = self._version(self._current_key(plan_id)) if plan_id in self.versions else None
+        if existing is not None:
+            parent_key = existing["parent"]
+            previous = existing["previous"]
+        else:
+            previous = self.latest.get(profile_id) if profile_id is not None else None
+            parent_id = record.get("parent_plan_id") or previous
+            parent_key = self._current_key(parent_id) if parent_id in self.versions else None
+
+        option_refs = [self._intern(option) for option in plan["options"]]
+        risk_ref = self._intern(plan["riskBreakdown"])
+        recommendations_ref = self._intern(plan["recommendations"])
+
+        version = {
+            "plan_id": plan_id,
+            "profile_id": profile_id,
+            "parent": parent_key,
+            "previous": previous,
+            "record_keys": list(record),
+            "plan_keys": list(plan),
+            "meta": {key: value for key, value in record.items() if key not in ("plan", "profile_id")},
+            "scalars": {field: plan[field] for field in plan if field not in _PIECE_FIELDS},
+            "option_count": len(option_refs),
+            "depth": 0 if parent_key is None else self._version(parent_key)["depth"] + 1
+        }
+
+        if version["depth"] % self.checkpoint_interval == 0:
+            # Checkpoint: full references bound the cost of rebuilding long histories
+            version["options"] = option_refs
+            version["risk"] = risk_ref
+            version["recommendations"] = recommendations_ref
+        else:
+            parent_options, parent_risk, parent_recommendations = self._resolve_refs(parent_key)
+            version["option_changes"] = {
+                str(index): ref for index, ref in enumerate(option_refs)
+                if index >= len(parent_options) or parent_options[index] != ref
+            }
+            version["risk"] = risk_ref if risk_ref != parent_risk else None
+            version["recommendations"] = recommendations_ref if recommendations_ref != parent_recommendations else None
+
+        if existing is None:
+            self.versions[plan_id] = version
+            if profile_id is not None:
+                self.latest[profile_id] = plan_id
+        else:
+            # Children keep pointing at the version they were derived from
+            revision_key = new_id("revision")
+            self.revisions[revision_key] = version
+            self.current_revision[plan_id] = revision_key
+
+    def _intern(self, piece) -> str:
+        ref = piece_ref(piece)
+        if ref not in self.pieces:
+            self.pieces[ref] = piece
+        return ref
+
+    def _resolve_refs(self, key: str):
+        """Option, risk and recommendation references of a version, walking back to a checkpoint"""
+        chain = []
+        current = key
+        while True:
+            version = self._version(current)
+            chain.append(version)
+            if "options" in version:
+                break
+            current = version["parent"]
+
+        checkpoint = chain.pop()
+        options = list(checkpoint["options"])
+        risk = checkpoint["risk"]
+        recommendations = checkpoint["recommendations"]
+
+        for version in reversed(chain):
+            count = version["option_count"]
+            options = (options + [None] * count)[:count]
+            for index, ref in version["option_changes"].items():
+                options[int(index)] = ref
+            risk = version["risk"] or risk
+            recommendations = version["recommendations"] or recommendations
+
+        return options, risk, recommendations
+
+    def reconstruct(self, plan_id: str) -> Dict:
+        """Rebuild the full stored record for any plan, with its original key order"""
+        return self._reconstruct_version(self._current_key(plan_id))
+
+    def _reconstruct_version(self, key: str) -> Dict:
+        version = self._version(key)
+        option_refs, risk_ref, recommendations_ref = self._resolve_refs(key)
+
+        pieces = {
+            "options": [self.pieces[ref] for ref in option_refs],
+            "riskBreakdown": self.pieces[risk_ref],
+            "recommendations": self.pieces[recommendations_ref]
+        }
+        scalars = version["scalars"]
+        plan_keys = version.get("plan_keys") or [*scalars, *_PIECE_FIELDS]
+        plan = {field: pieces[field] if field in pieces else scalars.get(field) for field in plan_keys}
+
+        fields = {"plan": plan, "profile_id": version["profile_id"], **version["meta"]}
+        record_keys = version.get("record_keys") or list(fields)
+        return {field: fields[field] for field in record_keys}
+
+    def history(self, profile_id: str) -> List[Dict]:
+        """All plans of a profile, oldest first, with what each version changed"""
+        entries = []
+        plan_id: Optional[str] = self.latest.get(profile_id)
+        while plan_id is not None:
+            version = self._version(self._current_key(plan_id))
+            is_checkpoint = "options" in version
+            parent = version["parent"]
+            entries.append({
+                "planId": plan_id,
+                "parentPlanId": self._version(parent)["plan_id"] if parent is not None else None,
+                "createdAt": version["scalars"].get("createdAt"),
+                "changes": {
+                    "options": version["option_count"] if is_checkpoint else len(version["option_changes"]),
+                    "optionCount": version["option_count"],
+                    "riskBreakdown": is_checkpoint or version["risk"] is not None,
+                    "recommendations": is_checkpoint or version["recommendations"] is not None
+                },
+                **version["meta"]
+            })
+            plan_id = version["previous"]
+        entries.reverse()
+        return [{"version": number, **entry} for number, entry in enumerate(entries, start=1)]
+
+    def _cache(self, plan_id: str, key: str, encoded: bytes):
+        self._encoded[plan_id] = (key, encoded)
+        self._encoded.move_to_end(plan_id)
+        if len(self._encoded) > self.cache_size:
+            self._encoded.popitem(last=False)
+
+    def memory_usage(self, sample_size: int) -> Dict:
+        """Size of the encoded-plan read cache"""
+        return measure(self._encoded, sample_size)
+
+    def get_metrics(self) -> Dict:
+        return {
+            "versions": len(self.versions),
+            "shared_pieces": len(self.pieces),
+            "revisions": len(self.revisions),
+            "profiles": len(self.latest),
+            "cached_plans": len(self._encoded)
+        }
+
+
+def create_plan_store() -> MutableMapping:
+    """Versioned plan store, or flat pre-encoded records when PLAN_VERSIONING is off"""
+    if os.getenv("PLAN_VERSIONING", "True").lower() == "true":
+        return VersionedPlanStore()
+    return create_store("plans", raw_bytes=True)
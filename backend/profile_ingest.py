@@ -0,0 +1,142 @@
+"""
+Bulk NDJSON profile ingestion
+
+Reads SaveProfileRequest records line by line from a streamed request body,
+validates and normalizes them in batches, writes each batch to the profile
+store in one bulk update and streams back one NDJSON result per input line.
+"""
+
+import os
+from datetime import datetime
+from typing import AsyncIterator, Dict, List, MutableMapping, Tuple
+
+import orjson
+from fastapi.responses import StreamingResponse
+from pydantic import ValidationError
+
+from models import SaveProfileRequest
+from profile_record import ProfileRecord
+from storage import new_id
+
+
+class IngestStreamingResponse(StreamingResponse):
+    """Streams results while the request body is still being read.
+
+    StreamingResponse listens for client disconnects on the receive channel,
+    which would swallow the request body, so this variant only streams.
+    """
+
+    async def __call__(self, scope, receive, send) -> None:
+        await self.stream_response(send)
+
+
+def _validation_message(error: ValidationError) -> str:
+    return "; ".join(
+        f"{'.'.join(str(part) for part in item['loc']) or 'record'}: {item['msg']}"
+        for item in error.errors()
+    )
+
+
+class ProfileIngestor:
+    """Batch validation, normalization and bulk store writes for NDJSON profiles"""
+
+    def __init__(self):
+        self.batch_size = int(os.getenv("INGEST_BATCH_SIZE", "1000"))
+        self.max_line_bytes = int(os.getenv("INGEST_MAX_LINE_BYTES", "65536"))
+        self.stats = {"accepted": 0, "rejected": 0, "batches": 0}
+
+    def _build_batch(self, lines: List[Tuple[int, bytes]]) -> Tuple[Dict[str, ProfileRecord], List[Dict]]:
+        """Validate and normalize one batch; returns the records to store and per-line results"""
+        created_at = datetime.now().isoformat()
+        records: Dict[str, ProfileRecord] = {}
+        results = []
+        for line_number, line in lines:
+            if len(line) > self.max_line_bytes:
+                results.append({"line": line_number, "error": f"line exceeds {self.max_line_bytes} bytes"})
+                continue
+            try:
+                request = SaveProfileRequest.model_validate(orjson.loads(line))
+            except orjson.JSONDecodeError:
+                results.append({"line": line_number, "error": "invalid JSON"})
+                continue
+            except ValidationError as e:
+                results.append({"line": line_number, "error": _validation_message(e)})
+                continue
+
+            profile_id = new_id("profile")
+            records[profile_id] = ProfileRecord(
+                id=profile_id,
+                monthly_investment=request.monthlyInvestment,
+                preference=request.investmentPreference,
+                risk_tolerance=request.riskTolerance,
+                goal=request.goal,
+                age=request.age,
+                income=request.income,
+                experience=request.experience,
+                time_horizon=request.timeHorizon,
+                created_at=created_at
+            )
+            results.append({"line": line_number, "profileId": profile_id})
+        return records, results
+
+    def _flush(self, store: MutableMapping, lines: List[Tuple[int, bytes]]) -> Tuple[bytes, int, int]:
+        """Store one batch; returns the encoded results and the accepted/rejected counts"""
+        records, results = self._build_batch(lines)
+        if records:
+            store.update(records)
+
+        accepted = len(records)
+        rejected = len(results) - accepted
+        self.stats["accepted"] += accepted
+        self.stats["rejected"] += rejected
+        self.stats["batches"] += 1
+        print(f"📥 Ingested batch: {accepted} profiles stored, {rejected} rejected")
+        return b"".join(orjson.dumps(result) + b"\n" for result in results), accepted, rejected
+
+    async def ingest(self, chunks: AsyncIterator[bytes], store: MutableMapping) -> AsyncIterator[bytes]:
+        """Consume an NDJSON byte stream and yield NDJSON results, one batch at a time"""
+        pending = b""
+        oversized = False
+        lines: List[Tuple[int, bytes]] = []
+        line_number = 0
+        accepted = rejected = 0
+
+        async for chunk in chunks:
+            *complete, tail = chunk.split(b"\n")
+            for part in complete:
+                line = pending if oversized else pending + part
+                pending = b""
+                oversized = False
+                line_number += 1
+                if line.strip():
+                    lines.append((line_number, line))
+                if len(lines) >= self.batch_size:
+                    output, batch_accepted, batch_rejected = self._flush(store, lines)
+                    accepted += batch_accepted
+                    rejected += batch_rejected
+                    lines = []
+                    yield output
+
+            if not oversized:
+                pending += tail
+                if len(pending) > self.max_line_bytes:
+                    # Keep just enough to report the line as too long and drop the rest of it
+                    pending = pending[:self.max_line_bytes + 1]
+                    oversized = True
+
+        if pending.strip():
+            lines.append((line_number + 1, pending))
+        if lines:
+            output, batch_accepted, batch_rejected = self._flush(store, lines)
+            accepted += batch_accepted
+            rejected += batch_rejected
+            yield output
+
+        yield orjson.dumps({"summary": {"accepted": accepted, "rejected": rejected}}) + b"\n"
+
+    def get_metrics(self) -> Dict:
+        return dict(self.stats)
+
+
+# Global ingestor instance
+profile_ingestor = ProfileIngestor()
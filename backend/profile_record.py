@@ -0,0 +1,262 @@
+"""
+Compact, pre-normalized investment profile representation
+
+Free-text profile answers are classified once when a profile is saved, into
+small-int enums plus integer amount and age. Plan generation works from these
+instead of re-parsing the text on every request. The original text is kept
+alongside for prompts and API output.
+"""
+
+import re
+from enum import IntEnum
+from typing import Dict, Optional
+
+
+class RiskLevel(IntEnum):
+    MODERATE = 0
+    CONSERVATIVE = 1
+    AGGRESSIVE = 2
+
+
+class RiskComfort(IntEnum):
+    """Finer-grained reading of how the client described their risk comfort"""
+    UNSPECIFIED = 0
+    VERY_CONCERNED = 1
+    SOMEWHAT_WORRIED = 2
+    NOT_TOO_BOTHERED = 3
+    COMPLETELY_FINE = 4
+    AGGRESSIVE = 5
+
+
+class GoalType(IntEnum):
+    OTHER = 0
+    RETIREMENT = 1
+    HOUSE = 2
+    EMERGENCY = 3
+    EDUCATION = 4
+    WEALTH = 5
+
+
+class PreferenceType(IntEnum):
+    UNKNOWN = 0
+    CONSERVATIVE = 1
+    MODERATE = 2
+    AGGRESSIVE = 3
+
+
+class ExperienceLevel(IntEnum):
+    UNKNOWN = 0
+    BEGINNER = 1
+    INTERMEDIATE = 2
+    ADVANCED = 3
+
+
+class TimeHorizon(IntEnum):
+    UNKNOWN = 0
+    SHORT = 1
+    MEDIUM = 2
+    LONG = 3
+
+
+DEFAULT_MONTHLY_INVESTMENT = 5000
+
+_NUMBER_PATTERN = re.compile(r'\d+')
+
+
+def parse_amount(amount_str: Optional[str]) -> int:
+    """Parse amount string to integer with proper logic"""
+    if not amount_str or amount_str == "undefined":
+        return DEFAULT_MONTHLY_INVESTMENT
+
+    amount_str = amount_str.lower().strip()
+
+    # Handle range selections properly
+    if "$100-500" in amount_str:
+        return 300  # Average of range
+    elif "$500-1000" in amount_str or "$500-1,000" in amount_str:
+        return 750  # Average of range
+    elif "$1000-2000" in amount_str or "$1,000-2,000" in amount_str:
+        return 1500  # Average of range
+    elif "more than $2000" in amount_str or "more than $2,000" in amount_str:
+        return 3000  # Conservative estimate
+
+    # Extract first number found if direct amount
+    numbers = _NUMBER_PATTERN.findall(amount_str.replace(',', ''))
+    if numbers:
+        return int(numbers[0])
+
+    return DEFAULT_MONTHLY_INVESTMENT
+
+
+def parse_age(age_str: Optional[str]) -> int:
+    """Parse '28', '28 years' or '30s' to whole years; 0 means unknown"""
+    if not age_str:
+        return 0
+    match = _NUMBER_PATTERN.search(age_str)
+    return int(match.group()) if match else 0
+
+
+def classify_risk(text: str) -> RiskLevel:
+    if "aggressive" in text or "high" in text:
+        return RiskLevel.AGGRESSIVE
+    elif "conservative" in text or "low" in text:
+        return RiskLevel.CONSERVATIVE
+    return RiskLevel.MODERATE
+
+
+def classify_risk_comfort(text: str) -> RiskComfort:
+    if "very concerned" in text:
+        return RiskComfort.VERY_CONCERNED
+    elif "somewhat worried" in text:
+        return RiskComfort.SOMEWHAT_WORRIED
+    elif "not too bothered" in text:
+        return RiskComfort.NOT_TOO_BOTHERED
+    elif "completely fine" in text:
+        return RiskComfort.COMPLETELY_FINE
+    elif "aggressive" in text:
+        return RiskComfort.AGGRESSIVE
+    return RiskComfort.UNSPECIFIED
+
+
+def classify_goal(text: str) -> GoalType:
+    if "retirement" in text or "retire" in text:
+        return GoalType.RETIREMENT
+    elif "house" in text or "home" in text:
+        return GoalType.HOUSE
+    elif "emergency" in text:
+        return GoalType.EMERGENCY
+    elif "education" in text or "college" in text:
+        return GoalType.EDUCATION
+    elif "wealth" in text or "growth" in text:
+        return GoalType.WEALTH
+    return GoalType.OTHER
+
+
+def classify_preference(text: str) -> PreferenceType:
+    if "conservative" in text:
+        return PreferenceType.CONSERVATIVE
+    elif "moderate" in text or "balanced" in text:
+        return PreferenceType.MODERATE
+    elif "aggressive" in text:
+        return PreferenceType.AGGRESSIVE
+    return PreferenceType.UNKNOWN
+
+
+def classify_experience(text: str) -> ExperienceLevel:
+    if "beginner" in text or "new" in text or "novice" in text:
+        return ExperienceLevel.BEGINNER
+    elif "advanced" in text or "experienced" in text or "expert" in text:
+        return ExperienceLevel.ADVANCED
+    elif "intermediate" in text or "some" in text:
+        return ExperienceLevel.INTERMEDIATE
+    return ExperienceLevel.UNKNOWN
+
+
+def classify_horizon(text: str) -> TimeHorizon:
+    if "short" in text:
+        return TimeHorizon.SHORT
+    elif "medium" in text or "mid" in text:
+        return TimeHorizon.MEDIUM
+    elif "long" in text:
+        return TimeHorizon.LONG
+    return TimeHorizon.UNKNOWN
+
+
+class ProfileRecord:
+    """Saved investment profile: original answers plus their normalized form"""
+
+    __slots__ = (
+        "id", "created_at",
+        # Original text answers
+        "monthly_investment", "preference", "risk_tolerance", "goal",
+        "age", "income", "experience", "time_horizon",
+        # Normalized values
+        "amount", "age_years", "risk_level", "risk_comfort", "goal_type",
+        "preference_type", "experience_level", "horizon"
+    )
+
+    TEXT_FIELDS = (
+        "monthly_investment", "preference", "risk_tolerance", "goal",
+        "age", "income", "experience", "time_horizon"
+    )
+
+    def __init__(
+        self,
+        id: str,
+        monthly_investment: Optional[str] = None,
+        preference: Optional[str] = None,
+        risk_tolerance: Optional[str] = None,
+        goal: Optional[str] = None,
+        age: Optional[str] = None,
+        income: Optional[str] = None,
+        experience: Optional[str] = None,
+        time_horizon: Optional[str] = None,
+        created_at: Optional[str] = None
+    ):
+        self.id = id
+        self.created_at = created_at
+        self.monthly_investment = monthly_investment
+        self.preference = preference
+        self.risk_tolerance = risk_tolerance
+        self.goal = goal
+        self.age = age
+        self.income = income
+        self.experience = experience
+        self.time_horizon = time_horizon
+        self.normalize()
+
+    def normalize(self):
+        """Classify the text answers once"""
+        risk_text = (self.risk_tolerance or "").lower()
+        self.amount = parse_amount(self.monthly_investment)
+        self.age_years = parse_age(self.age)
+        self.risk_level = classify_risk(risk_text)
+        self.risk_comfort = classify_risk_comfort(risk_text)
+        self.goal_type = classify_goal((self.goal or "").lower())
+        self.preference_type = classify_preference((self.preference or "").lower())
+        self.experience_level = classify_experience((self.experience or "").lower())
+        self.horizon = classify_horizon((self.time_horizon or "").lower())
+
+    def to_dict(self) -> Dict:
+        """Original profile dict shape, with the normalized values under 'normalized'"""
+        data = {"id": self.id}
+        for field in self.TEXT_FIELDS:
+            data[field] = getattr(self, field)
+        data["created_at"] = self.created_at
+        data["normalized"] = {
+            "amount": self.amount,
+            "age_years": self.age_years,
+            "risk_level": int(self.risk_level),
+            "risk_comfort": int(self.risk_comfort),
+            "goal_type": int(self.goal_type),
+            "preference_type": int(self.preference_type),
+            "experience_level": int(self.experience_level),
+            "horizon": int(self.horizon)
+        }
+        return data
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> "ProfileRecord":
+        """Rebuild a record from to_dict() output or a plain profile dict"""
+        record = cls.__new__(cls)
+        record.id = data.get("id")
+        record.created_at = data.get("created_at")
+        for field in cls.TEXT_FIELDS:
+            setattr(record, field, data.get(field))
+
+        normalized = data.get("normalized")
+        if normalized:
+            record.amount = normalized["amount"]
+            record.age_years = normalized["age_years"]
+            record.risk_level = RiskLevel(normalized["risk_level"])
+            record.risk_comfort = RiskComfort(normalized["risk_comfort"])
+            record.goal_type = GoalType(normalized["goal_type"])
+            record.preference_type = PreferenceType(normalized["preference_type"])
+            record.experience_level = ExperienceLevel(normalized["experience_level"])
+            record.horizon = TimeHorizon(normalized["horizon"])
+        else:
+            record.normalize()
+        return record
+
+    def __repr__(self):
+        return f"<ProfileRecord(id={self.id}, amount={self.amount}, risk={self.risk_level.name}, goal={self.goal_type.name})>"
@@ -0,0 +1,118 @@
+"""
+Micro-batching for short concurrent LLM prompts
+
+Prompts submitted within a small window (or until the batch is full) are sent
+upstream as one multi-item request with keyed answers. Each reply is routed back
+to its waiting caller by key; items the reply does not answer are sent again on
+their own.
+"""
+
+import asyncio
+import os
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+BatchSender = Callable[[Dict[str, str]], Awaitable[Dict[str, str]]]
+SingleSender = Callable[[str], Awaitable[str]]
+
+
+class PromptBatcher:
+    """Collects prompts for a few milliseconds and answers them with one upstream call"""
+
+    def __init__(self, send_batch: BatchSender, send_one: SingleSender):
+        self.send_batch = send_batch
+        self.send_one = send_one
+        self.enabled = os.getenv("QUESTION_BATCHING", "False").lower() == "true"
+        self.window = float(os.getenv("QUESTION_BATCH_WINDOW_MS", "5")) / 1000
+        self.max_size = max(1, int(os.getenv("QUESTION_BATCH_MAX_SIZE", "8")))
+
+        self._pending: List[Tuple[str, asyncio.Future]] = []
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._tasks = set()
+        self.stats = {
+            "submitted": 0, "batches": 0, "batched_prompts": 0, "single_calls": 0,
+            "unmatched_fallbacks": 0, "batch_failures": 0, "largest_batch": 0
+        }
+
+    async def submit(self, prompt: str) -> str:
+        """Answer for one prompt, sent alone or as part of the current batch"""
+        self.stats["submitted"] += 1
+        if not self.enabled:
+            self.stats["single_calls"] += 1
+            return await self.send_one(prompt)
+
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((prompt, future))
+        if len(self._pending) >= self.max_size:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.window, self._flush)
+        return await future
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        items = [(prompt, future) for prompt, future in self._pending if not future.done()]
+        self._pending = []
+        if not items:
+            return
+
+        task = asyncio.ensure_future(self._run(items))
+        # Keep a reference until the batch finishes so it is not garbage collected
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, items: List[Tuple[str, asyncio.Future]]):
+        if len(items) == 1:
+            self.stats["single_calls"] += 1
+            await self._answer_one(*items[0])
+            return
+
+        keyed = {f"q{index + 1}": item for index, item in enumerate(items)}
+        self.stats["batches"] += 1
+        self.stats["batched_prompts"] += len(items)
+        self.stats["largest_batch"] = max(self.stats["largest_batch"], len(items))
+        try:
+            answers = await self.send_batch({key: prompt for key, (prompt, _) in keyed.items()})
+        except Exception as e:
+            # The whole call failed: each caller handles it like a failed single call
+            self.stats["batch_failures"] += 1
+            print(f"❌ Batched question call failed for {len(items)} prompts: {e}")
+            for _, future in keyed.values():
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        unmatched = []
+        for key, (prompt, future) in keyed.items():
+            answer = (answers.get(key) or "").strip()
+            if not answer:
+                unmatched.append((prompt, future))
+            elif not future.done():
+                future.set_result(answer)
+
+        if unmatched:
+            self.stats["unmatched_fallbacks"] += len(unmatched)
+            print(f"⚠️ Batched reply missed {len(unmatched)} of {len(items)} prompts, sending them individually")
+            await asyncio.gather(*(self._answer_one(prompt, future) for prompt, future in unmatched))
+
+    async def _answer_one(self, prompt: str, future: asyncio.Future):
+        try:
+            answer = await self.send_one(prompt)
+        except Exception as e:
+            if not future.done():
+                future.set_exception(e)
+            return
+        if not future.done():
+            future.set_result(answer)
+
+    def get_metrics(self) -> Dict:
+        batches = self.stats["batches"]
+        return {
+            **self.stats,
+            "enabled": self.enabled,
+            "window_ms": round(self.window * 1000, 3),
+            "max_size": self.max_size,
+            "avg_batch_size": round(self.stats["batched_prompts"] / batches, 2) if batches else 0.0
+        }
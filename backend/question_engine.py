@@ -0,0 +1,117 @@
+"""
+Template-driven question engine for the advisor chat
+
+For most turns the next question is fully determined by the first missing
+profile field, so it is answered from a rotating pool of phrasings instead of
+calling Gemini. A conversation with no history and no answers yet opens with
+the welcome message. The LLM is only needed when the user's last message did not
+resolve any field (ambiguous input).
+"""
+
+import os
+from typing import Dict, List, Optional
+from models import ChatMessage, UserAnswers
+
+# Fields in the order they are asked, matching GeminiService._get_fallback_question
+QUESTION_FIELDS = [
+    "monthly_investment",
+    "risk_tolerance",
+    "goal",
+    "preference",
+    "age",
+    "experience"
+]
+
+QUESTION_TEMPLATES: Dict[str, List[str]] = {
+    "monthly_investment": [
+        "What amount can you invest monthly? (e.g., $500, $1000, $2000)",
+        "How much would you like to invest each month? (e.g., $500, $1000, $2000)",
+        "To get started, what monthly amount are you comfortable investing? (e.g., $500, $1000, $2000)"
+    ],
+    "risk_tolerance": [
+        "What's your risk tolerance: low (safe), medium (balanced), or high (aggressive)?",
+        "How much risk are you comfortable with: low (safe), medium (balanced), or high (aggressive)?",
+        "If markets dropped sharply, how would you feel? Pick a risk level: low, medium, or high."
+    ],
+    "goal": [
+        "What's your primary financial goal: retirement, house down payment, education, or emergency fund?",
+        "What are you investing for: retirement, a house, education, or an emergency fund?",
+        "Which goal matters most right now: retirement, buying a home, education, or an emergency fund?"
+    ],
+    "preference": [
+        "Investment preference: conservative (bonds/CDs), moderate (balanced funds), or aggressive (stocks)?",
+        "Which style suits you best: conservative (bonds/CDs), moderate (balanced funds), or aggressive (stocks)?",
+        "Do you lean conservative (bonds/CDs), moderate (balanced funds), or aggressive (stocks)?"
+    ],
+    "age": [
+        "What's your age range? (20s, 30s, 40s, 50s+)",
+        "Which age range are you in: 20s, 30s, 40s, or 50s+?",
+        "How old are you? A range is fine (20s, 30s, 40s, 50s+)."
+    ],
+    "experience": [
+        "Investment experience: beginner, intermediate, or advanced?",
+        "How would you describe your investing experience: beginner, intermediate, or advanced?",
+        "Have you invested before? Are you a beginner, intermediate, or advanced investor?"
+    ]
+}
+
+# Same opening as GeminiService's INITIAL_PROMPT response
+WELCOME_MESSAGE = "Welcome! I'll help you create your investment profile. To get started, what specific amount can you invest monthly? (e.g., $500, $1000, $2000)"
+
+ALL_FIELDS_COLLECTED_MESSAGE = "Great! I have enough information to create your investment profile."
+
+
+def has_value(value: Optional[str]) -> bool:
+    """A field counts as answered once it holds meaningful text"""
+    return bool(value) and value != "undefined" and len(value.strip()) > 2
+
+
+class QuestionEngine:
+    """Picks the next question from templates and decides when the LLM is needed"""
+
+    def __init__(self):
+        self.enabled = os.getenv("QUESTION_TEMPLATES_ENABLED", "True").lower() == "true"
+        self._rotation: Dict[str, int] = {field: 0 for field in QUESTION_FIELDS}
+        self.stats = {"template_turns": 0, "llm_turns": 0}
+
+    def resolved_fields(self, previous: UserAnswers, updated: UserAnswers) -> List[str]:
+        """Fields filled in by the latest user message"""
+        return [
+            field for field in UserAnswers.model_fields
+            if not has_value(getattr(previous, field)) and has_value(getattr(updated, field))
+        ]
+
+    def needs_llm(self, chat_history: List[ChatMessage], previous: UserAnswers, updated: UserAnswers) -> bool:
+        """Only ambiguous turns - a user message that resolved nothing - go to the LLM"""
+        if not self.enabled:
+            return True
+        if not chat_history or chat_history[-1].role != "user":
+            return False
+        return not self.resolved_fields(previous, updated)
+
+    def next_question(self, chat_history: List[ChatMessage], answers: UserAnswers) -> str:
+        """Next templated question for the first missing field, rotating phrasings"""
+        if not chat_history and not any(has_value(getattr(answers, field)) for field in UserAnswers.model_fields):
+            return WELCOME_MESSAGE
+        for field in QUESTION_FIELDS:
+            if not has_value(getattr(answers, field)):
+                templates = QUESTION_TEMPLATES[field]
+                index = self._rotation[field]
+                self._rotation[field] = (index + 1) % len(templates)
+                return templates[index]
+        return ALL_FIELDS_COLLECTED_MESSAGE
+
+    def record_turn(self, used_llm: bool):
+        self.stats["llm_turns" if used_llm else "template_turns"] += 1
+
+    def get_metrics(self) -> Dict:
+        total = self.stats["template_turns"] + self.stats["llm_turns"]
+        return {
+            **self.stats,
+            "enabled": self.enabled,
+            "llm_avoidance_rate": round(self.stats["template_turns"] / total, 4) if total else 0.0
+        }
+
+
+# Global engine instance
+question_engine = QuestionEngine()
@@ -0,0 +1,250 @@
+"""
+Resilience helpers for upstream AI calls: deadlines, jittered retries with a
+retry budget, optional request hedging and a circuit breaker
+"""
+
+import asyncio
+import random
+import time
+from collections import deque
+from typing import Awaitable, Callable, Dict, Optional, TypeVar
+
+T = TypeVar("T")
+
+
+class CircuitOpenError(Exception):
+    """Raised when the circuit breaker rejects a call without contacting upstream"""
+
+
+class CircuitBreaker:
+    """Consecutive-failure circuit breaker with a half-open probe after a cooldown"""
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.consecutive_failures = 0
+        self.opened_at: Optional[float] = None
+        self.probe_in_flight = False
+        self.times_opened = 0
+        self.rejected_calls = 0
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return self.CLOSED
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return self.HALF_OPEN
+        return self.OPEN
+
+    def allow_request(self) -> bool:
+        """Check whether a call may go upstream; half-open lets a single probe through"""
+        state = self.state
+        if state == self.CLOSED:
+            return True
+        if state == self.HALF_OPEN and not self.probe_in_flight:
+            self.probe_in_flight = True
+            return True
+        self.rejected_calls += 1
+        return False
+
+    def release_probe(self):
+        """Free the half-open probe slot when a probe is cancelled before finishing"""
+        self.probe_in_flight = False
+
+    def record_success(self):
+        self.consecutive_failures = 0
+        self.opened_at = None
+        self.probe_in_flight = False
+
+    def record_failure(self):
+        self.consecutive_failures += 1
+        if self.probe_in_flight or self.consecutive_failures >= self.failure_threshold:
+            if self.opened_at is None or self.probe_in_flight:
+                self.times_opened += 1
+            self.opened_at = time.monotonic()
+            self.probe_in_flight = False
+
+    def snapshot(self) -> Dict:
+        return {
+            "state": self.state,
+            "consecutive_failures": self.consecutive_failures,
+            "times_opened": self.times_opened,
+            "rejected_calls": self.rejected_calls
+        }
+
+
+class RetryBudget:
+    """Caps retries to a fraction of recent calls so retries cannot amplify an outage"""
+
+    def __init__(self, ratio: float = 0.2, max_tokens: float = 10.0):
+        self.ratio = ratio
+        self.max_tokens = max_tokens
+        self.tokens = max_tokens
+
+    def record_call(self):
+        self.tokens = min(self.max_tokens, self.tokens + self.ratio)
+
+    def try_spend(self) -> bool:
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return True
+        return False
+
+
+class ResilientCaller:
+    """Runs upstream calls with per-attempt timeouts, an overall deadline, jittered
+    retries limited by a budget, optional hedging and a circuit breaker"""
+
+    def __init__(
+        self,
+        timeout: float = 10.0,
+        deadline: float = 25.0,
+        max_retries: int = 2,
+        backoff_base: float = 0.25,
+        retry_budget: Optional[RetryBudget] = None,
+        breaker: Optional[CircuitBreaker] = None,
+        hedge_enabled: bool = False,
+        hedge_delay: float = 2.0,
+        hedge_min_samples: int = 20
+    ):
+        self.timeout = timeout
+        self.deadline = deadline
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.retry_budget = retry_budget or RetryBudget()
+        self.breaker = breaker or CircuitBreaker()
+        self.hedge_enabled = hedge_enabled
+        self.hedge_delay = hedge_delay
+        self.hedge_min_samples = hedge_min_samples
+        self.latencies = deque(maxlen=200)
+        self.stats = {"calls": 0, "retries": 0, "timeouts": 0, "hedges": 0, "hedge_wins": 0, "failures": 0}
+
+    async def call(self, make_call: Callable[[], Awaitable[T]]) -> T:
+        """Call upstream, raising CircuitOpenError straight away while the breaker is open"""
+        self.stats["calls"] += 1
+        self.retry_budget.record_call()
+        started = time.monotonic()
+        attempt = 0
+
+        while True:
+            if not self.breaker.allow_request():
+                raise CircuitOpenError("Gemini circuit breaker is open")
+
+            remaining = self.deadline - (time.monotonic() - started)
+            try:
+                result = await asyncio.wait_for(
+                    self._attempt(make_call),
+                    timeout=max(min(self.timeout, remaining), 0.001)
+                )
+                self.breaker.record_success()
+                return result
+            except asyncio.CancelledError:
+                self.breaker.release_probe()
+                raise
+            except asyncio.TimeoutError as e:
+                self.stats["timeouts"] += 1
+                error = e
+            except Exception as e:
+                error = e
+
+            retryable = is_retryable(error)
+            if retryable:
+                self.breaker.record_failure()
+            else:
+                # Upstream answered; a bad request says nothing about its health
+                self.breaker.release_probe()
+            attempt += 1
+            backoff = self.backoff_base * (2 ** (attempt - 1)) * random.uniform(0.5, 1.5)
+            out_of_time = time.monotonic() - started + backoff >= self.deadline
+            if (
+                attempt > self.max_retries
+                or out_of_time
+                or not retryable
+                or not self.retry_budget.try_spend()
+            ):
+                self.stats["failures"] += 1
+                raise error
+
+            self.stats["retries"] += 1
+            await asyncio.sleep(backoff)
+
+    async def _attempt(self, make_call: Callable[[], Awaitable[T]]) -> T:
+        """Single attempt, hedged with a second request if the first outlives the p95 delay"""
+        started = time.monotonic()
+        if not self.hedge_enabled:
+            result = await make_call()
+            self.latencies.append(time.monotonic() - started)
+            return result
+
+        primary = asyncio.ensure_future(make_call())
+        tasks = {primary}
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=self.current_hedge_delay())
+            if done:
+                result = primary.result()
+                self.latencies.append(time.monotonic() - started)
+                return result
+
+            self.stats["hedges"] += 1
+            hedge = asyncio.ensure_future(make_call())
+            tasks.add(hedge)
+            pending = set(tasks)
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is hedge:
+                            self.stats["hedge_wins"] += 1
+                        self.latencies.append(time.monotonic() - started)
+                        return task.result()
+            # Both requests failed; surface the primary's error
+            return primary.result()
+        finally:
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+
+    def current_hedge_delay(self) -> float:
+        """p95 of recent latencies, or the configured delay until enough samples exist"""
+        if len(self.latencies) < self.hedge_min_samples:
+            return self.hedge_delay
+        ordered = sorted(self.latencies)
+        return ordered[int(len(ordered) * 0.95) - 1]
+
+    def snapshot(self) -> Dict:
+        return {
+            "circuit_breaker": self.breaker.snapshot(),
+            "timeout_seconds": self.timeout,
+            "hedging": self.hedge_enabled,
+            "hedge_delay_seconds": round(self.current_hedge_delay(), 3),
+            "retry_budget_tokens": round(self.retry_budget.tokens, 2),
+            **self.stats
+        }
+
+
+def is_retryable(error: Exception) -> bool:
+    """Timeouts, transport and server errors and 429s are retryable (and count against the
+    circuit breaker); client errors, safety blocks and invalid arguments are not"""
+    if isinstance(error, (ValueError, TypeError)):
+        return False
+    try:
+        from google.generativeai.types import BlockedPromptException, StopCandidateException
+    except ImportError:
+        pass
+    else:
+        if isinstance(error, (BlockedPromptException, StopCandidateException)):
+            return False
+    try:
+        from google.api_core import exceptions as google_exceptions
+    except ImportError:
+        return True
+
+    if isinstance(error, google_exceptions.TooManyRequests):
+        return True
+    if isinstance(error, google_exceptions.ClientError):
+        return False
+    return True
@@ -0,0 +1,298 @@
+"""
+Durable in-memory storage: append-only mutation log plus periodic snapshots
+
+Stores stay plain in-memory mappings; every set/delete is also appended to a
+buffered binary log that a background thread flushes about once a second.
+When the log grows large (or old), it is compacted into a snapshot. On boot
+the snapshot is memory-mapped and the log tail replayed on top of it.
+
+Single writer: use one process per STORAGE_PATH directory.
+"""
+
+import atexit
+import mmap
+import os
+import struct
+import threading
+import time
+import zlib
+from collections.abc import MutableMapping
+from typing import Callable, Dict, Iterator, List, Tuple
+
+OP_SET = 1
+OP_DELETE = 2
+
+# crc32, op, namespace length, key length, value length
+_HEADER = struct.Struct("<IBBHI")
+_SNAPSHOT_MAGIC = b"FPSNAP1\n"
+
+SNAPSHOT_FILE = "snapshot.bin"
+LOG_FILE = "mutations.log"
+ROTATED_LOG_FILE = "mutations.log.old"
+
+
+def encode_record(op: int, namespace: bytes, key: bytes, value: bytes) -> bytes:
+    tail = _HEADER.pack(0, op, len(namespace), len(key), len(value))[4:]
+    crc = zlib.crc32(value, zlib.crc32(key, zlib.crc32(namespace, zlib.crc32(tail))))
+    return struct.pack("<I", crc) + tail + namespace + key + value
+
+
+def read_records(buffer, start: int, verify: bool):
+    """Yield (op, namespace, key, value, end_offset) until the end or the first torn record"""
+    offset = start
+    size = len(buffer)
+    header_size = _HEADER.size
+    while offset + header_size <= size:
+        crc, op, ns_len, key_len, value_len = _HEADER.unpack_from(buffer, offset)
+        body = offset + header_size
+        end = body + ns_len + key_len + value_len
+        if end > size:
+            return
+        if verify and zlib.crc32(buffer[body:end], zlib.crc32(buffer[offset + 4:body])) != crc:
+            return
+        namespace = bytes(buffer[body:body + ns_len]).decode()
+        key = bytes(buffer[body + ns_len:body + ns_len + key_len]).decode()
+        yield op, namespace, key, bytes(buffer[body + ns_len + key_len:end]), end
+        offset = end
+
+
+class SnapshotLog:
+    """Mutation log and snapshot files for one storage directory"""
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self.flush_interval = float(os.getenv("STORAGE_FLUSH_INTERVAL_SECONDS", "1"))
+        self.fsync = os.getenv("STORAGE_FSYNC", "False").lower() == "true"
+        self.compact_bytes = int(os.getenv("STORAGE_COMPACT_BYTES", str(64 * 1024 * 1024)))
+        self.compact_interval = float(os.getenv("STORAGE_COMPACT_SECONDS", "3600"))
+        self.read_only = os.getenv("STORAGE_READ_ONLY", "False").lower() == "true"
+
+        os.makedirs(directory, exist_ok=True)
+        self.lock = threading.RLock()
+        self.stores: Dict[str, "LoggedStore"] = {}
+        self.stats = {"recovered_records": 0, "recovery_seconds": 0.0, "compactions": 0, "appends": 0}
+
+        # Raw entries per namespace, handed to stores as they attach
+        self._recovered: Dict[str, Dict[str, bytes]] = {}
+        self._recover()
+        self._last_compaction = time.monotonic()
+        self._compacting = False
+        self._stop = threading.Event()
+
+        if self.read_only:
+            # Offline readers (exports, batch tools) must not write next to a running server
+            self._file = None
+            self._log_bytes = 0
+            return
+
+        if os.path.exists(self._path(ROTATED_LOG_FILE)):
+            # Finish the compaction that was interrupted before the next one rotates again
+            self._write_snapshot([], self._recovered)
+
+        self._file = open(self._path(LOG_FILE), "ab", buffering=1024 * 1024)
+        self._log_bytes = self._file.tell()
+
+        self._flusher = threading.Thread(target=self._flush_loop, name="storage-flush", daemon=True)
+        self._flusher.start()
+        atexit.register(self.close)
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.directory, name)
+
+    # Recovery
+
+    def _recover(self):
+        started = time.perf_counter()
+        count = 0
+
+        snapshot_path = self._path(SNAPSHOT_FILE)
+        if os.path.exists(snapshot_path) and os.path.getsize(snapshot_path) > len(_SNAPSHOT_MAGIC):
+            with open(snapshot_path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                if mapped[:len(_SNAPSHOT_MAGIC)] != _SNAPSHOT_MAGIC:
+                    raise ValueError(f"Not a FinPilot snapshot: {snapshot_path}")
+                for _, namespace, key, value, _ in read_records(mapped, len(_SNAPSHOT_MAGIC), verify=False):
+                    self._recovered.setdefault(namespace, {})[key] = value
+                    count += 1
+
+        # A rotated log exists only if the process stopped mid-compaction; replaying it is idempotent
+        for name in (ROTATED_LOG_FILE, LOG_FILE):
+            count += self._replay(self._path(name))
+
+        self.stats["recovered_records"] = count
+        self.stats["recovery_seconds"] = round(time.perf_counter() - started, 3)
+        if count:
+            print(f"✅ Recovered {count} storage records from {self.directory} in {self.stats['recovery_seconds']}s")
+
+    def _replay(self, path: str) -> int:
+        if not os.path.exists(path) or os.path.getsize(path) == 0:
+            return 0
+        count = 0
+        valid_end = 0
+        with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            size = len(mapped)
+            for op, namespace, key, value, end in read_records(mapped, 0, verify=True):
+                entries = self._recovered.setdefault(namespace, {})
+                if op == OP_SET:
+                    entries[key] = value
+                else:
+                    entries.pop(key, None)
+                valid_end = end
+                count += 1
+        if valid_end < size and not self.read_only:
+            print(f"⚠️ Truncating torn tail of {path} at byte {valid_end}")
+            os.truncate(path, valid_end)
+        return count
+
+    # Write path
+
+    def attach(self, namespace: str, encode: Callable, decode: Callable) -> "LoggedStore":
+        with self.lock:
+            if namespace not in self.stores:
+                raw = self._recovered.pop(namespace, {})
+                data = {key: decode(value) for key, value in raw.items()}
+                self.stores[namespace] = LoggedStore(self, namespace, encode, data)
+            return self.stores[namespace]
+
+    def append(self, op: int, namespace: str, key: str, value: bytes = b""):
+        """Buffered append; caller holds the lock"""
+        if self._file is None:
+            raise RuntimeError(f"Storage at {self.directory} is opened read-only")
+        record = encode_record(op, namespace.encode(), key.encode(), value)
+        self._file.write(record)
+        self._log_bytes += len(record)
+        self.stats["appends"] += 1
+
+    def _flush_loop(self):
+        while not self._stop.wait(self.flush_interval):
+            try:
+                self.flush()
+                due = time.monotonic() - self._last_compaction >= self.compact_interval
+                if self._log_bytes >= self.compact_bytes or (due and self._log_bytes):
+                    self.compact()
+            except Exception as e:
+                print(f"❌ Storage flush failed: {e}")
+
+    def flush(self):
+        with self.lock:
+            if self._file is None or self._file.closed:
+                return
+            self._file.flush()
+            if self.fsync:
+                os.fsync(self._file.fileno())
+
+    # Compaction
+
+    def compact(self):
+        """Rotate the log, then write a snapshot of the state at the rotation point"""
+        with self.lock:
+            if self._compacting or self._file is None or self._file.closed:
+                return
+            self._compacting = True
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            self._file.close()
+            os.replace(self._path(LOG_FILE), self._path(ROTATED_LOG_FILE))
+            self._file = open(self._path(LOG_FILE), "ab", buffering=1024 * 1024)
+            self._log_bytes = 0
+            # Shallow copies are enough: values are replaced, never mutated, through the log
+            state = [(store, dict(store._data)) for store in self.stores.values()]
+            leftover = {namespace: dict(entries) for namespace, entries in self._recovered.items()}
+
+        try:
+            self._write_snapshot(state, leftover)
+        finally:
+            self._last_compaction = time.monotonic()
+            self._compacting = False
+
+    def _write_snapshot(self, state: List[Tuple["LoggedStore", Dict]], leftover: Dict[str, Dict[str, bytes]]):
+        """Atomically replace the snapshot, then drop the rotated log it supersedes"""
+        tmp_path = self._path(SNAPSHOT_FILE + ".tmp")
+        with open(tmp_path, "wb", buffering=1024 * 1024) as f:
+            f.write(_SNAPSHOT_MAGIC)
+            for store, data in state:
+                namespace = store.namespace.encode()
+                for key, value in data.items():
+                    f.write(encode_record(OP_SET, namespace, key.encode(), store._encode(value)))
+            for name, entries in leftover.items():
+                for key, value in entries.items():
+                    f.write(encode_record(OP_SET, name.encode(), key.encode(), value))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self._path(SNAPSHOT_FILE))
+        if os.path.exists(self._path(ROTATED_LOG_FILE)):
+            os.remove(self._path(ROTATED_LOG_FILE))
+        self.stats["compactions"] += 1
+        print(f"✅ Storage compacted into {self._path(SNAPSHOT_FILE)}")
+
+    def close(self):
+        self._stop.set()
+        self.flush()
+        with self.lock:
+            if self._file is not None and not self._file.closed:
+                self._file.close()
+
+    def get_metrics(self) -> Dict:
+        return {
+            **self.stats,
+            "log_bytes": self._log_bytes,
+            "namespaces": {namespace: len(store) for namespace, store in self.stores.items()}
+        }
+
+
+class LoggedStore(MutableMapping):
+    """In-memory namespace whose mutations are appended to a SnapshotLog"""
+
+    def __init__(self, log: SnapshotLog, namespace: str, encode: Callable, data: Dict):
+        self.log = log
+        self.namespace = namespace
+        self._encode = encode
+        self._data = data
+
+    def __getitem__(self, key: str):
+        return self._data[key]
+
+    def __setitem__(self, key: str, value):
+        encoded = self._encode(value)
+        with self.log.lock:
+            self.log.append(OP_SET, self.namespace, key, encoded)
+            self._data[key] = value
+
+    def update(self, other=(), **kwargs):
+        """Bulk set: encode outside the lock, then append every record in one go"""
+        items = dict(other, **kwargs)
+        encoded = [(key, self._encode(value)) for key, value in items.items()]
+        with self.log.lock:
+            for key, value in encoded:
+                self.log.append(OP_SET, self.namespace, key, value)
+            self._data.update(items)
+
+    def __delitem__(self, key: str):
+        with self.log.lock:
+            del self._data[key]
+            self.log.append(OP_DELETE, self.namespace, key)
+
+    def __contains__(self, key) -> bool:
+        return key in self._data
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(list(self._data))
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+_logs: Dict[str, SnapshotLog] = {}
+_logs_lock = threading.Lock()
+
+
+def open_logged_store(directory: str, namespace: str, encode: Callable, decode: Callable) -> LoggedStore:
+    """Namespace backed by the snapshot log in directory (opened and recovered once per process)"""
+    with _logs_lock:
+        if directory not in _logs:
+            _logs[directory] = SnapshotLog(directory)
+        log = _logs[directory]
+    return log.attach(namespace, encode, decode)
+
+
+def get_log_metrics() -> Dict:
+    return {directory: log.get_metrics() for directory, log in _logs.items()}
@@ -0,0 +1,225 @@
+"""
+Storage backends for profiles, sessions and plans, plus collision-free ID generation
+
+The memory backend keeps the original single-process dicts. The log backend keeps
+the same dicts but makes them durable with an append-only mutation log and
+snapshots (see snapshot_log). The SQLite backend stores every namespace in one
+WAL-mode database file so several uvicorn workers can share state on one host.
+"""
+
+import os
+import sqlite3
+import threading
+import time
+from collections.abc import MutableMapping
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, Optional, Tuple
+
+import orjson
+from dotenv import load_dotenv
+
+load_dotenv()
+
+_CROCKFORD_BASE32 = "0123456789ABCDEFGHJKMNPQRSTVWXYZ"
+_RANDOM_BITS = 80
+
+
+class ULIDGenerator:
+    """Monotonic ULIDs: 48-bit millisecond timestamp + 80 random bits.
+
+    No coordination between workers is needed; within a process, IDs created in
+    the same millisecond increment the random part so they still sort in order.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._last_ms = -1
+        self._last_random = 0
+
+    def new(self) -> str:
+        with self._lock:
+            ms = time.time_ns() // 1_000_000
+            if ms <= self._last_ms:
+                ms = self._last_ms
+                random_part = self._last_random + 1
+                if random_part >= 1 << _RANDOM_BITS:
+                    ms += 1
+                    random_part = int.from_bytes(os.urandom(10), "big")
+            else:
+                random_part = int.from_bytes(os.urandom(10), "big")
+            self._last_ms = ms
+            self._last_random = random_part
+
+        value = (ms << _RANDOM_BITS) | random_part
+        chars = []
+        for _ in range(26):
+            chars.append(_CROCKFORD_BASE32[value & 31])
+            value >>= 5
+        return "".join(reversed(chars))
+
+
+_ulid_generator = ULIDGenerator()
+
+
+def new_id(prefix: str) -> str:
+    """Create a unique, time-ordered ID such as profile_01HF3Q..."""
+    return f"{prefix}_{_ulid_generator.new()}"
+
+
+class SQLiteStore(MutableMapping):
+    """Dict-like namespace in a shared SQLite database (WAL mode, safe across processes)"""
+
+    _connections: Dict[str, Tuple[sqlite3.Connection, threading.RLock]] = {}
+
+    def __init__(self, path: str, namespace: str, encode: Callable, decode: Callable):
+        self.path = path
+        self.namespace = namespace
+        self._encode = encode
+        self._decode = decode
+        self._conn, self._lock = self._connect(path)
+
+    @classmethod
+    def _connect(cls, path: str) -> Tuple[sqlite3.Connection, threading.RLock]:
+        """One connection per database file per process, shared by all namespaces"""
+        if path not in cls._connections:
+            conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS kv ("
+                "namespace TEXT NOT NULL, key TEXT NOT NULL, value BLOB NOT NULL, "
+                "PRIMARY KEY (namespace, key))"
+            )
+            cls._connections[path] = (conn, threading.RLock())
+        return cls._connections[path]
+
+    def __getitem__(self, key: str):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value FROM kv WHERE namespace = ? AND key = ?", (self.namespace, key)
+            ).fetchone()
+        if row is None:
+            raise KeyError(key)
+        return self._decode(row[0])
+
+    def __setitem__(self, key: str, value):
+        encoded = self._encode(value)
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO kv (namespace, key, value) VALUES (?, ?, ?)",
+                (self.namespace, key, encoded)
+            )
+
+    def __delitem__(self, key: str):
+        with self._lock:
+            cursor = self._conn.execute(
+                "DELETE FROM kv WHERE namespace = ? AND key = ?", (self.namespace, key)
+            )
+        if cursor.rowcount == 0:
+            raise KeyError(key)
+
+    def __contains__(self, key) -> bool:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT 1 FROM kv WHERE namespace = ? AND key = ?", (self.namespace, key)
+            ).fetchone()
+        return row is not None
+
+    def __iter__(self) -> Iterator[str]:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT key FROM kv WHERE namespace = ? ORDER BY key", (self.namespace,)
+            ).fetchall()
+        return iter([row[0] for row in rows])
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute(
+                "SELECT COUNT(*) FROM kv WHERE namespace = ?", (self.namespace,)
+            ).fetchone()[0]
+
+    @contextmanager
+    def transaction(self):
+        """Run several reads and writes, on any namespace of this database, as one write transaction"""
+        with self._lock:
+            if self._conn.in_transaction:
+                yield
+                return
+            # IMMEDIATE takes the write lock up front, so read-modify-write sequences from other processes serialize
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def update(self, other=(), **kwargs):
+        """Bulk upsert in a single transaction"""
+        rows = [
+            (self.namespace, key, self._encode(value))
+            for key, value in dict(other, **kwargs).items()
+        ]
+        with self._lock:
+            if self._conn.in_transaction:
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO kv (namespace, key, value) VALUES (?, ?, ?)", rows
+                )
+                return
+            self._conn.execute("BEGIN")
+            try:
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO kv (namespace, key, value) VALUES (?, ?, ?)", rows
+                )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def items(self):
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT key, value FROM kv WHERE namespace = ? ORDER BY key", (self.namespace,)
+            ).fetchall()
+        return [(key, self._decode(value)) for key, value in rows]
+
+    def values(self):
+        return [value for _, value in self.items()]
+
+
+def _identity(value):
+    return value
+
+
+def create_store(
+    namespace: str,
+    raw_bytes: bool = False,
+    encode: Optional[Callable] = None,
+    decode: Optional[Callable] = None
+) -> MutableMapping:
+    """Create the store for a namespace using the configured STORAGE_BACKEND.
+
+    raw_bytes stores values that are already encoded (e.g. pre-serialized plans)
+    as-is; encode/decode convert custom records to and from bytes; other values
+    are JSON documents.
+    """
+    backend = os.getenv("STORAGE_BACKEND", "memory").lower()
+    if backend == "memory":
+        return {}
+    if backend == "log":
+        from snapshot_log import open_logged_store
+        # A database file name (e.g. finpilot_state.db) maps to a directory named after its stem
+        directory = os.path.splitext(os.getenv("STORAGE_PATH", "finpilot_state"))[0]
+        if raw_bytes:
+            return open_logged_store(directory, namespace, _identity, bytes)
+        if encode and decode:
+            return open_logged_store(directory, namespace, encode, decode)
+        return open_logged_store(directory, namespace, orjson.dumps, orjson.loads)
+    if backend == "sqlite":
+        path = os.getenv("STORAGE_PATH", "finpilot_state.db")
+        if raw_bytes:
+            return SQLiteStore(path, namespace, _identity, bytes)
+        if encode and decode:
+            return SQLiteStore(path, namespace, encode, decode)
+        return SQLiteStore(path, namespace, orjson.dumps, orjson.loads)
+    raise ValueError(f"Unknown STORAGE_BACKEND: {backend}")
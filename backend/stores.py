@@ -0,0 +1,27 @@
+"""
+Application stores for profiles, sessions and plans
+
+Shared by the API and offline tools (exports, batch jobs) so both open the
+configured storage backend the same way.
+"""
+
+from typing import Dict, MutableMapping
+
+import orjson
+
+from conversation_log import create_session_store
+from plan_versions import create_plan_store
+from profile_record import ProfileRecord
+from storage import create_store
+
+# Storage (in-memory by default; STORAGE_BACKEND=sqlite shares state across workers)
+profiles_storage: MutableMapping[str, ProfileRecord] = create_store(
+    "profiles",
+    encode=lambda record: orjson.dumps(record.to_dict()),
+    decode=lambda data: ProfileRecord.from_dict(orjson.loads(data))
+)
+# Each conversation's messages are stored once; session records are rebuilt from per-turn deltas
+sessions_storage: MutableMapping[str, Dict] = create_session_store()
+# Plans are immutable once created, so each record is served pre-serialized as JSON bytes;
+# by default they are kept as versions sharing unchanged pieces with their parent plan
+plans_storage: MutableMapping[str, bytes] = create_plan_store()
@@ -50,6 +50,7 @@ export default function FinPilotOnboarding() {
   const chatContainerRef = useRef<HTMLDivElement>(null)
   const abortControllerRef = useRef<AbortController | null>(null)
   const requestIdRef = useRef<string | null>(null)
+  const conversationIdRef = useRef<string | null>(null)
   const isRequestPendingRef = useRef(false)
   const saveControllerRef = useRef<AbortController | null>(null)
   const optionTimeoutRef = useRef<NodeJS.Timeout | null>(null)
@@ -126,6 +127,7 @@ export default function FinPilotOnboarding() {
           chatHistory: updatedChatHistory || chatHistory,
           answers: updatedAnswers || answers,
           requestId: requestId, // Add request ID for backend tracking
+          conversationId: conversationIdRef.current, // Lets the backend append to the stored conversation
         }),
         signal: abortControllerRef.current.signal,
       })
@@ -144,6 +146,9 @@ export default function FinPilotOnboarding() {
       
       // Double-check request is still current before updating state
       if (requestIdRef.current === requestId) {
+        if (data.conversationId) {
+          conversationIdRef.current = data.conversationId
+        }
         // Simulate typing delay
         setTimeout(() => {
           // Final check before state update